@@ -0,0 +1,153 @@
+import json
+from pathlib import Path
+import faiss
+import numpy as np
+
+# 📁 Index type and build/search parameters, stored next to index.faiss
+INDEX_PARAMS_FILE = "index_params.json"
+
+INDEX_TYPES = ("flat", "sq8", "fp16", "ivf_flat", "ivf_pq", "hnsw")
+
+# 🗜️ Types that store lossy codes; searches re-score their top candidates against full-precision vectors
+QUANTIZED_TYPES = ("sq8", "fp16", "ivf_pq")
+
+# ⚙️ Defaults
+DEFAULT_NPROBE = 16            # IVF lists visited per query
+DEFAULT_HNSW_M = 32            # HNSW graph degree
+DEFAULT_EF_CONSTRUCTION = 80
+DEFAULT_EF_SEARCH = 64         # HNSW candidate list size per query
+DEFAULT_PQ_M = 48              # PQ sub-quantizers (must divide the embedding dimension)
+DEFAULT_PQ_BITS = 8
+DEFAULT_TRAIN_SIZE = 20000     # vectors sampled for IVF / PQ / SQ training
+RESCORE_FACTOR = 4             # quantized candidates fetched (and re-scored exactly) per requested result
+MIN_POINTS_PER_LIST = 39       # FAISS warns below this many training points per centroid
+
+
+def default_nlist(n_train: int) -> int:
+    """~4·sqrt(n) inverted lists, capped by what the training sample can support."""
+    return max(1, min(int(4 * np.sqrt(n_train)), n_train // MIN_POINTS_PER_LIST))
+
+
+def fit_pq_bits(pq_bits: int, n_train: int) -> int:
+    """Bits per PQ code the training sample can support: PQ training needs 2**bits points per sub-quantizer."""
+    if n_train <= 0 or n_train >= 2 ** pq_bits:
+        return pq_bits
+    return max(1, int(np.log2(n_train)))
+
+
+def needs_training(index_type: str) -> bool:
+    return index_type in ("sq8", "ivf_flat", "ivf_pq")
+
+
+def is_quantized(index_type: str) -> bool:
+    return index_type in QUANTIZED_TYPES
+
+
+def supports_delete(index_type: str) -> bool:
+    """Whether LangChain's FAISS.delete works on this index type.
+
+    LangChain renumbers the remaining vectors 0..n-1 after a delete, which only matches
+    indexes that compact on remove_ids. IVF keeps the old ids and HNSW cannot remove at all.
+    """
+    return index_type in ("flat", "sq8", "fp16")
+
+
+def make_index(index_type: str, dim: int, n_train: int = 0, nlist: int = None, pq_m: int = DEFAULT_PQ_M,
+               pq_bits: int = DEFAULT_PQ_BITS, hnsw_m: int = DEFAULT_HNSW_M,
+               ef_construction: int = DEFAULT_EF_CONSTRUCTION, **_):
+    """Create an empty (untrained) L2 index of the requested type."""
+    if index_type == "flat":
+        return faiss.IndexFlatL2(dim)
+    if index_type == "sq8":
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit)
+    if index_type == "fp16":
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16)
+    if index_type == "ivf_flat":
+        return faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, nlist or default_nlist(n_train))
+    if index_type == "ivf_pq":
+        if dim % pq_m:
+            raise ValueError(f"pq_m={pq_m} must divide the embedding dimension {dim}")
+        fitted_bits = fit_pq_bits(pq_bits, n_train)
+        if fitted_bits != pq_bits:
+            print(f"⚠️ Only {n_train} training vectors: using {fitted_bits}-bit PQ codes instead of {pq_bits}-bit")
+            pq_bits = fitted_bits
+        return faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, nlist or default_nlist(n_train), pq_m, pq_bits)
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m)
+        index.hnsw.efConstruction = ef_construction
+        return index
+    raise ValueError(f"Unknown index type: {index_type} (expected one of {', '.join(INDEX_TYPES)})")
+
+
+def train_index(index, vectors: np.ndarray, train_size: int = DEFAULT_TRAIN_SIZE, seed: int = 0):
+    """Train IVF / PQ / SQ indexes on a random sample of `vectors`; no-op for other index types."""
+    if index.is_trained:
+        return index
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    if len(vectors) > train_size:
+        rng = np.random.default_rng(seed)
+        vectors = vectors[rng.choice(len(vectors), train_size, replace=False)]
+    index.train(vectors)
+    return index
+
+
+def build_index(index_type: str, vectors: np.ndarray, **params):
+    """Create, train and fill an index in one go, with the query-time defaults applied."""
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    index = make_index(index_type, vectors.shape[1], n_train=min(len(vectors), params.get("train_size", DEFAULT_TRAIN_SIZE)), **params)
+    train_index(index, vectors, params.get("train_size", DEFAULT_TRAIN_SIZE))
+    index.add(vectors)
+    apply_index_defaults(index, params.get("nprobe", DEFAULT_NPROBE), params.get("ef_search", DEFAULT_EF_SEARCH))
+    return index
+
+
+def _ivf(index):
+    try:
+        return faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return None
+
+
+def apply_index_defaults(index, nprobe: int = None, ef_search: int = None):
+    """Set the default query-time knobs stored on the index itself."""
+    ivf = _ivf(index)
+    if ivf is not None and nprobe:
+        ivf.nprobe = nprobe
+    if isinstance(index, faiss.IndexHNSW) and ef_search:
+        index.hnsw.efSearch = ef_search
+    return index
+
+
+def search_parameters(index, nprobe: int = None, ef_search: int = None, selector=None):
+    """Per-query FAISS search parameters, so knobs can differ between concurrent queries.
+
+    Returns None when nothing needs overriding and the index defaults apply.
+    """
+    if nprobe is None and ef_search is None and selector is None:
+        return None
+    ivf = _ivf(index)
+    if ivf is not None:
+        params = faiss.SearchParametersIVF()
+        params.nprobe = nprobe or ivf.nprobe
+    elif isinstance(index, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = ef_search or index.hnsw.efSearch
+    else:
+        params = faiss.SearchParameters()
+    if selector is not None:
+        params.sel = selector
+    return params
+
+
+def save_index_params(index_path, params: dict):
+    with open(Path(index_path) / INDEX_PARAMS_FILE, "w", encoding="utf-8") as f:
+        json.dump(params, f, indent=2)
+
+
+def load_index_params(index_path) -> dict:
+    """Parameters an index was built with; indexes built before this file existed are flat."""
+    path = Path(index_path) / INDEX_PARAMS_FILE
+    if not path.exists():
+        return {"index_type": "flat"}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,157 @@
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+import numpy as np
+
+# 📁 Default location of the persistent answer cache
+ANSWER_CACHE_PATH = Path(r"C:Navigate Labs\rag_mnc_insights\data\outputs\answer_cache.sqlite")
+
+DEFAULT_TTL = 7 * 24 * 3600       # seconds an answer stays valid
+DEFAULT_MAX_ENTRIES = 5000        # least recently used answers are evicted beyond this
+SIMILARITY_THRESHOLD = 0.95       # cosine similarity for a paraphrase to count as a hit
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    question = re.sub(r"\s+", " ", question.lower()).strip()
+    return question.rstrip("?.! ")
+
+
+def doc_key(doc) -> str:
+    """Id of a retrieved chunk's content: its chunk_id plus a hash of its text.
+
+    Incremental rebuilds reuse the chunk ids of a changed transcript, so the text hash is what
+    keeps answers generated from the old text from being served for the new one.
+    """
+    content_hash = hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()[:16]
+    chunk_id = doc.metadata.get("chunk_id")
+    return f"{chunk_id}@{content_hash}" if chunk_id else content_hash
+
+
+def _digest(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, default=str).encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """SQLite-backed cache of LLM answers keyed by question, filters and retrieved chunks.
+
+    Exact hits match the normalized question. When a question vector is supplied, earlier
+    questions asked with the same filters and the same retrieved chunks are also compared by
+    cosine similarity so paraphrases can be served from cache.
+    """
+
+    def __init__(self, path=ANSWER_CACHE_PATH, ttl: float = DEFAULT_TTL, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 similarity_threshold: float = SIMILARITY_THRESHOLD, namespace: str = ""):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.namespace = namespace
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS answers (
+                    key TEXT PRIMARY KEY,
+                    context_key TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    embedding BLOB,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS answers_context ON answers (context_key);
+                CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used);
+            """)
+        return self._conn
+
+    def _keys(self, question, filters, chunk_ids):
+        context_key = _digest(self.namespace, [f or "" for f in filters], list(chunk_ids))
+        return _digest(context_key, normalize_question(question)), context_key
+
+    def get(self, question: str, filters, chunk_ids, question_vector=None):
+        """Return a cached answer or None."""
+        key, context_key = self._keys(question, filters, chunk_ids)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT key FROM answers WHERE key = ? AND created_at > ?", (key, now - self.ttl)
+            ).fetchone()
+            semantic = False
+            if row is None and question_vector is not None:
+                row = self._nearest(conn, context_key, question_vector, now)
+                semantic = row is not None
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE answers SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, row[0]))
+            conn.commit()
+            answer = conn.execute("SELECT answer FROM answers WHERE key = ?", (row[0],)).fetchone()[0]
+            self.hits += 1
+            self.semantic_hits += int(semantic)
+            return answer
+
+    def _nearest(self, conn, context_key, question_vector, now):
+        rows = conn.execute(
+            "SELECT key, embedding FROM answers WHERE context_key = ? AND embedding IS NOT NULL AND created_at > ?",
+            (context_key, now - self.ttl)
+        ).fetchall()
+        if not rows:
+            return None
+        query = np.asarray(question_vector, dtype="float32")
+        matrix = np.vstack([np.frombuffer(blob, dtype="float32") for _, blob in rows])
+        sims = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-12)
+        best = int(np.argmax(sims))
+        return rows[best] if sims[best] >= self.similarity_threshold else None
+
+    def put(self, question: str, filters, chunk_ids, answer: str, question_vector=None):
+        key, context_key = self._keys(question, filters, chunk_ids)
+        blob = np.asarray(question_vector, dtype="float32").tobytes() if question_vector is not None else None
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO answers (key, context_key, question, answer, embedding, created_at, last_used, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                (key, context_key, question, answer, blob, now, now)
+            )
+            self._evict(conn, now)
+            conn.commit()
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM answers WHERE created_at <= ?", (now - self.ttl,))
+        conn.execute(
+            "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM answers")
+            conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._connect().execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+        }
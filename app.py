@@ -1,6 +1,10 @@
 import streamlit as st
 from pathlib import Path
-from rag_pipeline_gemini import rag_query
+from rag_pipeline_gemini import rag_query, answer_cache, prewarm
+from index_registry import reload_index
+from embedding_pipeline import get_query_embedder
+from instrumentation import tracer
+from scoring import EvaluationHistory, EVAL_HISTORY_DIR
 from fpdf import FPDF
 import pandas as pd
 import unicodedata
@@ -16,6 +20,24 @@ def safe_text(text):
 INDEX_PATH = Path(r"C:\22ad053\Navigate Labs\rag_mnc_insights\data\outputs\mnc_faiss_index")
 
 st.set_page_config(page_title="RAG MNC Insights", layout="wide")
+
+
+@st.cache_resource(show_spinner=False)
+def start_prewarm(index_path: str):
+    """Load the index and models on a background thread, once per server process.
+
+    The page renders straight away; a question asked before warm-up finishes simply waits
+    for the loads already in progress instead of starting its own.
+    """
+    return prewarm(index_path, background=True, verbose=False)
+
+
+@st.cache_resource(show_spinner=False)
+def get_evaluation_history():
+    return EvaluationHistory(EVAL_HISTORY_DIR)
+
+
+start_prewarm(str(INDEX_PATH))
 st.title("🔍 MNC Insights Assistant - RAG Powered by Gemini")
 
 st.markdown("""
@@ -41,40 +63,43 @@ if st.button("Get Answer") and user_question:
             streamlit_mode=True,
             company=company,
             year=year,
-            quarter=quarter
+            quarter=quarter,
+            stream=True
         )
 
-        st.success("Answer retrieved!")
-
-        st.markdown("## 📌 Answer")
-        st.write(result["answer"])
-
-        st.markdown("## 📄 Sources")
-        for src in result["sources"]:
-            st.markdown(f"- {src}")
-
-       # PDF Download
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_font("Arial", size=12)
-        pdf.multi_cell(0, 10, safe_text(f"Question: {user_question}"))
-        pdf.ln()
-
-        pdf.set_font("Arial", "B", 12)
-        pdf.cell(0, 10, safe_text("Answer:"), ln=True)
-        pdf.set_font("Arial", size=12)
-        pdf.multi_cell(0, 10, safe_text(result["answer"]))
-
-        pdf.ln()
-        pdf.set_font("Arial", "B", 12)
-        pdf.cell(0, 10, safe_text("Sources:"), ln=True)
-        for src in result["sources"]:
-            pdf.cell(0, 10, safe_text(f"- {src}"), ln=True)
-
-        pdf_path = "rag_answer.pdf"
-        pdf.output(pdf_path)
-        with open(pdf_path, "rb") as f:
-            st.download_button("⬇️ Download Answer as PDF", f, file_name="RAG_Answer.pdf")
+    st.markdown("## 📌 Answer")
+    # Fragments are rendered as Gemini produces them; the full text comes back once the stream ends
+    answer = st.write_stream(result["answer_stream"])
+    if not isinstance(answer, str):
+        answer = "".join(str(part) for part in answer)
+    st.success("Answer retrieved from cache!" if result.get("cached") else "Answer retrieved!")
+
+    st.markdown("## 📄 Sources")
+    for src in result["sources"]:
+        st.markdown(f"- {src}")
+
+    # PDF Download
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", size=12)
+    pdf.multi_cell(0, 10, safe_text(f"Question: {user_question}"))
+    pdf.ln()
+
+    pdf.set_font("Arial", "B", 12)
+    pdf.cell(0, 10, safe_text("Answer:"), ln=True)
+    pdf.set_font("Arial", size=12)
+    pdf.multi_cell(0, 10, safe_text(answer))
+
+    pdf.ln()
+    pdf.set_font("Arial", "B", 12)
+    pdf.cell(0, 10, safe_text("Sources:"), ln=True)
+    for src in result["sources"]:
+        pdf.cell(0, 10, safe_text(f"- {src}"), ln=True)
+
+    pdf_path = "rag_answer.pdf"
+    pdf.output(pdf_path)
+    with open(pdf_path, "rb") as f:
+        st.download_button("⬇️ Download Answer as PDF", f, file_name="RAG_Answer.pdf")
 
 
 # --- Evaluation Section ---
@@ -82,12 +107,48 @@ with st.sidebar:
     st.markdown("---")
     st.subheader("📊 Evaluation Dashboard")
     show_eval = st.checkbox("Show Evaluation Metrics")
+    st.markdown("---")
+    if st.button("🔄 Reload FAISS Index"):
+        reload_index(INDEX_PATH)
+        st.success("Index reloaded.")
+
+    st.markdown("---")
+    st.subheader("⚡ Answer Cache")
+    cache_stats = answer_cache.stats()
+    st.caption(
+        f"Hits: {cache_stats['hits']} (paraphrase: {cache_stats['semantic_hits']}) · "
+        f"Misses: {cache_stats['misses']} · Entries: {cache_stats['entries']}"
+    )
+    if st.button("🧹 Clear Answer Cache"):
+        answer_cache.clear()
+        st.success("Answer cache cleared.")
+
+    st.markdown("---")
+    st.subheader("⏱️ Latency")
+    stages = tracer.metrics.summary()
+    if stages:
+        st.dataframe(
+            pd.DataFrame.from_dict(stages, orient="index")[["count", "p50_ms", "p95_ms"]].round(1),
+            use_container_width=True,
+        )
+        query_stats = get_query_embedder().stats()
+        st.caption(f"Query embedding cache hit rate: {query_stats['hit_rate']:.0%}")
+        last = tracer.recent_traces(1)
+        if last:
+            with st.expander(f"Last trace: {last[0].name} ({last[0].duration_ms:.0f} ms)"):
+                for depth, stage in last[0].walk():
+                    st.text(f"{'  ' * depth}{stage.name}: {stage.duration_ms:.1f} ms")
+    else:
+        st.caption("No queries timed yet.")
 
 if show_eval:
     st.header("📊 RAG System Evaluation")
-    try:
-        df = pd.read_csv("evaluation_results.csv")
-
+    # Cached summaries, only re-read for runs recorded since the last rerun
+    evaluation = get_evaluation_history().refresh()
+    df = evaluation.run()
+    if df.empty:
+        st.error("❌ No evaluation runs recorded yet. Please run the evaluator first.")
+    else:
         st.subheader("✅ Keyword Match (%)")
         st.bar_chart(df["keywords_matched"] * 100)
 
@@ -97,5 +158,6 @@ if show_eval:
         st.subheader("📋 Raw Results")
         st.dataframe(df[["question", "keywords_matched", "text_similarity"]])
 
-    except FileNotFoundError:
-        st.error("❌ evaluation_results.csv not found. Please run the evaluator first.")
+        if len(evaluation) > 1:
+            st.subheader("🕓 Scores Across Runs")
+            st.line_chart(evaluation.summaries().set_index("run_at")[["keywords_matched", "text_similarity"]])
@@ -0,0 +1,129 @@
+import asyncio
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from langchain.memory import ConversationBufferMemory
+import rag_pipeline_gemini as pipeline
+from rate_limit import AsyncRateLimiter
+from instrumentation import span
+
+# ⚙️ Limits for the shared Gemini client
+LLM_CONCURRENCY = 8                # Gemini calls in flight at once
+LLM_REQUESTS_PER_MINUTE = 120      # sustained request rate
+RETRIEVAL_WORKERS = 4              # threads running embedding + FAISS search
+
+MAX_SESSIONS = 1000
+
+
+class SessionStore:
+    """Per-session conversation memory, so concurrent analysts never share chat history.
+
+    The least recently used sessions are dropped once more than `max_sessions` are open.
+    Each session also gets a lock from `lock_factory` (asyncio here, threading.Lock for threaded servers).
+    """
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, lock_factory=asyncio.Lock):
+        self.max_sessions = max_sessions
+        self.lock_factory = lock_factory
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> ConversationBufferMemory:
+        return self._entry(session_id)["memory"]
+
+    def lock(self, session_id: str):
+        """Lock serializing the turns of one session (its history is read and written per turn)."""
+        return self._entry(session_id)["lock"]
+
+    def _entry(self, session_id: str) -> dict:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = {"memory": ConversationBufferMemory(return_messages=True), "lock": self.lock_factory()}
+                self._sessions[session_id] = entry
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+            return entry
+
+    def reset(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+sessions = SessionStore()
+llm_limiter = AsyncRateLimiter(LLM_REQUESTS_PER_MINUTE / 60, burst=LLM_CONCURRENCY, concurrency=LLM_CONCURRENCY)
+retrieval_pool = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+
+
+def _run_in_pool(loop, func, *args, **kwargs):
+    """Run `func` on the retrieval pool inside a copy of the caller's context, so its spans nest."""
+    context = contextvars.copy_context()
+    return loop.run_in_executor(retrieval_pool, partial(context.run, func, *args, **kwargs))
+
+
+async def ask_gemini_async(context: str, user_question: str, conversation) -> str:
+    """Async counterpart of ask_gemini, throttled by the shared LLM limiter."""
+    prompt = pipeline.build_prompt(context, conversation, user_question)
+
+    async with llm_limiter:
+        with span("gemini", model=pipeline.MODEL_NAME) as llm_span:
+            response = await pipeline.get_llm().generate_content_async(prompt)
+            answer = response.text.strip()
+    usage = {}
+    pipeline.record_usage(response, usage)
+    llm_span.set(**usage)
+
+    conversation.chat_memory.add_user_message(user_question)
+    conversation.chat_memory.add_ai_message(answer)
+    return answer
+
+
+async def rag_query_async(index_path, user_question, session_id: str = "default", company=None, year=None,
+                          quarter=None, use_cache=True, use_metrics=True):
+    """Answer a question without blocking the event loop.
+
+    Retrieval, the figures lookup and the answer cache (pipeline.prepare_answer) run in a
+    thread pool, the Gemini call goes through the async client, and each `session_id` gets
+    its own conversation memory.
+    """
+    with span("rag_query_async", session=session_id) as trace:
+        loop = asyncio.get_running_loop()
+        prepared = await _run_in_pool(loop, pipeline.prepare_answer, index_path, user_question, company, year,
+                                      quarter, use_cache=use_cache, use_metrics=use_metrics)
+        answer = prepared["answer"]
+        trace.set(cached=prepared["cached"], numeric=prepared["numeric"], docs=len(prepared["docs"]),
+                  facts=len(prepared["facts"]))
+
+        conversation = sessions.get(session_id)
+        async with sessions.lock(session_id):
+            if answer is not None:
+                conversation.chat_memory.add_user_message(user_question)
+                conversation.chat_memory.add_ai_message(answer)
+            else:
+                answer = await ask_gemini_async(prepared["context"], user_question, conversation)
+
+        if prepared["answer"] is None:
+            await _run_in_pool(loop, pipeline.store_answer, user_question, prepared, answer)
+
+    return {
+        "answer": answer,
+        "sources": prepared["sources"],
+        "cached": prepared["cached"],
+        "numeric": prepared["numeric"],
+        "session_id": session_id,
+    }
+
+async def answer_many(index_path, questions, session_id: str = None):
+    """Answer several questions concurrently; each gets its own session unless one is given."""
+    tasks = [
+        rag_query_async(index_path, question, session_id=session_id or f"batch-{i}")
+        for i, question in enumerate(questions)
+    ]
+    return await asyncio.gather(*tasks)
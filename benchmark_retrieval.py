@@ -0,0 +1,280 @@
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+from pathlib import Path
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from ann_index import INDEX_TYPES, DEFAULT_NPROBE, DEFAULT_EF_SEARCH, DEFAULT_PQ_M, RESCORE_FACTOR, build_index, is_quantized
+from vector_search import rescore
+
+# ⚙️ Benchmark defaults
+DEFAULT_K = 10
+REPORT_KS = (1, 5, 10)
+DEFAULT_CHUNK_SIZES = (300, 500, 800)
+DEFAULT_INDEX_TYPES = INDEX_TYPES
+
+# 🏢 Vocabulary for the synthetic earnings-call corpus
+COMPANIES = {
+    "Microsoft": "MSFT", "Apple": "AAPL", "Amazon": "AMZN", "Alphabet": "GOOGL",
+    "Nvidia": "NVDA", "Intel": "INTC", "Cisco": "CSCO", "Micron": "MU",
+}
+SEGMENTS = [
+    "cloud", "services", "advertising", "data center", "gaming", "devices",
+    "enterprise", "automotive", "subscriptions", "networking", "memory", "search",
+]
+METRICS = ["revenue", "operating income", "gross margin"]
+MONTHS = {"Q1": "Jan", "Q2": "Apr", "Q3": "Jul", "Q4": "Oct"}
+FILLER = [
+    "We continue to invest in {topic} to drive long-term growth.",
+    "Our teams executed well across {topic} despite a challenging macro environment.",
+    "Customer demand for {topic} remained healthy throughout the quarter.",
+    "We saw encouraging early signals from our {topic} initiatives.",
+    "Supply constraints in {topic} eased compared with the prior period.",
+    "Looking ahead, we expect {topic} to remain a priority for capital allocation.",
+]
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic bag-of-words embeddings via feature hashing — no model download, no network.
+
+    Only meant for benchmarking the index and chunking layers offline; absolute quality is
+    far below MiniLM, but relative comparisons between index variants remain meaningful.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _embed(self, text: str) -> list:
+        vector = np.zeros(self.dim, dtype="float32")
+        tokens = re.findall(r"[a-z0-9$.]+", text.lower())
+        for token in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+            h = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[h % self.dim] += 1.0 if (h >> 63) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def make_synthetic_corpus(n_companies: int = 5, years=range(2017, 2024), seed: int = 7):
+    """Generate transcript-like texts and labeled questions, each targeting one stated fact."""
+    rng = random.Random(seed)
+    transcripts, queries = [], []
+    for company in list(COMPANIES)[:n_companies]:
+        ticker = COMPANIES[company]
+        for year in years:
+            for quarter, month in MONTHS.items():
+                filename = f"{year}-{month}-25-{ticker}.txt"
+                sentences, facts = [], []
+                for segment in rng.sample(SEGMENTS, 6):
+                    metric = rng.choice(METRICS)
+                    value = f"{rng.uniform(0.5, 60):.1f}"
+                    fact = f"{segment} {metric} at {company} was ${value} billion"
+                    sentences.append(f"In {quarter} {year}, {fact}, up {rng.randint(1, 40)} percent year over year.")
+                    sentences.extend(rng.choice(FILLER).format(topic=rng.choice(SEGMENTS)) for _ in range(3))
+                    facts.append((segment, metric, fact))
+                rng.shuffle(sentences)
+                transcripts.append({"filename": filename, "text": "\n".join(sentences)})
+
+                segment, metric, fact = rng.choice(facts)
+                queries.append({
+                    "question": f"What was {company}'s {segment} {metric} in {quarter} {year}?",
+                    "filename": filename,
+                    "fact": fact,
+                })
+    return transcripts, queries
+
+
+def chunk_corpus(transcripts, chunk_size: int, chunk_overlap: int = 50):
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=["\n\n", "\n", ".", " "],
+    )
+    chunks = []
+    for t in transcripts:
+        for piece in splitter.split_text(t["text"]):
+            chunks.append({"filename": t["filename"], "text": piece})
+    return chunks
+
+
+class RescoredIndex:
+    """Quantized index whose candidates are re-scored exactly, as vector_search does at query time."""
+
+    def __init__(self, index, vectors: np.ndarray, rescore_factor: int = RESCORE_FACTOR):
+        self.index = index
+        self.exact = build_index("flat", vectors)
+        self.rescore_factor = rescore_factor
+
+    def search(self, queries: np.ndarray, k: int):
+        _, candidates = self.index.search(queries, k * self.rescore_factor)
+        distances = np.full((len(queries), k), np.inf, dtype="float32")
+        ids = np.full((len(queries), k), -1, dtype="int64")
+        for row, (query, found) in enumerate(zip(queries, candidates)):
+            d, i = rescore(self.exact, query, found[found != -1], k)
+            distances[row, :len(i)], ids[row, :len(i)] = d, i
+        return distances, ids
+
+
+def latency_stats(latencies_ms) -> dict:
+    arr = np.asarray(latencies_ms, dtype="float64")
+    return {
+        "p50_ms": float(np.percentile(arr, 50)),
+        "p95_ms": float(np.percentile(arr, 95)),
+        "p99_ms": float(np.percentile(arr, 99)),
+        "mean_ms": float(arr.mean()),
+    }
+
+
+def ranking_metrics(rankings, is_relevant, ks=REPORT_KS) -> dict:
+    """recall@k (share of queries with a relevant hit in the top k) and MRR.
+
+    `rankings[i]` is the ranked result list of query i and `is_relevant(i, item)` judges a hit.
+    """
+    first_hit = []
+    for i, ranking in enumerate(rankings):
+        rank = next((r for r, item in enumerate(ranking, 1) if is_relevant(i, item)), None)
+        first_hit.append(rank)
+    n = len(rankings) or 1
+    metrics = {f"recall@{k}": sum(1 for r in first_hit if r and r <= k) / n for k in ks}
+    metrics["mrr"] = sum(1.0 / r for r in first_hit if r) / n
+    return metrics
+
+
+def timed_search(index, query_vectors: np.ndarray, k: int):
+    """Search query by query (for latency percentiles), then once as a batch (for throughput)."""
+    latencies, rankings = [], []
+    for q in query_vectors:
+        started = time.perf_counter()
+        _, ids = index.search(q.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        rankings.append([int(i) for i in ids[0] if i != -1])
+
+    started = time.perf_counter()
+    index.search(query_vectors, k)
+    batch_seconds = time.perf_counter() - started
+    stats = latency_stats(latencies)
+    stats["qps_single"] = len(query_vectors) / (sum(latencies) / 1000) if latencies else 0.0
+    stats["qps_batch"] = len(query_vectors) / batch_seconds if batch_seconds else 0.0
+    return rankings, stats
+
+
+def benchmark_synthetic(chunk_sizes=DEFAULT_CHUNK_SIZES, index_types=DEFAULT_INDEX_TYPES, k: int = DEFAULT_K,
+                        n_companies: int = 5, seed: int = 7, **index_params) -> list:
+    """Compare index types and chunk sizes on a locally generated corpus."""
+    embedder = HashingEmbeddings()
+    transcripts, queries = make_synthetic_corpus(n_companies=n_companies, seed=seed)
+    query_vectors = np.asarray(embedder.embed_documents([q["question"] for q in queries]), dtype="float32")
+    print(f"🧪 Synthetic corpus: {len(transcripts)} transcripts, {len(queries)} labeled questions.")
+
+    rows = []
+    for chunk_size in chunk_sizes:
+        chunks = chunk_corpus(transcripts, chunk_size)
+        vectors = np.asarray(embedder.embed_documents([c["text"] for c in chunks]), dtype="float32")
+
+        def is_relevant(i, pos):
+            chunk = chunks[pos]
+            return chunk["filename"] == queries[i]["filename"] and queries[i]["fact"] in chunk["text"]
+
+        exact = None
+        for kind in sorted(index_types, key=lambda t: t != "flat"):
+            started = time.perf_counter()
+            index = build_index(kind, vectors, **index_params)
+            if is_quantized(kind):
+                index = RescoredIndex(index, vectors)
+            build_seconds = time.perf_counter() - started
+
+            rankings, stats = timed_search(index, query_vectors, k)
+            if kind == "flat":
+                exact = rankings
+            row = {"chunk_size": chunk_size, "index": kind, "chunks": len(chunks), "build_s": build_seconds}
+            row.update(ranking_metrics(rankings, is_relevant))
+            if exact is not None and kind != "flat":
+                # How much of the exact top-k the approximate index recovers
+                overlap = [len(set(a) & set(b)) / max(1, len(b)) for a, b in zip(rankings, exact)]
+                row["ann_recall_vs_flat"] = float(np.mean(overlap))
+            row.update(stats)
+            rows.append(row)
+    return rows
+
+
+def benchmark_labeled(queries_file, index_path, k: int = DEFAULT_K, hybrid: bool = False) -> list:
+    """Run a labeled query set against the real index through retriever.search_query.
+
+    Each entry needs "question" and "relevant_filenames"; "company", "year" and "quarter"
+    are passed through as search filters when present.
+    """
+    from retriever import search_query, search_batch
+
+    with open(queries_file, "r", encoding="utf-8") as f:
+        labeled = json.load(f)
+
+    # Warm-up so index loading and model initialisation are not counted as query latency
+    search_query(labeled[0]["question"], k=k, index_path=index_path, hybrid=hybrid)
+
+    latencies, rankings = [], []
+    for item in labeled:
+        started = time.perf_counter()
+        docs = search_query(item["question"], k=k, index_path=index_path, company=item.get("company"),
+                            year=item.get("year"), quarter=item.get("quarter"), hybrid=hybrid)
+        latencies.append((time.perf_counter() - started) * 1000)
+        rankings.append([doc.metadata.get("filename") for doc in docs])
+
+    def is_relevant(i, filename):
+        return filename in labeled[i]["relevant_filenames"]
+
+    # The same queries through the batch API (question embeddings are cached by now)
+    started = time.perf_counter()
+    search_batch([item["question"] for item in labeled], k=k, index_path=index_path, hybrid=hybrid,
+                 filters=[(item.get("company"), item.get("year"), item.get("quarter")) for item in labeled])
+    batch_seconds = time.perf_counter() - started
+
+    row = {"index": str(index_path), "mode": "hybrid" if hybrid else "vector", "queries": len(labeled)}
+    row.update(ranking_metrics(rankings, is_relevant))
+    row.update(latency_stats(latencies))
+    row["qps_single"] = len(labeled) / (sum(latencies) / 1000) if latencies else 0.0
+    row["qps_batch"] = len(labeled) / batch_seconds if batch_seconds else 0.0
+    return [row]
+
+
+def print_table(rows):
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    print(" | ".join(columns))
+    for row in rows:
+        print(" | ".join(f"{row[c]:.3f}" if isinstance(row.get(c), float) else str(row.get(c, "")) for c in columns))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark retrieval quality and latency")
+    parser.add_argument("--queries", type=str, help="Labeled query set (JSON) to run against a real index")
+    parser.add_argument("--index-path", type=str, help="FAISS index folder used with --queries")
+    parser.add_argument("--k", type=int, default=DEFAULT_K)
+    parser.add_argument("--hybrid", action="store_true", help="Fuse BM25 with vector search (with --queries)")
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=list(DEFAULT_CHUNK_SIZES))
+    parser.add_argument("--index-types", nargs="+", choices=INDEX_TYPES, default=list(DEFAULT_INDEX_TYPES))
+    parser.add_argument("--companies", type=int, default=5, help="Companies in the synthetic corpus")
+    parser.add_argument("--nprobe", type=int, default=DEFAULT_NPROBE)
+    parser.add_argument("--ef-search", type=int, default=DEFAULT_EF_SEARCH)
+    parser.add_argument("--pq-m", type=int, default=DEFAULT_PQ_M, help="IVF-PQ sub-quantizers (must divide 384)")
+    parser.add_argument("--output", type=str, help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    if args.queries:
+        from retriever import INDEX_PATH
+        results = benchmark_labeled(args.queries, args.index_path or INDEX_PATH, k=args.k, hybrid=args.hybrid)
+    else:
+        results = benchmark_synthetic(args.chunk_sizes, args.index_types, k=args.k, n_companies=args.companies,
+                                      nprobe=args.nprobe, ef_search=args.ef_search, pq_m=args.pq_m)
+
+    print_table(results)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"✅ Results saved to: {args.output}")
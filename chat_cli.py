@@ -1,19 +1,38 @@
 import argparse
-from rag_pipeline_gemini import rag_query, memory, load_memory_from_file, save_memory_to_file
+import csv
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+# Only lightweight modules here: the pipeline (LangChain, FAISS, Gemini) is imported when a
+# question is actually asked, so --history / --reset / --clear-cache start instantly
+from answer_cache import AnswerCache, ANSWER_CACHE_PATH
+from conversation_memory import read_memory_file, write_memory_file
+from lexical_index import RETRIEVAL_MODES, DEFAULT_RETRIEVAL_MODE
+from rate_limit import RateLimiter
+from instrumentation import span
 
 from pathlib import Path
 INDEX_PATH = Path(r"C:Navigate Labs\rag_mnc_insights\data\outputs\mnc_faiss_index")
 
+# ⚙️ Batch mode defaults
+BATCH_RETRIEVAL_SIZE = 64          # questions embedded and searched together
+BATCH_WORKERS = 8                  # Gemini calls in flight at once
+BATCH_REQUESTS_PER_MINUTE = 60
 
-def print_history():
+
+def print_history(messages):
     print("\n🕓 Chat History:")
-    for msg in memory.chat_memory.messages:
-        prefix = "👤 You" if msg.type == "human" else "🤖 RAG"
-        print(f"{prefix}: {msg.content}\n")
+    for msg in messages:
+        prefix = "👤 You" if msg["type"] == "human" else "🤖 RAG"
+        print(f"{prefix}: {msg['content']}\n")
+
 
+def interactive_chat(use_cache=True, stream=True, retrieval_mode=DEFAULT_RETRIEVAL_MODE):
+    from rag_pipeline_gemini import rag_query, memory, save_memory_to_file
+    from index_registry import reload_index
 
-def interactive_chat():
-    print("💬 Interactive Mode (type 'exit' to quit, 'reset' to clear memory, 'history' to view log):")
+    print("💬 Interactive Mode (type 'exit' to quit, 'reset' to clear memory, 'history' to view log, 'reload' to re-read the index):")
     while True:
         question = input(">> ").strip()
 
@@ -24,9 +43,128 @@ def interactive_chat():
             memory.clear()
             print("🔄 Memory cleared.")
         elif question.lower() == "history":
-            print_history()
+            print_history({"type": msg.type, "content": msg.content} for msg in memory.chat_memory.messages)
+        elif question.lower() == "reload":
+            reload_index(INDEX_PATH)
+            print("📦 Index reloaded.")
         else:
-            rag_query(INDEX_PATH, question)
+            rag_query(INDEX_PATH, question, use_cache=use_cache, stream=stream, retrieval_mode=retrieval_mode)
+
+
+def load_batch_questions(path) -> list:
+    """Questions from a .jsonl or .csv file: a `question` field plus optional id, company, year and quarter."""
+    path = Path(path)
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.suffix.lower() == ".csv":
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    items = []
+    for n, row in enumerate(rows, 1):
+        question = (row.get("question") or "").strip()
+        if not question:
+            print(f"⚠️ Skipping row {n}: no question.")
+            continue
+        company, year, quarter = (str(row[key]).strip() if row.get(key) else None for key in ("company", "year", "quarter"))
+        items.append({
+            "id": row.get("id") or n,
+            "question": question,
+            "filters": (company and company.upper(), year, quarter and quarter.upper()),
+        })
+    return items
+
+
+def _answer_batch_item(item, retrieved, limiter, use_cache) -> dict:
+    """Answer one retrieved question with its own, empty chat memory."""
+    from langchain.memory import ConversationBufferMemory
+    from rag_pipeline_gemini import prepare_answer, generate_answer
+
+    question = item["question"]
+    company, year, quarter = item["filters"]
+    with span("batch_answer", id=item["id"]):
+        prepared = prepare_answer(INDEX_PATH, question, company, year, quarter, use_cache=use_cache, retrieved=retrieved)
+        usage = {}
+        started = time.perf_counter()
+        conversation = ConversationBufferMemory(return_messages=True)
+        answer = generate_answer(question, prepared, conversation, usage=usage, limiter=limiter)
+    return {
+        "answer": answer,
+        "sources": prepared["sources"],
+        "cached": prepared["cached"],
+        "numeric": prepared["numeric"],
+        "generation_ms": round((time.perf_counter() - started) * 1000, 1),
+        "prompt_tokens": usage.get("prompt_tokens"),
+    }
+
+
+def run_batch(input_path, output_path, workers=BATCH_WORKERS, requests_per_minute=BATCH_REQUESTS_PER_MINUTE,
+              batch_size=BATCH_RETRIEVAL_SIZE, use_cache=True, retrieval_mode=DEFAULT_RETRIEVAL_MODE):
+    """Answer every question in `input_path`, writing one JSON line per answer to `output_path`.
+
+    Questions are retrieved `batch_size` at a time (one embedding batch, one FAISS search per
+    filter) while earlier ones are answered by `workers` threads under a shared Gemini rate
+    limit. Lines are written as answers complete, so they follow completion order; match
+    them to the input by `id`. A failed question is written with an `error` field.
+    """
+    from rag_pipeline_gemini import retrieve_documents_batch
+
+    items = load_batch_questions(input_path)
+    print(f"📥 Loaded {len(items)} questions from {input_path}")
+    limiter = RateLimiter(requests_per_minute / 60, burst=workers)
+    write_lock = threading.Lock()
+    counts = {"answered": 0, "failed": 0}
+    started = time.perf_counter()
+
+    with open(output_path, "w", encoding="utf-8") as out:
+        def write_row(item, retrieval_ms, result=None, error=None, filters=None):
+            # Filters detected from the question during retrieval are reported too
+            company, year, quarter = filters or item["filters"]
+            row = {"id": item["id"], "question": item["question"], "company": company, "year": year,
+                   "quarter": quarter, "retrieval_ms": retrieval_ms}
+            row.update(result or {"error": error})
+            with write_lock:
+                out.write(json.dumps(row, ensure_ascii=False) + "\n")
+                out.flush()
+                counts["failed" if error else "answered"] += 1
+                done = counts["answered"] + counts["failed"]
+                if done % 10 == 0 or done == len(items):
+                    print(f"🔎 {done}/{len(items)} questions done")
+
+        def answer(item, retrieved, retrieval_ms):
+            try:
+                result = _answer_batch_item(item, retrieved, limiter, use_cache)
+            except Exception as e:
+                write_row(item, retrieval_ms, error=f"{type(e).__name__}: {e}", filters=retrieved["filters"])
+            else:
+                write_row(item, retrieval_ms, result, filters=retrieved["filters"])
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as pool:
+            pending = set()
+            for start in range(0, len(items), batch_size):
+                # Keep retrieval at most one batch ahead of the (rate limited) Gemini calls
+                while len(pending) > batch_size:
+                    _, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+                batch = items[start:start + batch_size]
+                batch_started = time.perf_counter()
+                try:
+                    results = retrieve_documents_batch(INDEX_PATH, [item["question"] for item in batch],
+                                                       [item["filters"] for item in batch],
+                                                       retrieval_mode=retrieval_mode)
+                except Exception as e:
+                    for item in batch:
+                        write_row(item, None, error=f"retrieval failed: {type(e).__name__}: {e}")
+                    continue
+                # Retrieval time is amortised over the batch it ran in
+                retrieval_ms = round((time.perf_counter() - batch_started) * 1000 / len(batch), 1)
+                pending.update(pool.submit(answer, item, retrieved, retrieval_ms)
+                               for item, retrieved in zip(batch, results))
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ {counts['answered']} answers written to {output_path} in {elapsed:.1f}s"
+          + (f" ({counts['failed']} failed)" if counts["failed"] else ""))
+    return counts
 
 
 if __name__ == "__main__":
@@ -35,22 +173,59 @@ if __name__ == "__main__":
     parser.add_argument("--history", action="store_true", help="Show chat history")
     parser.add_argument("--reset", action="store_true", help="Clear chat memory")
     parser.add_argument("--interactive", action="store_true", help="Start interactive chat")
+    parser.add_argument("--no-cache", action="store_true", help="Always ask Gemini, bypassing the answer cache")
+    parser.add_argument("--no-stream", action="store_true", help="Print the answer only once it is complete")
+    parser.add_argument("--clear-cache", action="store_true", help="Delete all cached answers")
+    parser.add_argument("--prewarm", action="store_true",
+                        help="Load the index and models now and report how long each took")
+    parser.add_argument("--retrieval", choices=RETRIEVAL_MODES, default=DEFAULT_RETRIEVAL_MODE,
+                        help="hybrid fuses BM25 keyword matches with vector search; vector uses FAISS only")
+    parser.add_argument("--batch", type=str, help="Answer every question in a .jsonl or .csv file")
+    parser.add_argument("--output", type=str, help="JSON lines file for --batch answers (default: <input>.answers.jsonl)")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="Gemini calls in flight in --batch mode")
+    parser.add_argument("--rpm", type=int, default=BATCH_REQUESTS_PER_MINUTE, help="Max Gemini requests per minute in --batch mode")
+    parser.add_argument("--batch-size", type=int, default=BATCH_RETRIEVAL_SIZE,
+                        help="Questions embedded and searched together in --batch mode")
 
     args = parser.parse_args()
 
-    load_memory_from_file(memory)
-
+    # History, reset and cache maintenance only touch files and never load the pipeline
     if args.reset:
-        memory.clear()
+        write_memory_file([])
         print("🧹 Memory cleared.")
 
     if args.history:
-        print_history()
+        print_history(read_memory_file())
+
+    if args.clear_cache:
+        AnswerCache(ANSWER_CACHE_PATH).clear()
+        print("🧹 Answer cache cleared.")
+
+    interactive = args.interactive or not any([args.question, args.reset, args.history, args.clear_cache, args.batch,
+                                               args.prewarm])
+    if args.question or args.batch or args.prewarm or interactive:
+        from rag_pipeline_gemini import rag_query, memory, load_memory_from_file, save_memory_to_file, answer_cache
+        from rag_pipeline_gemini import prewarm
+
+        load_memory_from_file(memory)
+
+        if args.prewarm:
+            prewarm(INDEX_PATH)
+
+        if args.question:
+            rag_query(INDEX_PATH, args.question, use_cache=not args.no_cache, stream=not args.no_stream,
+                      retrieval_mode=args.retrieval)
+
+        if args.batch:
+            output = args.output or str(Path(args.batch).with_suffix(".answers.jsonl"))
+            run_batch(args.batch, output, workers=args.workers, requests_per_minute=args.rpm,
+                      batch_size=args.batch_size, use_cache=not args.no_cache, retrieval_mode=args.retrieval)
 
-    if args.question:
-        rag_query(INDEX_PATH, args.question)
+        if interactive:
+            interactive_chat(use_cache=not args.no_cache, stream=not args.no_stream, retrieval_mode=args.retrieval)
 
-    if args.interactive or not any([args.question, args.reset, args.history]):
-        interactive_chat()
+        stats = answer_cache.stats()
+        if stats["hits"] or stats["misses"]:
+            print(f"⚡ Answer cache — hits: {stats['hits']}, misses: {stats['misses']}, hit rate: {stats['hit_rate']:.0%}")
 
-    save_memory_to_file(memory)
+        save_memory_to_file(memory)
@@ -0,0 +1,307 @@
+import os
+import json
+import sqlite3
+import threading
+from array import array
+from collections.abc import Mapping
+from pathlib import Path
+import faiss
+from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.base import Docstore, AddableMixin
+from langchain.schema import Document
+
+# 📁 Files of the on-disk index format, inside the FAISS index folder
+INDEX_FILE = "index.faiss"
+CHUNK_STORE_FILE = "chunks.sqlite"
+EXACT_INDEX_FILE = "vectors.faiss"     # full-precision copy of quantized vectors, used for re-scoring
+LEGACY_DOCSTORE_FILE = "index.pkl"
+
+# 🗺️ Zero-copy mmap of the index where this FAISS build supports it, plain mmap otherwise
+MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+SELECT_BATCH = 500   # ids per "IN (...)" query, well below SQLite's variable limit
+
+
+class ChunkStore(Docstore):
+    """Read-only docstore over chunks.sqlite: chunk text and metadata are fetched by id on demand.
+
+    Each thread gets its own read-only connection, so concurrent searches never share a cursor.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"{self.path.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    def search(self, search: str):
+        row = self._conn().execute("SELECT text, metadata FROM chunks WHERE doc_id = ?", (search,)).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+    def search_many(self, ids) -> dict:
+        """Fetch several chunks at once; returns {doc_id: Document} for the ids that exist."""
+        ids = list(ids)
+        found = {}
+        for start in range(0, len(ids), SELECT_BATCH):
+            batch = ids[start:start + SELECT_BATCH]
+            rows = self._conn().execute(
+                f"SELECT doc_id, text, metadata FROM chunks WHERE doc_id IN ({','.join('?' * len(batch))})", batch
+            )
+            for doc_id, text, metadata in rows:
+                found[doc_id] = Document(page_content=text, metadata=json.loads(metadata))
+        return found
+
+    def add(self, texts: dict):
+        raise NotImplementedError("ChunkStore is read-only; update the index with embed_store.py")
+
+    def delete(self, ids):
+        raise NotImplementedError("ChunkStore is read-only; update the index with embed_store.py")
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+
+class PositionMap(Mapping):
+    """FAISS row position → docstore id, looked up in chunks.sqlite instead of held in memory."""
+
+    def __init__(self, chunk_store: ChunkStore):
+        self._store = chunk_store
+        self._len = None
+
+    def __getitem__(self, pos):
+        row = self._store._conn().execute("SELECT doc_id FROM chunks WHERE pos = ?", (int(pos),)).fetchone()
+        if row is None:
+            raise KeyError(pos)
+        return row[0]
+
+    def __iter__(self):
+        return (pos for pos, in self._store._conn().execute("SELECT pos FROM chunks ORDER BY pos"))
+
+    def __len__(self):
+        if self._len is None:
+            self._len = len(self._store)
+        return self._len
+
+    def items(self):
+        return list(self._store._conn().execute("SELECT pos, doc_id FROM chunks ORDER BY pos"))
+
+    def values(self):
+        return [doc_id for _, doc_id in self.items()]
+
+    def positions(self, doc_ids) -> list:
+        """FAISS positions of `doc_ids` (ids not in the index are skipped)."""
+        doc_ids = list(doc_ids)
+        positions = []
+        for start in range(0, len(doc_ids), SELECT_BATCH):
+            batch = doc_ids[start:start + SELECT_BATCH]
+            rows = self._store._conn().execute(
+                f"SELECT pos FROM chunks WHERE doc_id IN ({','.join('?' * len(batch))})", batch
+            )
+            positions.extend(pos for pos, in rows)
+        return positions
+
+
+class CompactDocstore(Docstore, AddableMixin):
+    """In-memory docstore that keeps chunks in flat arrays instead of one Document per chunk.
+
+    Chunk text lives in a single UTF-8 buffer addressed by offset/length arrays, and the
+    metadata shared by every chunk of a transcript is stored once; only `chunk_index` and
+    `chunk_id` vary per chunk. Documents are materialised on `search`. Deleted chunks leave
+    a gap in the buffer until `compact()` runs (done automatically once half is garbage).
+    """
+
+    PER_CHUNK_KEYS = ("chunk_index", "chunk_id")
+
+    def __init__(self, documents: dict = None):
+        self._text = bytearray()
+        self._offsets = array("Q")
+        self._lengths = array("I")
+        self._meta_refs = array("I")
+        self._chunk_indexes = array("q")     # -1: metadata has no chunk_index
+        self._has_chunk_id = array("b")
+        self._metas = []
+        self._meta_refs_by_key = {}
+        self._rows = {}                      # docstore id → row in the arrays
+        self._garbage = 0
+        if documents:
+            self.add(documents)
+
+    def add(self, texts: dict):
+        overlapping = set(texts).intersection(self._rows)
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        for doc_id, doc in texts.items():
+            self._append(doc_id, doc.page_content, doc.metadata or {})
+
+    def _append(self, doc_id, text: str, metadata: dict):
+        shared = {k: v for k, v in metadata.items() if k not in self.PER_CHUNK_KEYS}
+        key = json.dumps(shared, sort_keys=True, default=str)
+        ref = self._meta_refs_by_key.get(key)
+        if ref is None:
+            ref = len(self._metas)
+            self._metas.append(shared)
+            self._meta_refs_by_key[key] = ref
+
+        encoded = text.encode("utf-8")
+        self._rows[doc_id] = len(self._offsets)
+        self._offsets.append(len(self._text))
+        self._lengths.append(len(encoded))
+        self._text += encoded
+        self._meta_refs.append(ref)
+        self._chunk_indexes.append(metadata.get("chunk_index", -1))
+        self._has_chunk_id.append("chunk_id" in metadata)
+
+    def _document(self, doc_id, row: int) -> Document:
+        start = self._offsets[row]
+        metadata = dict(self._metas[self._meta_refs[row]])
+        if self._chunk_indexes[row] >= 0:
+            metadata["chunk_index"] = self._chunk_indexes[row]
+        if self._has_chunk_id[row]:
+            metadata["chunk_id"] = doc_id
+        text = self._text[start:start + self._lengths[row]].decode("utf-8")
+        return Document(page_content=text, metadata=metadata)
+
+    def search(self, search: str):
+        row = self._rows.get(search)
+        if row is None:
+            return f"ID {search} not found."
+        return self._document(search, row)
+
+    def delete(self, ids):
+        missing = set(ids).difference(self._rows)
+        if missing:
+            raise ValueError(f"Tried to delete ids that does not exist: {missing}")
+        for doc_id in ids:
+            self._garbage += self._lengths[self._rows.pop(doc_id)]
+        if self._garbage > len(self._text) // 2:
+            self.compact()
+
+    def compact(self):
+        """Rewrite the arrays without deleted chunks."""
+        live = [(doc_id, self._document(doc_id, row)) for doc_id, row in self._rows.items()]
+        self.__init__()
+        for doc_id, doc in live:
+            self._append(doc_id, doc.page_content, doc.metadata)
+
+    def __len__(self):
+        return len(self._rows)
+
+
+def iter_documents(vectorstore, doc_ids=None, batch_size: int = SELECT_BATCH):
+    """(docstore id, Document) pairs of a store in FAISS order, fetched `batch_size` at a time.
+
+    Builds of the side indexes stream chunks through this instead of materialising every text.
+    """
+    doc_ids = list(vectorstore.index_to_docstore_id.values()) if doc_ids is None else list(doc_ids)
+    docstore = vectorstore.docstore
+    for start in range(0, len(doc_ids), batch_size):
+        batch = doc_ids[start:start + batch_size]
+        if hasattr(docstore, "search_many"):
+            found = docstore.search_many(batch)
+        else:
+            found = {doc_id: docstore.search(doc_id) for doc_id in batch}
+        for doc_id in batch:
+            yield doc_id, found.get(doc_id)
+
+
+def write_chunk_store(vectorstore, index_path) -> Path:
+    """Write every chunk of `vectorstore` with its FAISS position to chunks.sqlite (atomically)."""
+    path = Path(index_path) / CHUNK_STORE_FILE
+    tmp_path = path.with_suffix(".tmp")
+    if tmp_path.exists():
+        tmp_path.unlink()
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute("CREATE TABLE chunks (pos INTEGER PRIMARY KEY, doc_id TEXT NOT NULL UNIQUE, text TEXT NOT NULL, metadata TEXT NOT NULL)")
+        positions = sorted(vectorstore.index_to_docstore_id.items())
+        rows = (
+            (int(pos), doc_id, doc.page_content, json.dumps(doc.metadata))
+            for (pos, _), (doc_id, doc) in zip(positions, iter_documents(vectorstore, [i for _, i in positions]))
+        )
+        conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", rows)
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+    return path
+
+
+def _write_index(index, path: Path):
+    tmp_path = path.with_name(path.name + ".tmp")
+    faiss.write_index(index, str(tmp_path))
+    os.replace(tmp_path, path)
+
+
+def _read_index(path: Path, mmap: bool):
+    if mmap:
+        try:
+            return faiss.read_index(str(path), MMAP_FLAGS)
+        except RuntimeError:
+            pass
+    return faiss.read_index(str(path))
+
+
+def save_vectorstore(vectorstore, index_path):
+    """Save the FAISS index and chunk store; replaces any pickled docstore from older builds.
+
+    Quantized indexes also carry `exact_index`, a flat full-precision copy of their vectors
+    that is saved alongside for exact re-scoring.
+    """
+    index_path = Path(index_path)
+    index_path.mkdir(parents=True, exist_ok=True)
+    _write_index(vectorstore.index, index_path / INDEX_FILE)
+    exact_index = getattr(vectorstore, "exact_index", None)
+    if exact_index is not None:
+        _write_index(exact_index, index_path / EXACT_INDEX_FILE)
+    elif (index_path / EXACT_INDEX_FILE).exists():
+        (index_path / EXACT_INDEX_FILE).unlink()
+    write_chunk_store(vectorstore, index_path)
+
+    legacy = index_path / LEGACY_DOCSTORE_FILE
+    if legacy.exists():
+        legacy.unlink()
+
+
+def load_vectorstore(index_path, embedding_model, mmap: bool = True, writable: bool = False):
+    """Open an index folder as a LangChain FAISS store.
+
+    By default the index is memory-mapped and chunks stay in SQLite, so startup is near
+    instant and processes share the OS page cache. `writable=True` reads everything into
+    memory instead (chunks into a CompactDocstore), for builds that add or delete vectors.
+    Folders from older builds (no chunks.sqlite) fall back to the pickled docstore.
+    """
+    index_path = Path(index_path)
+    if not (index_path / CHUNK_STORE_FILE).exists():
+        print("ℹ️ Index has no chunk store yet, loading the pickled docstore (rebuild to convert).")
+        db = FAISS.load_local(str(index_path), embeddings=embedding_model, allow_dangerous_deserialization=True)
+        db.exact_index = None
+        return db
+
+    mmap = mmap and not writable
+    index = _read_index(index_path / INDEX_FILE, mmap)
+    chunk_store = ChunkStore(index_path / CHUNK_STORE_FILE)
+    if writable:
+        id_map = dict(PositionMap(chunk_store).items())
+        docstore = CompactDocstore(chunk_store.search_many(id_map.values()))
+    else:
+        id_map = PositionMap(chunk_store)
+        docstore = chunk_store
+
+    db = FAISS(
+        embedding_function=embedding_model,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=id_map
+    )
+    # Only the re-scored candidates' pages of the full-precision vectors are ever read
+    exact_path = index_path / EXACT_INDEX_FILE
+    db.exact_index = _read_index(exact_path, mmap) if exact_path.exists() else None
+    return db
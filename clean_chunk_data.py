@@ -1,12 +1,16 @@
 import os
 import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.schema import Document
 
 # 📁 Path to transcripts folder
 BASE_DIR = Path(r"C:Navigate Labs\rag_mnc_insights\data\Transcripts")
 
+# 👷 Processes used to read/clean/split transcripts in parallel
+DEFAULT_INGEST_WORKERS = min(4, os.cpu_count() or 1)
+
 # 🔨 Define text splitter
 text_splitter = RecursiveCharacterTextSplitter(
     chunk_size=500,
@@ -49,48 +53,108 @@ def extract_metadata(file_path: Path):
         "filename": file_name
     }
 
-def load_all_transcripts(base_dir: Path):
-    all_chunks = []
+def convert_date_to_quarter(filename, fiscal_year=True):
+    if fiscal_year:
+        months_to_quarters = {
+            "Jul": "Q1", "Aug": "Q1", "Sep": "Q1",
+            "Oct": "Q2", "Nov": "Q2", "Dec": "Q2",
+            "Jan": "Q3", "Feb": "Q3", "Mar": "Q3",
+            "Apr": "Q4", "May": "Q4", "Jun": "Q4",
+        }
+    else:
+        months_to_quarters = {
+            "Jan": "Q1", "Feb": "Q1", "Mar": "Q1",
+            "Apr": "Q2", "May": "Q2", "Jun": "Q2",
+            "Jul": "Q3", "Aug": "Q3", "Sep": "Q3",
+            "Oct": "Q4", "Nov": "Q4", "Dec": "Q4",
+        }
+    return next((q for mon, q in months_to_quarters.items() if mon in filename), "")
+
+def transcript_id(file_path: Path) -> str:
+    """Stable id of a transcript relative to the transcripts folder, e.g. 'MSFT/2020-Jan-29-MSFT.txt'."""
+    return f"{file_path.parent.name}/{file_path.name}"
+
+def load_transcript(file_path: Path):
+    """Read, clean and split a single transcript file into chunks with metadata."""
+    company_name = file_path.parent.name
+
+    with open(file_path, 'r', encoding='utf-8') as f:
+        raw_text = f.read()
+
+    cleaned_text = clean_text(raw_text)
 
+    # 🧠 Extract metadata from filename
+    filename_parts = file_path.stem.split("-")  # e.g., ['2020', 'Jan', '29', 'MSFT']
+    year = filename_parts[0]
+    month = filename_parts[1]
+
+    # Convert month to quarter
+    qmap = {
+        'Jan': 'Q1', 'Feb': 'Q1', 'Mar': 'Q1',
+        'Apr': 'Q2', 'May': 'Q2', 'Jun': 'Q2',
+        'Jul': 'Q3', 'Aug': 'Q3', 'Sep': 'Q3',
+        'Oct': 'Q4', 'Nov': 'Q4', 'Dec': 'Q4'
+    }
+    quarter = qmap.get(month, 'Unknown')
+
+    chunks = text_splitter.create_documents(
+        [cleaned_text],
+        metadatas=[{
+            "company": company_name,
+            "filename": file_path.name,
+            "year": year,
+            "quarter": quarter
+        }]
+    )
+
+    # 🔖 Stable per-chunk ids so an index can be updated file by file
+    source_id = transcript_id(file_path)
+    for i, chunk in enumerate(chunks):
+        chunk.metadata["chunk_index"] = i
+        chunk.metadata["chunk_id"] = f"{source_id}#{i}"
+    return chunks
+
+def iter_transcript_files(base_dir: Path):
     for company_dir in base_dir.iterdir():
         if company_dir.is_dir():
-            company_name = company_dir.name
-
-            for file_path in company_dir.glob("*.txt"):
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    raw_text = f.read()
-
-                cleaned_text = clean_text(raw_text)
-
-                # 🧠 Extract metadata from filename
-                filename_parts = file_path.stem.split("-")  # e.g., ['2020', 'Jan', '29', 'MSFT']
-                year = filename_parts[0]
-                month = filename_parts[1]
-
-                # Convert month to quarter
-                qmap = {
-                    'Jan': 'Q1', 'Feb': 'Q1', 'Mar': 'Q1',
-                    'Apr': 'Q2', 'May': 'Q2', 'Jun': 'Q2',
-                    'Jul': 'Q3', 'Aug': 'Q3', 'Sep': 'Q3',
-                    'Oct': 'Q4', 'Nov': 'Q4', 'Dec': 'Q4'
-                }
-                quarter = qmap.get(month, 'Unknown')
-
-                chunks = text_splitter.create_documents(
-                    [cleaned_text],
-                    metadatas=[{
-                        "company": company_name,
-                        "filename": file_path.name,
-                        "year": year,
-                        "quarter": quarter
-                    }]
-                )
-                all_chunks.extend(chunks)
-
-    return all_chunks
+            yield from company_dir.glob("*.txt")
+
+def iter_chunks_by_file(file_paths, workers: int = DEFAULT_INGEST_WORKERS, prefetch: int = 2):
+    """Yield (file_path, chunks) for each transcript, in input order.
+
+    Files are read, cleaned and split by a process pool, with at most `workers * prefetch`
+    files in flight, so memory use depends on the prefetch window, not on corpus size.
+    """
+    if workers <= 1:
+        for file_path in file_paths:
+            yield file_path, load_transcript(file_path)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+        for file_path in file_paths:
+            in_flight.append((file_path, pool.submit(load_transcript, file_path)))
+            if len(in_flight) >= workers * prefetch:
+                done_path, future = in_flight.popleft()
+                yield done_path, future.result()
+        while in_flight:
+            done_path, future = in_flight.popleft()
+            yield done_path, future.result()
+
+def stream_transcripts(base_dir: Path, workers: int = DEFAULT_INGEST_WORKERS):
+    """Yield chunks of every transcript under `base_dir`, one file at a time."""
+    for _, chunks in iter_chunks_by_file(iter_transcript_files(base_dir), workers=workers):
+        yield from chunks
+
+def load_all_transcripts(base_dir: Path):
+    return list(stream_transcripts(base_dir, workers=1))
 
 
 if __name__ == "__main__":
-    chunks = load_all_transcripts(BASE_DIR)
-    print(f"✅ Total Chunks Created: {len(chunks)}")
-    print("🧾 Sample chunk metadata:\n", chunks[0].metadata)
+    total = 0
+    sample = None
+    for chunk in stream_transcripts(BASE_DIR):
+        total += 1
+        sample = sample or chunk
+    print(f"✅ Total Chunks Created: {total}")
+    print("🧾 Sample chunk metadata:\n", sample.metadata)
@@ -0,0 +1,97 @@
+import re
+from conversation_memory import estimate_tokens
+
+# ⚙️ Defaults for the transcript context sent with every prompt
+CONTEXT_TOKEN_BUDGET = 600      # approximate tokens of transcript context per prompt (old top-5 chunks were ~625)
+MAX_CHUNK_GAP = 1               # chunks this close in one transcript are merged into one passage
+NEAR_DUPLICATE_SIMILARITY = 0.9 # word-set Jaccard above which a chunk is treated as a repeat
+MIN_OVERLAP_CHARS = 10          # shortest suffix/prefix match stripped when merging neighbours
+MAX_OVERLAP_CHARS = 200         # splitter overlap is 50 chars; leave room for whitespace drift
+
+
+def _words(text: str) -> frozenset:
+    return frozenset(re.findall(r"\w+", text.lower()))
+
+
+def _is_near_duplicate(words, kept, threshold: float = NEAR_DUPLICATE_SIMILARITY) -> bool:
+    for other in kept:
+        union = len(words | other)
+        if union and len(words & other) / union >= threshold:
+            return True
+    return False
+
+
+def merge_overlapping(first: str, second: str) -> str:
+    """Join two consecutive chunks, dropping the text the splitter repeated at the boundary."""
+    for n in range(min(len(first), len(second), MAX_OVERLAP_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+        if first.endswith(second[:n]):
+            return first + second[n:]
+    if second in first:
+        return first
+    return f"{first}\n{second}"
+
+
+def _passages(docs, max_gap: int):
+    """Group ranked docs into passages of neighbouring chunks from the same transcript.
+
+    Each passage keeps the best rank of its members, so packing still follows relevance.
+    """
+    groups = {}
+    for rank, doc in enumerate(docs):
+        chunk_id = doc.metadata.get("chunk_id")
+        source = chunk_id.rsplit("#", 1)[0] if chunk_id else doc.metadata.get("filename", "Unknown")
+        groups.setdefault(source, []).append((doc.metadata.get("chunk_index"), rank, doc))
+
+    passages = []
+    for source, members in groups.items():
+        positioned = sorted((m for m in members if m[0] is not None), key=lambda m: m[0])
+        # Chunks without a position (older indexes) can't be merged and stay on their own
+        runs = [[m] for m in members if m[0] is None]
+        for member in positioned:
+            if runs and runs[-1][-1][0] is not None and member[0] - runs[-1][-1][0] <= max_gap:
+                runs[-1].append(member)
+            else:
+                runs.append([member])
+        for run in runs:
+            text = run[0][2].page_content
+            for _, _, doc in run[1:]:
+                text = merge_overlapping(text, doc.page_content)
+            passages.append({
+                "rank": min(m[1] for m in run),
+                "docs": [m[2] for m in run],
+                "filename": run[0][2].metadata.get("filename", "Unknown"),
+                "text": text,
+            })
+    return sorted(passages, key=lambda p: p["rank"])
+
+
+def pack_context(docs, token_budget: int = CONTEXT_TOKEN_BUDGET, max_gap: int = MAX_CHUNK_GAP) -> dict:
+    """Build the transcript context for a prompt from ranked docs.
+
+    Exact and near-duplicate chunks are dropped, neighbouring chunks of one transcript are
+    merged (without the splitter's overlap), and passages are added in rank order while they
+    fit in `token_budget`. Returns the context text, the docs it contains and its token estimate.
+    """
+    unique, seen_words = [], []
+    for doc in docs:
+        words = _words(doc.page_content)
+        if not words or _is_near_duplicate(words, seen_words):
+            continue
+        seen_words.append(words)
+        unique.append(doc)
+
+    sections, used_docs, tokens = [], [], 0
+    for passage in _passages(unique, max_gap):
+        section = f"[{passage['filename']}]\n{passage['text']}"
+        cost = estimate_tokens(section)
+        if tokens + cost > token_budget:
+            if sections:
+                continue
+            # Always send something: the best passage is cut down to the budget
+            section = section[:token_budget * 4].rstrip() + " …"
+            cost = estimate_tokens(section)
+        sections.append(section)
+        used_docs.extend(passage["docs"])
+        tokens += cost
+
+    return {"context": "\n\n".join(sections), "docs": used_docs, "tokens": tokens}
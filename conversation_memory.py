@@ -0,0 +1,155 @@
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+
+# ⚙️ Defaults for the chat history sent with every prompt
+HISTORY_TOKEN_BUDGET = 1500     # approximate tokens of history per prompt
+KEEP_LAST_TURNS = 4             # most recent turns always kept verbatim (budget permitting)
+RELEVANT_TURNS = 0              # older turns re-included by similarity to the question (0 = off)
+SUMMARY_WORDS_PER_TURN = 15     # words kept from each older question in the summary line
+MAX_PERSISTED_MESSAGES = 200    # messages written to chat_memory.json
+MAX_CACHED_TURN_VECTORS = 1000  # embeddings of older turns kept for relevance lookups (least recently used dropped)
+
+MEMORY_FILE = Path(r"C:Navigate Labs\rag_mnc_insights\data\outputs\chat_memory.json")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) — good enough for budgeting, no API call."""
+    return max(1, len(text) // 4)
+
+
+def read_memory_file(filepath=MEMORY_FILE) -> list:
+    """Persisted chat messages as [{"type": "human" | "ai", "content": ...}]; empty if there is no file."""
+    filepath = Path(filepath)
+    if not filepath.exists():
+        return []
+    with open(filepath, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_memory_file(messages, filepath=MEMORY_FILE, max_messages=MAX_PERSISTED_MESSAGES):
+    """Persist chat messages (LangChain messages or dicts as returned by read_memory_file).
+
+    Only the most recent `max_messages` are kept so the file does not grow without bound.
+    """
+    data = [
+        msg if isinstance(msg, dict) else {"type": msg.type, "content": msg.content}
+        for msg in list(messages)[-max_messages:]
+    ]
+    filepath = Path(filepath)
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+    with open(filepath, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+
+
+def group_turns(messages) -> list:
+    """Group messages into turns: each user message with the assistant replies that follow it."""
+    turns = []
+    for msg in messages:
+        if msg.type == "human" or not turns:
+            turns.append([msg])
+        else:
+            turns[-1].append(msg)
+    return turns
+
+
+def _format(msg, max_tokens=None) -> str:
+    content = msg.content
+    if max_tokens is not None and estimate_tokens(content) > max_tokens:
+        content = content[:max_tokens * 4].rstrip() + " …"
+    return f"User: {content}" if msg.type == "human" else f"Assistant: {content}"
+
+
+def _shorten(text: str, words: int) -> str:
+    parts = text.split()
+    return " ".join(parts[:words]) + (" …" if len(parts) > words else "")
+
+
+class TokenBudgetHistory:
+    """Renders chat history for a prompt within a token budget.
+
+    The newest turns are kept verbatim; optionally, older turns most similar to the current
+    question are re-included; anything else older is collapsed into a one-line summary of the
+    questions asked, and dropped entirely once the budget is spent.
+    """
+
+    def __init__(self, token_budget: int = HISTORY_TOKEN_BUDGET, keep_last_turns: int = KEEP_LAST_TURNS,
+                 relevant_turns: int = RELEVANT_TURNS, embedding_model=None):
+        self.token_budget = token_budget
+        self.keep_last_turns = keep_last_turns
+        self.relevant_turns = relevant_turns
+        self.embedding_model = embedding_model
+        self._vectors = OrderedDict()       # turn text hash → embedding, shared by every session rendered here
+        self._lock = threading.Lock()
+
+    def render(self, messages) -> str:
+        turns = group_turns(messages)
+        if not turns:
+            return ""
+
+        budget = self.token_budget
+        selected = {}
+
+        # 1️⃣ Newest turns, newest first; the current question is always kept (truncated if huge)
+        recent = list(range(len(turns)))[-self.keep_last_turns:] if self.keep_last_turns else [len(turns) - 1]
+        for i in reversed(recent):
+            lines = [_format(m, max_tokens=budget if i == len(turns) - 1 else None) for m in turns[i]]
+            cost = sum(estimate_tokens(line) for line in lines)
+            if cost > budget and i != len(turns) - 1:
+                break
+            selected[i] = lines
+            budget -= cost
+
+        older = [i for i in range(len(turns)) if i < min(selected)]
+
+        # 2️⃣ Older turns relevant to the current question
+        if older and budget > 0 and self.relevant_turns and self.embedding_model is not None:
+            for i in self._most_relevant(turns, older, turns[-1][0].content):
+                lines = [_format(m) for m in turns[i]]
+                cost = sum(estimate_tokens(line) for line in lines)
+                if cost <= budget:
+                    selected[i] = lines
+                    budget -= cost
+            older = [i for i in older if i not in selected]
+
+        # 3️⃣ Everything else collapses into a summary of earlier questions
+        summary = []
+        for i in reversed(older):
+            item = _shorten(turns[i][0].content, SUMMARY_WORDS_PER_TURN)
+            cost = estimate_tokens(item) + 1
+            if cost > budget:
+                break
+            summary.insert(0, item)
+            budget -= cost
+
+        out = []
+        if summary:
+            out.append("Earlier in this conversation the user asked about: " + "; ".join(summary))
+        for i in sorted(selected):
+            out.extend(selected[i])
+        return "\n".join(out)
+
+    def _most_relevant(self, turns, candidates, question) -> list:
+        texts = [" ".join(m.content for m in turns[i]) for i in candidates]
+        vectors = np.vstack([self._embed(t) for t in texts])
+        query = self._embed(question)
+        sims = vectors @ query / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query) + 1e-12)
+        ranked = np.argsort(-sims)[:self.relevant_turns]
+        return [candidates[j] for j in ranked]
+
+    def _embed(self, text: str) -> np.ndarray:
+        key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is not None:
+                self._vectors.move_to_end(key)
+                return vector
+        vector = np.asarray(self.embedding_model.embed_query(text), dtype="float32")
+        with self._lock:
+            self._vectors[key] = vector
+            while len(self._vectors) > MAX_CACHED_TURN_VECTORS:
+                self._vectors.popitem(last=False)
+        return vector
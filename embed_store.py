@@ -1,25 +1,357 @@
 import os
+import json
+import shutil
+import hashlib
+import argparse
 from pathlib import Path
+import faiss
+import numpy as np
 from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from scripts.clean_chunk_data import load_all_transcripts, BASE_DIR
+from scripts.clean_chunk_data import iter_chunks_by_file, iter_transcript_files, transcript_id, BASE_DIR, DEFAULT_INGEST_WORKERS
+from index_registry import get_embedding_model
+from metadata_index import build_metadata_index, save_metadata_index
+from lexical_index import build_lexical_index, save_lexical_index
+from financial_metrics import build_financial_metrics, save_financial_metrics
+from chunk_store import save_vectorstore, load_vectorstore, CompactDocstore
+from vector_search import docstore_positions
+from shard_router import shard_key, shard_path, list_shards
+from embedding_pipeline import embed_documents, make_embedding_pool, EmbeddingCache, DEFAULT_BATCH_SIZE, DEFAULT_WORKERS
+from ann_index import (
+    make_index, train_index, apply_index_defaults, needs_training, supports_delete, is_quantized, save_index_params,
+    load_index_params,
+    INDEX_TYPES, DEFAULT_NPROBE, DEFAULT_EF_SEARCH, DEFAULT_TRAIN_SIZE,
+)
 
 # 📁 Output path for FAISS index
 OUTPUT_DIR = BASE_DIR.parent / "outputs"
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 INDEX_PATH = OUTPUT_DIR / "mnc_faiss_index"
 
-# 🧠 Load transcripts
-print("📚 Loading and chunking transcripts...")
-docs = load_all_transcripts(BASE_DIR)
-print(f"✅ Loaded {len(docs)} chunks.")
+# 🧾 Per-transcript content hashes and chunk ids, stored inside the index folder
+MANIFEST_FILE = "manifest.json"
 
-# 🔎 Embedding model
-print("🔧 Creating embeddings...")
-embedding_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+# 📦 Chunks embedded and added to the index per batch while streaming transcripts
+DEFAULT_FLUSH_SIZE = 2048
 
-# 🗃️ Create FAISS index
-print("💾 Creating FAISS index...")
-vectorstore = FAISS.from_documents(docs, embedding_model)
-vectorstore.save_local(str(INDEX_PATH))
-print(f"✅ FAISS index saved to: {INDEX_PATH}")
+# 🧠 Vectors already computed for (model, chunk text), reused across rebuilds
+EMBEDDING_CACHE_DIR = OUTPUT_DIR / "embedding_cache"
+
+
+def file_hash(file_path: Path) -> str:
+    """SHA-256 of a transcript's bytes."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(index_path: Path) -> dict:
+    path = Path(index_path) / MANIFEST_FILE
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("files", {})
+
+
+def save_manifest(files: dict, index_path: Path):
+    path = Path(index_path) / MANIFEST_FILE
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": 1, "files": files}, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def scan_transcripts(base_dir: Path, previous: dict, company: str = None) -> dict:
+    """Fingerprint every transcript (of `company` only, if given), re-hashing only files whose size or mtime changed."""
+    current = {}
+    for file_path in iter_transcript_files(base_dir):
+        if company and shard_key(file_path) != company:
+            continue
+        stat = file_path.stat()
+        source_id = transcript_id(file_path)
+        old = previous.get(source_id)
+        if old and old.get("size") == stat.st_size and old.get("mtime_ns") == stat.st_mtime_ns:
+            digest = old["hash"]
+        else:
+            digest = file_hash(file_path)
+        current[source_id] = {
+            "path": file_path,
+            "hash": digest,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+        }
+    return current
+
+
+def manifest_entry(info: dict, chunk_ids: list) -> dict:
+    return {
+        "hash": info["hash"],
+        "size": info["size"],
+        "mtime_ns": info["mtime_ns"],
+        "chunk_ids": chunk_ids,
+    }
+
+
+def save_index(vectorstore, index_path: Path, files: dict, index_options=None):
+    """Persist the FAISS index, its metadata, lexical and metrics side files, and the manifest (last, so it never runs ahead)."""
+    save_vectorstore(vectorstore, index_path)
+    params = {"index_type": "flat", **(index_options or {})}
+    if hasattr(vectorstore.index, "nlist"):
+        params["nlist"] = vectorstore.index.nlist
+    save_index_params(index_path, params)
+    save_metadata_index(build_metadata_index(vectorstore), index_path)
+    save_lexical_index(build_lexical_index(vectorstore), index_path)
+    save_financial_metrics(build_financial_metrics(vectorstore), index_path)
+    save_manifest(files, index_path)
+
+
+def new_vectorstore(text_embeddings, embedding_model, metadatas, ids, index_options=None):
+    """Create a LangChain FAISS store backed by the configured index type, trained on this batch."""
+    params = {"index_type": "flat", **(index_options or {})}
+    index_type = params.pop("index_type")
+    train_size = params.get("train_size", DEFAULT_TRAIN_SIZE)
+    vectors = np.asarray([vector for _, vector in text_embeddings], dtype="float32")
+
+    index = make_index(index_type, vectors.shape[1], n_train=min(len(vectors), train_size), **params)
+    if needs_training(index_type):
+        print(f"🎯 Training {index_type} index on {min(len(vectors), train_size)} vectors...")
+        train_index(index, vectors, train_size)
+    apply_index_defaults(index, params.get("nprobe", DEFAULT_NPROBE), params.get("ef_search", DEFAULT_EF_SEARCH))
+
+    vectorstore = FAISS(
+        embedding_function=embedding_model,
+        index=index,
+        docstore=CompactDocstore(),
+        index_to_docstore_id={}
+    )
+    # Quantized codes are re-scored against a flat full-precision copy at query time
+    vectorstore.exact_index = faiss.IndexFlatL2(vectors.shape[1]) if is_quantized(index_type) else None
+    add_vectors(vectorstore, text_embeddings, metadatas, ids)
+    return vectorstore
+
+
+def add_vectors(vectorstore, text_embeddings, metadatas, ids):
+    """Add embedded chunks to the store and, for quantized indexes, to its full-precision copy."""
+    vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+    exact_index = getattr(vectorstore, "exact_index", None)
+    if exact_index is not None:
+        exact_index.add(np.asarray([vector for _, vector in text_embeddings], dtype="float32"))
+
+
+def delete_chunks(vectorstore, ids):
+    """Delete chunks by docstore id, keeping the full-precision copy aligned with the index."""
+    exact_index = getattr(vectorstore, "exact_index", None)
+    if exact_index is not None:
+        positions = np.array(docstore_positions(vectorstore, ids), dtype="int64")
+        exact_index.remove_ids(faiss.IDSelectorBatch(positions.size, faiss.swig_ptr(positions)))
+    vectorstore.delete(ids)
+
+
+def add_chunks(vectorstore, docs, embedding_model, embed_options=None, index_options=None):
+    """Embed one batch of chunks and add it to `vectorstore` (created on the first batch)."""
+    text_embeddings = embed_documents(docs, **(embed_options or {}))
+    metadatas = [d.metadata for d in docs]
+    ids = [d.metadata["chunk_id"] for d in docs]
+    if vectorstore is None:
+        return new_vectorstore(text_embeddings, embedding_model, metadatas, ids, index_options)
+    add_vectors(vectorstore, text_embeddings, metadatas, ids)
+    return vectorstore
+
+
+def index_transcripts(vectorstore, scanned: dict, files: dict, embedding_model, embed_options=None,
+                      ingest_workers: int = DEFAULT_INGEST_WORKERS, flush_size: int = DEFAULT_FLUSH_SIZE,
+                      index_options=None):
+    """Stream transcripts through chunking and embedding, flushing every `flush_size` chunks.
+
+    Only one batch of chunks is held in memory at a time; `files` is filled with the
+    manifest entry of every transcript processed. When a new IVF / PQ index has to be
+    trained, the first batch is grown to the training sample size.
+    """
+    index_options = {"index_type": "flat", **(index_options or {})}
+    first_batch = flush_size
+    if vectorstore is None and needs_training(index_options["index_type"]):
+        first_batch = max(flush_size, index_options.get("train_size", DEFAULT_TRAIN_SIZE))
+
+    paths = {info["path"]: source_id for source_id, info in scanned.items()}
+    pending, total = [], 0
+    for file_path, chunks in iter_chunks_by_file(list(paths), workers=ingest_workers):
+        source_id = paths[file_path]
+        files[source_id] = manifest_entry(scanned[source_id], [c.metadata["chunk_id"] for c in chunks])
+        pending.extend(chunks)
+        if len(pending) >= (flush_size if vectorstore is not None else first_batch):
+            vectorstore = add_chunks(vectorstore, pending, embedding_model, embed_options, index_options)
+            total += len(pending)
+            pending = []
+            print(f"📦 Indexed {total} chunks from {len(files)} transcripts so far.")
+    if pending:
+        vectorstore = add_chunks(vectorstore, pending, embedding_model, embed_options, index_options)
+        total += len(pending)
+    print(f"✅ Indexed {total} chunks.")
+    return vectorstore
+
+
+def build_full(base_dir: Path, index_path: Path, embedding_model, embed_options=None, index_options=None,
+               company: str = None, **stream_options):
+    """Chunk, embed and index every transcript (of `company`, for a shard) from scratch."""
+    index_options = {"index_type": "flat", **(index_options or {})}
+    print(f"📚 Loading, chunking and embedding transcripts into a {index_options['index_type']} index...")
+    scanned = scan_transcripts(base_dir, {}, company)
+    files = {}
+    vectorstore = index_transcripts(None, scanned, files, embedding_model, embed_options,
+                                    index_options=index_options, **stream_options)
+    if vectorstore is None:
+        print("⚠️ No transcripts found, nothing to index.")
+        return None
+
+    print("💾 Saving FAISS index...")
+    save_index(vectorstore, index_path, files, index_options)
+    print(f"✅ FAISS index saved to: {index_path}")
+    return vectorstore
+
+
+def build_incremental(base_dir: Path, index_path: Path, embedding_model, embed_options=None, index_options=None,
+                      company: str = None, **stream_options):
+    """Embed only new or changed transcripts and drop chunks of changed or removed ones.
+
+    The existing index keeps the type and parameters it was built with; asking for a
+    different `index_type` triggers a full rebuild. `company` limits the index to that
+    company's transcripts (used for shards).
+    """
+    previous = load_manifest(index_path)
+    if not previous or not (Path(index_path) / "index.faiss").exists():
+        print("ℹ️ No manifest found next to the index, doing a full build.")
+        return build_full(base_dir, index_path, embedding_model, embed_options, index_options, company,
+                          **stream_options)
+
+    stored_options = load_index_params(index_path)
+    requested_type = (index_options or {}).get("index_type")
+    if requested_type and requested_type != stored_options["index_type"]:
+        print(f"ℹ️ Index type changes from {stored_options['index_type']} to {requested_type}, doing a full build.")
+        return build_full(base_dir, index_path, embedding_model, embed_options, index_options, company,
+                          **stream_options)
+    stored_options.pop("nlist", None)
+
+    scanned = scan_transcripts(base_dir, previous, company)
+    added = [s for s in scanned if s not in previous]
+    changed = [s for s in scanned if s in previous and previous[s]["hash"] != scanned[s]["hash"]]
+    removed = [s for s in previous if s not in scanned]
+    print(f"🔍 {len(added)} new, {len(changed)} changed, {len(removed)} removed transcripts.")
+
+    files = {s: previous[s] for s in scanned if s not in added and s not in changed}
+    for s in files:
+        # Keep mtimes current so the next run does not re-hash untouched files
+        files[s] = manifest_entry(scanned[s], files[s]["chunk_ids"])
+
+    if not (added or changed or removed):
+        save_manifest(files, index_path)
+        print("✅ Index is up to date.")
+        return None
+
+    vectorstore = load_vectorstore(index_path, embedding_model, writable=True)
+
+    stale_ids = [cid for s in changed + removed for cid in previous[s]["chunk_ids"]]
+    present = set(vectorstore.index_to_docstore_id.values())
+    stale_ids = [cid for cid in stale_ids if cid in present]
+    if stale_ids and not supports_delete(stored_options["index_type"]):
+        print(f"ℹ️ {stored_options['index_type']} indexes cannot delete vectors in place, doing a full build.")
+        return build_full(base_dir, index_path, embedding_model, embed_options, stored_options, company,
+                          **stream_options)
+    if stale_ids:
+        print(f"🗑️ Removing {len(stale_ids)} stale chunks...")
+        delete_chunks(vectorstore, stale_ids)
+
+    updates = {s: scanned[s] for s in added + changed}
+    if updates:
+        vectorstore = index_transcripts(vectorstore, updates, files, embedding_model, embed_options,
+                                        index_options=stored_options, **stream_options)
+
+    save_index(vectorstore, index_path, files, stored_options)
+    print(f"✅ FAISS index updated at: {index_path}")
+    return vectorstore
+
+
+def build_sharded(base_dir: Path, index_path: Path, embedding_model, embed_options=None, index_options=None,
+                  full: bool = False, companies=None, **stream_options):
+    """Build or update one index shard per company under `<index_path>/shards/<COMPANY>/`.
+
+    Each shard is a complete index folder with its own manifest, so one company's transcripts
+    can change, or its shard be rebuilt (`companies=[...]`), without touching the others;
+    running processes only reload the shards whose files changed. Shards of companies
+    that no longer have transcripts are removed.
+    """
+    found = sorted({shard_key(file_path) for file_path in iter_transcript_files(base_dir)})
+    existing = list_shards(index_path)
+    selected = [str(c).upper() for c in companies] if companies else sorted(set(found) | set(existing))
+    build = build_full if full else build_incremental
+
+    for company in selected:
+        path = shard_path(index_path, company)
+        if company not in found:
+            if path.exists():
+                print(f"🗑️ No transcripts left for {company}, removing its shard.")
+                shutil.rmtree(path)
+            else:
+                print(f"⚠️ No transcripts found for {company}.")
+            continue
+        print(f"\n🏢 Shard {company}")
+        path.mkdir(parents=True, exist_ok=True)
+        build(base_dir, path, embedding_model, embed_options, index_options, company, **stream_options)
+
+    if (Path(index_path) / "index.faiss").exists():
+        print(f"ℹ️ {index_path} still holds a single-index build; searches now use the shards, so it can be deleted.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or update the FAISS transcript index")
+    parser.add_argument("--full", action="store_true", help="Rebuild the whole index instead of updating it")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Chunks per embedding batch")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Embedding processes (1 = in-process)")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the embedding cache")
+    parser.add_argument("--ingest-workers", type=int, default=DEFAULT_INGEST_WORKERS, help="Processes reading and chunking transcripts")
+    parser.add_argument("--flush-size", type=int, default=DEFAULT_FLUSH_SIZE, help="Chunks held in memory before they are embedded and indexed")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, help="FAISS index type (default: flat, or the existing index's type)")
+    parser.add_argument("--nlist", type=int, help="IVF lists (default: derived from the training sample)")
+    parser.add_argument("--pq-m", type=int, help="IVF-PQ sub-quantizers; must divide the embedding dimension")
+    parser.add_argument("--hnsw-m", type=int, help="HNSW graph degree")
+    parser.add_argument("--train-size", type=int, default=DEFAULT_TRAIN_SIZE, help="Vectors sampled to train IVF / PQ")
+    parser.add_argument("--nprobe", type=int, default=DEFAULT_NPROBE, help="Default IVF lists probed per query")
+    parser.add_argument("--ef-search", type=int, default=DEFAULT_EF_SEARCH, help="Default HNSW efSearch per query")
+    parser.add_argument("--company", action="append", help="Only build or update this company's shard (repeatable)")
+    parser.add_argument("--monolithic", action="store_true", help="Build one index for all companies instead of per-company shards")
+    args = parser.parse_args()
+
+    # 🔎 Embedding model
+    embedding_model = get_embedding_model()
+    pool = make_embedding_pool(batch_size=args.batch_size, workers=args.workers) if args.workers > 1 else None
+    embed_options = {
+        "batch_size": args.batch_size,
+        "workers": args.workers,
+        "cache": None if args.no_cache else EmbeddingCache(EMBEDDING_CACHE_DIR),
+        "pool": pool,
+    }
+    stream_options = {"ingest_workers": args.ingest_workers, "flush_size": args.flush_size}
+    index_options = {
+        "index_type": args.index_type,
+        "nlist": args.nlist,
+        "pq_m": args.pq_m,
+        "hnsw_m": args.hnsw_m,
+        "train_size": args.train_size,
+        "nprobe": args.nprobe,
+        "ef_search": args.ef_search,
+    }
+    index_options = {key: value for key, value in index_options.items() if value is not None}
+
+    try:
+        if not args.monolithic:
+            build_sharded(BASE_DIR, INDEX_PATH, embedding_model, embed_options,
+                          {"index_type": "flat", **index_options} if args.full else index_options,
+                          full=args.full, companies=args.company, **stream_options)
+        elif args.full:
+            build_full(BASE_DIR, INDEX_PATH, embedding_model, embed_options,
+                       {"index_type": "flat", **index_options}, **stream_options)
+        else:
+            build_incremental(BASE_DIR, INDEX_PATH, embedding_model, embed_options, index_options, **stream_options)
+    finally:
+        if pool is not None:
+            pool.shutdown()
@@ -0,0 +1,255 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from index_registry import EMBEDDING_MODEL_NAME, get_embedding_model, registry
+
+# ⚙️ Defaults for the build-time embedding stage
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 1) // 2)
+
+# 🔎 Query embeddings kept in memory per process (most recently used first to survive)
+QUERY_CACHE_SIZE = 4096
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk cache of embeddings keyed by (model name, text hash).
+
+    Vectors are appended to a raw float32 file that is read back through `np.memmap`, so a
+    large cache costs page cache rather than heap. Row i of `vectors.f32` belongs to line i
+    of `keys.txt`; vectors are written before their keys, and an interrupted write is trimmed
+    back to the last complete row on the next load.
+    """
+
+    def __init__(self, cache_dir, model_name: str = EMBEDDING_MODEL_NAME):
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self.path = Path(cache_dir) / slug
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.model_name = model_name
+        self._lock = threading.Lock()
+        self._vectors = None
+        self.dim = None
+        self.rows = {}
+
+        meta_path = self.path / "meta.json"
+        if meta_path.exists():
+            with open(meta_path, "r", encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+        keys_path = self.path / "keys.txt"
+        if self.dim and keys_path.exists():
+            with open(keys_path, "r", encoding="utf-8") as f:
+                keys = f.read().split()
+            vectors_path = self.path / "vectors.f32"
+            stored_bytes = vectors_path.stat().st_size if vectors_path.exists() else 0
+            rows = min(len(keys), stored_bytes // (4 * self.dim))
+            if rows != len(keys) or rows * 4 * self.dim != stored_bytes:
+                # Interrupted write: trim both files back to the last complete row
+                with open(vectors_path, "ab") as f:
+                    f.truncate(rows * 4 * self.dim)
+                with open(keys_path, "w", encoding="utf-8") as f:
+                    f.write("".join(f"{key}\n" for key in keys[:rows]))
+            self.rows = {key: row for row, key in enumerate(keys[:rows])}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _matrix(self):
+        if self._vectors is None and self.rows:
+            self._vectors = np.memmap(self.path / "vectors.f32", dtype="float32", mode="r", shape=(len(self.rows), self.dim))
+        return self._vectors
+
+    def get_many(self, keys) -> dict:
+        """Return {key: vector} for the keys already in the cache."""
+        with self._lock:
+            matrix = self._matrix()
+            return {key: np.array(matrix[self.rows[key]]) for key in keys if key in self.rows}
+
+    def add(self, keys, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        with self._lock:
+            new = [(i, key) for i, key in enumerate(keys) if key not in self.rows]
+            if not new:
+                return
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                with open(self.path / "meta.json", "w", encoding="utf-8") as f:
+                    json.dump({"model_name": self.model_name, "dim": self.dim}, f)
+            rows = vectors[[i for i, _ in new]]
+            with open(self.path / "vectors.f32", "ab") as f:
+                f.write(rows.tobytes())
+            with open(self.path / "keys.txt", "a", encoding="utf-8") as f:
+                f.write("".join(f"{key}\n" for _, key in new))
+            for _, key in new:
+                self.rows[key] = len(self.rows)
+            self._vectors = None
+
+
+def normalize_query(text: str) -> str:
+    """Lowercase and collapse whitespace; MiniLM is uncased, so the embedding is unchanged."""
+    return re.sub(r"\s+", " ", text.lower()).strip()
+
+
+class QueryEmbedder:
+    """Embeds questions through an in-memory LRU, optionally backed by an EmbeddingCache on disk.
+
+    Keys are the hash of the normalized question, so repeated questions (Streamlit reruns,
+    evaluation sets) are encoded once per model; cache misses of a batch are encoded together.
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME, max_entries: int = QUERY_CACHE_SIZE, cache_dir=None):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.disk_cache = EmbeddingCache(cache_dir, model_name) if cache_dir else None
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def embed_queries(self, texts) -> np.ndarray:
+        """Embed many questions; returns a (len(texts), dim) float32 matrix."""
+        normalized = [normalize_query(t) for t in texts]
+        keys = [text_hash(t) for t in normalized]
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._lru.get(key)
+                if vector is not None:
+                    self._lru.move_to_end(key)
+                    found[key] = vector
+
+        missing = {key: text for key, text in zip(keys, normalized) if key not in found}
+        if missing and self.disk_cache is not None:
+            found.update(self.disk_cache.get_many(list(missing)))
+            missing = {key: text for key, text in missing.items() if key not in found}
+        if missing:
+            model = get_embedding_model(self.model_name)
+            vectors = np.asarray(model.embed_documents(list(missing.values())), dtype="float32")
+            found.update(zip(missing, vectors))
+            if self.disk_cache is not None:
+                self.disk_cache.add(list(missing), vectors)
+
+        with self._lock:
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+            for key in keys:
+                self._lru[key] = found[key]
+                self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+        if not keys:
+            return np.zeros((0, 0), dtype="float32")
+        return np.vstack([found[key] for key in keys]).astype("float32", copy=False)
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self.embed_queries([text])[0]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._lru)}
+
+
+def get_query_embedder(model_name: str = EMBEDDING_MODEL_NAME, cache_dir=None) -> QueryEmbedder:
+    """Process-wide QueryEmbedder for `model_name`, shared by the CLI, app and retriever."""
+    return registry.model(("query_embedder", model_name, str(cache_dir or "")),
+                          lambda: QueryEmbedder(model_name, cache_dir=cache_dir))
+
+
+# 👷 Per-process model used by pool workers
+_worker_model = None
+
+
+def _init_worker(model_name: str, batch_size: int, threads: int):
+    global _worker_model
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    _worker_model = HuggingFaceEmbeddings(model_name=model_name, encode_kwargs={"batch_size": batch_size})
+
+
+def _encode_batch(texts):
+    return np.asarray(_worker_model.embed_documents(texts), dtype="float32")
+
+
+def make_embedding_pool(model_name: str = EMBEDDING_MODEL_NAME, batch_size: int = DEFAULT_BATCH_SIZE,
+                        workers: int = DEFAULT_WORKERS):
+    """Start a process pool whose workers each load the embedding model once.
+
+    Pass it to `embed_texts(pool=...)` when embedding many batches so the model is not
+    reloaded for every call; the caller is responsible for shutting it down.
+    """
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                               initargs=(model_name, batch_size, threads))
+
+
+def embed_texts(texts, model_name: str = EMBEDDING_MODEL_NAME, batch_size: int = DEFAULT_BATCH_SIZE,
+                workers: int = DEFAULT_WORKERS, cache_dir=None, cache=None, pool=None,
+                verbose: bool = True) -> np.ndarray:
+    """Embed `texts` in batches, reusing cached vectors and sharding the rest across processes."""
+    keys = [text_hash(t) for t in texts]
+    if cache is None and cache_dir:
+        cache = EmbeddingCache(cache_dir, model_name)
+    found = cache.get_many(keys) if cache is not None else {}
+
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in found and key not in missing:
+            missing[key] = text
+    if verbose:
+        print(f"🧠 {len(texts) - len(missing)} of {len(texts)} chunks served from the embedding cache.")
+
+    todo = list(missing.items())
+    batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+    done = 0
+
+    def collect(batch, vectors):
+        nonlocal done
+        batch_keys = [key for key, _ in batch]
+        found.update(zip(batch_keys, vectors))
+        if cache is not None:
+            cache.add(batch_keys, vectors)
+        done += len(batch)
+        if verbose:
+            print(f"🔧 Embedded {done}/{len(todo)} chunks", end="\r")
+
+    if batches and (pool is not None or workers > 1):
+        own_pool = pool is None
+        pool = pool or make_embedding_pool(model_name, batch_size, workers)
+        try:
+            futures = {pool.submit(_encode_batch, [t for _, t in batch]): batch for batch in batches}
+            for future in as_completed(futures):
+                collect(futures[future], future.result())
+        finally:
+            if own_pool:
+                pool.shutdown()
+    elif batches:
+        model = get_embedding_model(model_name)
+        for batch in batches:
+            collect(batch, np.asarray(model.embed_documents([t for _, t in batch]), dtype="float32"))
+    if verbose and batches:
+        print()
+
+    if not keys:
+        return np.zeros((0, cache.dim if cache is not None and cache.dim else 0), dtype="float32")
+    return np.vstack([found[key] for key in keys]).astype("float32", copy=False)
+
+
+def embed_documents(docs, **kwargs):
+    """Embed LangChain documents; returns (text, vector) pairs ready for FAISS.from_embeddings."""
+    texts = [doc.page_content for doc in docs]
+    vectors = embed_texts(texts, **kwargs)
+    return list(zip(texts, vectors.tolist()))
@@ -1,15 +1,33 @@
 import streamlit as st
-import pandas as pd
-import matplotlib.pyplot as plt
+from scoring import EvaluationHistory, EVAL_HISTORY_DIR
+
+
+@st.cache_resource(show_spinner=False)
+def get_history() -> EvaluationHistory:
+    """One history per server process; each rerun only reads runs recorded since the last one."""
+    return EvaluationHistory(EVAL_HISTORY_DIR)
+
 
 # Load results
-df = pd.read_csv("evaluation_results.csv")
+history = get_history().refresh()
+runs = history.summaries()
 
 st.title("📊 RAG System Evaluation Dashboard")
 
+if runs.empty:
+    st.error("❌ No evaluation runs recorded yet. Run evaluate_rag.py (or evaluate_rag.py --rescore) first.")
+    st.stop()
+
+# Filters
+st.sidebar.header("🔍 Filter Questions")
+run_ids = runs["run_id"].tolist()[::-1]
+selected_run = st.sidebar.selectbox("Run", run_ids)
+df = history.run(selected_run)
+selected_q = st.sidebar.selectbox("Choose a question", ["All"] + df["question"].tolist())
+
 # Show table
 st.subheader("🔍 Evaluation Summary")
-st.dataframe(df.style.background_gradient(cmap="YlGn"))
+st.dataframe(df[["question", "keywords_matched", "text_similarity", "cached", "retrieval_ms", "generation_ms"]])
 
 # Show average scores
 st.subheader("📈 Average Metrics")
@@ -19,17 +37,13 @@ col2.metric("Avg. Text Similarity", f"{df['text_similarity'].mean():.2f}")
 
 # Plot scores
 st.subheader("📉 Evaluation Scores by Question")
+st.bar_chart(df.set_index("question")[["keywords_matched", "text_similarity"]])
 
-fig, ax = plt.subplots(figsize=(10, 5))
-df.plot.bar(x="question", y=["keywords_matched", "text_similarity"], ax=ax)
-plt.xticks(rotation=45, ha="right")
-plt.ylabel("Score")
-plt.ylim(0, 1)
-st.pyplot(fig)
+# Scores across runs
+st.subheader("🕓 Scores Across Runs")
+st.line_chart(runs.set_index("run_at")[["keywords_matched", "text_similarity"]])
+st.dataframe(runs.round(3))
 
-# Filters
-st.sidebar.header("🔍 Filter Questions")
-selected_q = st.sidebar.selectbox("Choose a question", ["All"] + df["question"].tolist())
 if selected_q != "All":
     st.write("### 🎯 Selected Question")
     st.write(df[df["question"] == selected_q])
@@ -1,46 +1,187 @@
+import os
 import json
 import csv
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import List, Dict
-from difflib import SequenceMatcher
+import pandas as pd
 from rag_pipeline_gemini import rag_query
+from shard_router import route, load_shards
+from langchain.memory import ConversationBufferMemory
+from rate_limit import RateLimiter
+from scoring import keyword_coverage, cosine_similarity, score_answers, record_run
 
 # Config
 INDEX_PATH = Path(r"C:Navigate Labs\rag_mnc_insights\data\outputs\mnc_faiss_index")
 EVAL_FILE = Path(r"C:Navigate Labs\rag_mnc_insights\evaluation_samples.json")
+RESULTS_FILE = "evaluation_results.csv"
+RESULT_FIELDS = [
+    "sample_id", "question", "keywords_matched", "text_similarity", "rag_answer",
+    "cached", "retrieval_ms", "generation_ms", "prompt_tokens",
+]
+
+# ⚙️ Runner defaults
+EVAL_WORKERS = 4
+GEMINI_REQUESTS_PER_MINUTE = 60
+MAX_RETRIES = 3
 
 
 def keyword_match(answer: str, keywords: List[str]) -> float:
     """Returns the proportion of expected keywords found in the answer."""
-    matches = sum(1 for kw in keywords if kw.lower() in answer.lower())
-    return matches / len(keywords) if keywords else 0.0
+    return float(keyword_coverage([answer], [keywords])[0])
 
 
 def similarity_score(a: str, b: str) -> float:
-    """Computes a rough similarity score between two strings."""
-    return SequenceMatcher(None, a.lower(), b.lower()).ratio()
+    """Embedding cosine similarity of two strings; use scoring.score_answers to score many at once."""
+    return float(cosine_similarity([a], [b])[0])
+
+
+def score_rows(rows: List[Dict], samples: List[Dict]) -> List[Dict]:
+    """Fill in the keyword and similarity scores of answered rows, as one batch."""
+    expected = [samples[row["sample_id"]] for row in rows]
+    scores = score_answers([row["rag_answer"] for row in rows],
+                           [sample.get("expected_answer", "") for sample in expected],
+                           [sample.get("expected_keywords", []) for sample in expected])
+    for i, row in enumerate(rows):
+        row["keywords_matched"] = round(float(scores["keywords_matched"][i]), 4)
+        row["text_similarity"] = round(float(scores["text_similarity"][i]), 4)
+    return rows
+
+
+def evaluate_sample(idx: int, sample: Dict, limiter=None, use_cache=True) -> Dict:
+    """Answer one sample with its own, empty chat memory; scores are filled in by score_rows."""
+    conversation = ConversationBufferMemory(return_messages=True)
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            result = rag_query(
+                INDEX_PATH, sample['question'], streamlit_mode=True,
+                use_cache=use_cache, conversation=conversation, llm_limiter=limiter
+            )
+            break
+        except Exception as e:
+            if attempt == MAX_RETRIES:
+                raise
+            print(f"⚠️ Sample {idx+1} failed ({e}), retrying...")
+            conversation.clear()
+            time.sleep(2 ** attempt)
+
+    answer = result["answer"]
+    return {
+        "sample_id": idx,
+        "question": sample['question'],
+        "keywords_matched": None,
+        "text_similarity": None,
+        "rag_answer": answer,
+        "cached": result["cached"],
+        "retrieval_ms": round(result["retrieval_ms"], 1),
+        "generation_ms": round(result["generation_ms"], 1),
+        "prompt_tokens": result["prompt_tokens"],
+    }
+
+
+def checkpoint_path(filename=RESULTS_FILE) -> Path:
+    """Where a run writes its results until it finishes; only a leftover checkpoint is ever resumed."""
+    return Path(f"{filename}.partial")
+
+
+def checkpoint_fields(checkpoint) -> list:
+    """Header of a checkpoint file, or None when there is no checkpoint."""
+    if not Path(checkpoint).exists():
+        return None
+    with open(checkpoint, "r", newline='', encoding="utf-8") as f:
+        return csv.DictReader(f).fieldnames
+
 
+def completed_sample_ids(checkpoint) -> set:
+    """Sample ids already written by an unfinished run."""
+    if not Path(checkpoint).exists():
+        return set()
+    with open(checkpoint, "r", newline='', encoding="utf-8") as f:
+        return {int(row["sample_id"]) for row in csv.DictReader(f) if row.get("sample_id")}
 
-def evaluate_rag(samples: List[Dict]):
-    results = []
-    for idx, sample in enumerate(samples):
-        print(f"\n🔎 Evaluating Sample {idx+1}: {sample['question']}")
-        answer = rag_query(INDEX_PATH, sample['question'], fiscal_filter=True, return_answer_only=True)
 
-        kw_score = keyword_match(answer, sample.get("expected_keywords", []))
-        sim_score = similarity_score(answer, sample.get("expected_answer", ""))
+def evaluate_rag(samples: List[Dict], workers=EVAL_WORKERS, requests_per_minute=GEMINI_REQUESTS_PER_MINUTE,
+                 filename=RESULTS_FILE, resume=True, use_cache=True):
+    """Evaluate samples in parallel and write the results to `filename`.
 
-        results.append({
-            "question": sample['question'],
-            "keywords_matched": kw_score,
-            "text_similarity": sim_score,
-            "rag_answer": answer
-        })
+    Each answer is written to a checkpoint next to `filename` as soon as it arrives, with
+    empty scores. Once every sample is answered, all answers are scored in one batch and
+    written to `filename`, and the results are added to the evaluation history as one run. A run that was
+    interrupted, or had failed samples, leaves its checkpoint behind. With `resume`, the
+    next run picks up from there. A finished run is never resumed, so every normal run asks
+    every question again.
+    """
+    # Load the index once up front; every rag_query call below reuses the cached copy
+    load_shards(route(INDEX_PATH))
 
-    return results
+    checkpoint = checkpoint_path(filename)
+    fields = checkpoint_fields(checkpoint)
+    if fields is not None and resume and fields != RESULT_FIELDS:
+        print(f"⚠️ {checkpoint} has different columns than this version writes, starting a fresh run.")
+    if fields is not None and (not resume or fields != RESULT_FIELDS):
+        checkpoint.unlink()
+    done = completed_sample_ids(checkpoint)
+    pending = [(idx, sample) for idx, sample in enumerate(samples) if idx not in done]
+    if done:
+        print(f"⏭️ Resuming: {len(done)} samples already evaluated, {len(pending)} to go.")
 
+    limiter = RateLimiter(requests_per_minute / 60, burst=workers)
+    results, failed = [], 0
 
-def save_results(results: List[Dict], filename="evaluation_results.csv"):
+    with open(checkpoint, "a", newline='', encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS)
+        if f.tell() == 0:
+            writer.writeheader()
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(evaluate_sample, idx, sample, limiter, use_cache): idx for idx, sample in pending}
+            for future in as_completed(futures):
+                idx = futures[future]
+                try:
+                    row = future.result()
+                except Exception as e:
+                    print(f"❌ Sample {idx+1} failed: {e} (it will be retried on the next run)")
+                    failed += 1
+                    continue
+                writer.writerow(row)
+                f.flush()
+                results.append(row)
+                print(f"🔎 Evaluated Sample {idx+1}: {row['question']} "
+                      f"(retrieval {row['retrieval_ms']} ms, generation {row['generation_ms']} ms)")
+
+    if failed:
+        print(f"\n⚠️ {failed} samples failed; run again to retry them (results so far are kept in {checkpoint}).")
+        return results
+
+    # A scoring error leaves the checkpoint in place; the next run then only re-scores it
+    frame = score_results_file(checkpoint, samples, filename)
+    checkpoint.unlink()
+    print(f"\n✅ Results saved to: {filename}")
+    print(f"📈 Run recorded in: {record_run(frame)}")
+    return frame.to_dict("records")
+
+
+def score_results_file(source, samples: List[Dict], filename=RESULTS_FILE) -> pd.DataFrame:
+    """Score every answer in `source` as one batch and write the scored results to `filename` (atomically)."""
+    frame = pd.read_csv(source).fillna({"rag_answer": ""})
+    frame = pd.DataFrame(score_rows(frame.to_dict("records"), samples), columns=RESULT_FIELDS)
+    tmp_path = Path(f"{filename}.tmp")
+    frame.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, filename)
+    return frame
+
+
+def rescore_results(samples: List[Dict], filename=RESULTS_FILE):
+    """Re-score the answers already in `filename` (no Gemini calls) and record them as a new run."""
+    frame = score_results_file(filename, samples, filename)
+    print(f"✅ Re-scored {len(frame)} answers in {filename}")
+    print(f"📈 Run recorded in: {record_run(frame)}")
+    return frame
+
+
+def save_results(results: List[Dict], filename=RESULTS_FILE):
     keys = results[0].keys()
     with open(filename, "w", newline='', encoding="utf-8") as f:
         writer = csv.DictWriter(f, fieldnames=keys)
@@ -53,5 +194,17 @@ if __name__ == "__main__":
     with open(EVAL_FILE, "r", encoding="utf-8") as f:
         samples = json.load(f)
 
-    results = evaluate_rag(samples)
-    save_results(results)
+    parser = argparse.ArgumentParser(description="Evaluate the RAG pipeline against evaluation_samples.json")
+    parser.add_argument("--workers", type=int, default=EVAL_WORKERS, help="Samples evaluated in parallel")
+    parser.add_argument("--rpm", type=int, default=GEMINI_REQUESTS_PER_MINUTE, help="Max Gemini requests per minute")
+    parser.add_argument("--output", default=RESULTS_FILE, help="CSV file the results are written to")
+    parser.add_argument("--fresh", action="store_true", help="Discard an unfinished run instead of resuming it")
+    parser.add_argument("--no-cache", action="store_true", help="Always ask Gemini, bypassing the answer cache")
+    parser.add_argument("--rescore", action="store_true", help="Only re-score the answers already in --output")
+    args = parser.parse_args()
+
+    if args.rescore:
+        rescore_results(samples, filename=args.output)
+    else:
+        evaluate_rag(samples, workers=args.workers, requests_per_minute=args.rpm, filename=args.output,
+                     resume=not args.fresh, use_cache=not args.no_cache)
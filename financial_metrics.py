@@ -0,0 +1,319 @@
+import os
+import re
+import argparse
+import sqlite3
+import threading
+from pathlib import Path
+from index_registry import registry, get_vector_db
+from metadata_index import metadata_keys, COMPANY_ALIASES
+from shard_router import route
+
+# 📁 Stored next to index.faiss / chunks.sqlite inside the FAISS index folder
+FINANCIAL_METRICS_FILE = "financial_metrics.sqlite"
+
+# 📊 Metrics extracted from the transcripts: name → (pattern in transcript text, unit of the reported value)
+METRICS = {
+    "revenue": (r"\b(?:total |net )?(?:revenues?|sales)\b", "USD"),
+    "operating_income": (r"\boperating income\b", "USD"),
+    "net_income": (r"\bnet income\b", "USD"),
+    "eps": (r"\b(?:diluted )?(?:earnings per share|eps)\b", "USD/share"),
+    "gross_margin": (r"\bgross margins?(?: percentage)?\b", "%"),
+    "operating_margin": (r"\boperating margins?(?: percentage)?\b", "%"),
+}
+GROWTH_SUFFIX = "_growth"
+
+# 💬 How each metric is asked about, longest phrases first so "operating margin" never reads as "margin"
+QUESTION_TERMS = (
+    ("earnings per share", "eps"), ("operating income", "operating_income"), ("operating margin", "operating_margin"),
+    ("gross margin", "gross_margin"), ("net income", "net_income"), ("top line", "revenue"), ("revenue", "revenue"),
+    ("sales", "revenue"), ("eps", "eps"), ("profit", "net_income"),
+)
+
+# ⚙️ Extraction and answering limits
+VALUE_WINDOW_CHARS = 80         # how far after a metric name its value may appear
+MAX_FACT_ROWS = 12              # periods listed in one numeric answer
+
+AMOUNT = re.compile(r"\$\s?(\d[\d,]*(?:\.\d+)?)(?:\s*(trillion|billion|million|thousand|bn)\b)?", re.IGNORECASE)
+PERCENT = re.compile(r"(\d+(?:\.\d+)?)\s*(?:%|percent\b)", re.IGNORECASE)
+GROWTH = re.compile(r"\b(grew|growth of|increase of|increased|rose|up|decline of|declined|decreased|fell|down)\s+"
+                    r"(?:by\s+)?(?:(?:about|approximately|nearly|almost|over|roughly)\s+)?"
+                    r"(\d+(?:\.\d+)?)\s*(?:%|percent\b)", re.IGNORECASE)
+# "increased $2.5 billion", "up $3 billion": a dollar change, not the level of the metric
+CHANGE_BEFORE = re.compile(r"\b(?:grew|growth of|increase of|increased|rose|up|decline of|declined|decreased|fell|"
+                           r"down|higher|lower|improved|improvement of)\s+(?:by\s+)?"
+                           r"(?:(?:about|approximately|nearly|almost|over|roughly)\s+)?$", re.IGNORECASE)
+GROWTH_QUESTION = re.compile(r"\b(grow|grew|growth|increase|increased|change|changed|decline|declined|y/?oy)\b|"
+                             r"year[- ]over[- ]year", re.IGNORECASE)
+# Questions asking for reasons or commentary need the transcripts, not just the figures
+NARRATIVE_QUESTION = re.compile(r"\b(why|explain|drivers?|drove|driven|reasons?|outlook|guidance|expect\w*|"
+                                r"strateg\w+|commentary|impact\w*|affect\w*|said|say)\b", re.IGNORECASE)
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z])|\n+")
+# Words right before a metric ("commercial cloud revenue") or after "from / in / for" ("revenue from Azure")
+SEGMENT_BEFORE = re.compile(r"(?<![\w&'-])((?:[\w&'-]+\s+){1,3})$")
+SEGMENT_AFTER = re.compile(r"\s+(?:from|in|for)\s+(?:the\s+|our\s+)?")
+WORD = re.compile(r"[\w&'-]+")
+# Mentions that are not the reported metric: costs, balance-sheet items and sales functions
+NOT_METRIC_BEFORE = re.compile(r"\b(?:costs? of|unearned|deferred|backlog of)\s+$", re.IGNORECASE)
+NOT_METRIC_AFTER = re.compile(r"^\s+(?:and marketing|force|team|teams|cycle|tax|taxes|per employee)\b", re.IGNORECASE)
+# Forward-looking sentences state guidance, not results, and often give ranges
+GUIDANCE = re.compile(r"\b(?:expect\w*|guidance|outlook|forecast\w*|anticipat\w+|projected|projections?|range|"
+                      r"next quarter|next year|going forward|will be|should be)\b", re.IGNORECASE)
+RANGE_AFTER = re.compile(r"^\s*(?:to|and|-|–)\s*\$?\d", re.IGNORECASE)
+PERIOD_WORD = re.compile(r"q[1-4]|fy\d*|h[12]|\d+")
+NOT_METRIC_QUESTION = re.compile(r"\b(?:costs? of|unearned|deferred|backlog of)\s+(?:revenues?|sales)\b|"
+                                 r"\bsales\s+(?:and marketing|force|teams?|cycle)\b")
+SCALES = {"trillion": 1e12, "billion": 1e9, "bn": 1e9, "million": 1e6, "thousand": 1e3}
+NEGATIVE_GROWTH = {"decline of", "declined", "decreased", "fell", "down"}
+
+# Words next to a metric that end a segment name rather than being part of it
+NOT_SEGMENTS = frozenset(
+    "a an the our its their this that these those we it they and or but of in for with to from on at by as "
+    "is are was were be been being has have had grew grow growing increased rose declined decreased delivered "
+    "reported generated drove saw total overall consolidated quarterly quarter year annual fiscal company "
+    "gaap non-gaap net record strong solid higher lower double-digit all business segment segments period"
+    .split()
+) | frozenset(COMPANY_ALIASES) | frozenset(ticker.lower() for ticker in COMPANY_ALIASES.values())
+
+_metric_patterns = {metric: re.compile(pattern, re.IGNORECASE) for metric, (pattern, _) in METRICS.items()}
+
+
+def _is_segment_word(word: str) -> bool:
+    word = re.sub(r"'s$", "", word).lower()
+    return word not in NOT_SEGMENTS and not PERIOD_WORD.fullmatch(word)
+
+
+def _segment(prefix: str, window: str):
+    """Business segment a metric mention refers to, and where its value window starts.
+
+    "Azure revenue", "commercial cloud revenue" and "revenue from Azure" name segments; ""
+    means a company total. Anything that is not clearly a total counts as a segment, so
+    segment figures are never reported as the company's.
+    """
+    match = SEGMENT_BEFORE.search(prefix)
+    before = []
+    for word in reversed(match.group(1).split() if match else []):
+        if not _is_segment_word(word):
+            break
+        before.insert(0, re.sub(r"'s$", "", word).lower())
+    if before:
+        return " ".join(before), 0
+
+    match = SEGMENT_AFTER.match(window)
+    after, end = [], 0
+    position = match.end() if match else len(window)
+    for _ in range(3):
+        word = WORD.match(window, position)
+        if not word or not _is_segment_word(word.group(0)):
+            break
+        after.append(word.group(0).lower())
+        end = word.end()
+        position = end + len(window[end:]) - len(window[end:].lstrip(" "))
+    return (" ".join(after), end) if after else ("", 0)
+
+
+def extract_facts(text: str) -> list:
+    """Numeric facts stated in a chunk: dicts with metric, segment, value, unit, raw text and sentence.
+
+    A metric takes the first matching figure after its name and before the next metric
+    named in the same sentence: a dollar amount for revenue / income / EPS, a percentage
+    for margins, and "up / grew / declined N%" becomes `<metric>_growth`. Costs ("cost of
+    revenue"), balance-sheet items ("unearned revenue"), guidance, ranges and dollar changes
+    ("increased $2.5 billion") are skipped.
+    """
+    facts = []
+    for sentence in SENTENCE_END.split(text):
+        if GUIDANCE.search(sentence):
+            continue
+        mentions = sorted(
+            (match.start(), match.end(), metric)
+            for metric, pattern in _metric_patterns.items() for match in pattern.finditer(sentence)
+        )
+        for i, (start, end, metric) in enumerate(mentions):
+            if NOT_METRIC_BEFORE.search(sentence[:start]) or NOT_METRIC_AFTER.match(sentence[end:]):
+                continue
+            stop = min(mentions[i + 1][0] if i + 1 < len(mentions) else len(sentence), end + VALUE_WINDOW_CHARS)
+            window = sentence[end:stop]
+            segment, offset = _segment(sentence[:start], window)
+            window = window[offset:]
+            unit = METRICS[metric][1]
+
+            growth = GROWTH.search(window)
+            if growth:
+                value = float(growth.group(2))
+                facts.append({"metric": metric + GROWTH_SUFFIX, "segment": segment,
+                              "value": -value if growth.group(1).lower() in NEGATIVE_GROWTH else value,
+                              "unit": "%", "raw": growth.group(0), "sentence": sentence.strip()})
+
+            if unit == "%":
+                # A percentage after "up / grew" is a change in the margin, not the margin itself
+                percent = next((m for m in PERCENT.finditer(window)
+                                if not growth or not growth.start() <= m.start() < growth.end()), None)
+                if percent:
+                    facts.append({"metric": metric, "segment": segment, "value": float(percent.group(1)),
+                                  "unit": unit, "raw": percent.group(0), "sentence": sentence.strip()})
+                continue
+
+            amount = next((m for m in AMOUNT.finditer(window) if not CHANGE_BEFORE.search(window[:m.start()])), None)
+            if amount and not RANGE_AFTER.match(window[amount.end():]) and not (unit == "USD/share" and amount.group(2)):
+                value = float(amount.group(1).replace(",", "")) * SCALES.get((amount.group(2) or "").lower(), 1)
+                facts.append({"metric": metric, "segment": segment, "value": value, "unit": unit,
+                              "raw": amount.group(0), "sentence": sentence.strip()})
+    return facts
+
+
+def build_financial_metrics(vectorstore, fiscal: bool = True) -> list:
+    """Extract the facts of every chunk in a FAISS store, keyed like the metadata index."""
+    from chunk_store import iter_documents
+
+    rows = []
+    for doc_id, doc in iter_documents(vectorstore):
+        metadata = getattr(doc, "metadata", None) or {}
+        company, year, quarter = metadata_keys(metadata, fiscal=fiscal)
+        for fact in extract_facts(doc.page_content):
+            rows.append((company, year, quarter, fact["metric"], fact["segment"], fact["value"], fact["unit"],
+                         fact["raw"], fact["sentence"], doc_id, metadata.get("filename", "Unknown"),
+                         metadata.get("chunk_index", -1)))
+    return rows
+
+
+def save_financial_metrics(rows: list, index_path) -> Path:
+    """Write the facts table (atomically) next to the index."""
+    path = Path(index_path) / FINANCIAL_METRICS_FILE
+    tmp_path = path.with_suffix(".tmp")
+    if tmp_path.exists():
+        tmp_path.unlink()
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute(
+            "CREATE TABLE facts (company TEXT, year TEXT, quarter TEXT, metric TEXT, segment TEXT, value REAL, "
+            "unit TEXT, raw TEXT, sentence TEXT, doc_id TEXT, filename TEXT, chunk_index INTEGER)"
+        )
+        conn.executemany("INSERT INTO facts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.execute("CREATE INDEX facts_by_company ON facts (company, metric, year, quarter)")
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+    return path
+
+
+class MetricsStore:
+    """Read-only view of financial_metrics.sqlite; one connection per thread, like the chunk store."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"{self.path.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def facts(self, company, metrics, year=None, quarter=None) -> list:
+        """Every extracted mention of `metrics` for a company, optionally for one year / quarter."""
+        sql = f"SELECT * FROM facts WHERE company = ? AND metric IN ({','.join('?' * len(metrics))})"
+        params = [str(company).upper(), *metrics]
+        if year:
+            sql += " AND year = ?"
+            params.append(str(year))
+        if quarter:
+            sql += " AND quarter = ?"
+            params.append(str(quarter).upper())
+        return [dict(row) for row in self._conn().execute(sql, params)]
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM facts").fetchone()[0]
+
+
+def load_financial_metrics(index_path):
+    """Open the facts table saved next to a FAISS index, or None for indexes built without one."""
+    path = Path(index_path) / FINANCIAL_METRICS_FILE
+    if not path.exists():
+        return None
+    return MetricsStore(path)
+
+
+def get_financial_metrics(index_path):
+    """MetricsStore of a shard's facts table (None without one), opened once per process and reopened after a rebuild."""
+    return registry.get(index_path, name="financial_metrics", loader=load_financial_metrics)
+
+
+def metrics_in_question(question: str) -> list:
+    """Metrics a question asks for, as fact metric names ("revenue growth" → "revenue_growth").
+
+    "Cost of revenue", "unearned revenue" or "sales and marketing" are not metrics of the table.
+    """
+    text = NOT_METRIC_QUESTION.sub(" ", question.lower())
+    metrics = []
+    for phrase, metric in QUESTION_TERMS:
+        if re.search(rf"\b{re.escape(phrase)}\b", text):
+            metrics.append(metric)
+            text = text.replace(phrase, " ")
+    metrics = list(dict.fromkeys(metrics))
+    if GROWTH_QUESTION.search(question):
+        return [metric + GROWTH_SUFFIX for metric in metrics]
+    return metrics
+
+
+def select_facts(mentions: list, question: str) -> list:
+    """One fact per (company, period, metric): the value stated most often, earliest mention first.
+
+    Segment figures are only used when the question names the segment; otherwise company totals.
+    Each fact lists its `other_values`; a fact with any is not reliable enough to state on its own.
+    """
+    text = question.lower()
+    segments = {m["segment"] for m in mentions if m["segment"] and re.search(rf"\b{re.escape(m['segment'])}\b", text)}
+    groups = {}
+    for mention in mentions:
+        if (mention["segment"] in segments) if segments else not mention["segment"]:
+            key = (mention["company"], mention["year"], mention["quarter"], mention["metric"], mention["segment"])
+            groups.setdefault(key, []).append(mention)
+
+    selected = []
+    for key, group in groups.items():
+        counts = {}
+        for mention in group:
+            counts[mention["value"]] = counts.get(mention["value"], 0) + 1
+        best = max(counts, key=lambda value: counts[value])
+        fact = min((m for m in group if m["value"] == best), key=lambda m: (m["filename"], m["chunk_index"]))
+        other_values = sorted((value for value in counts if value != best), key=lambda value: -counts[value])
+        selected.append(dict(fact, mentions=counts[best], other_values=other_values))
+    return sorted(selected, key=lambda f: (f["company"], f["metric"], f["segment"], f["year"], f["quarter"]))
+
+
+def format_value(fact: dict) -> str:
+    if fact["unit"] == "%":
+        return f"{fact['value']:+g}%" if fact["metric"].endswith(GROWTH_SUFFIX) else f"{fact['value']:g}%"
+    for name, scale in (("trillion", 1e12), ("billion", 1e9), ("million", 1e6)):
+        if fact["unit"] == "USD" and abs(fact["value"]) >= scale:
+            return f"${fact['value'] / scale:,.2f}".rstrip("0").rstrip(".") + f" {name}"
+    return f"${fact['value']:,.2f}"
+
+
+def format_fact(fact: dict) -> str:
+    """One line per fact, with the chunk it was read from."""
+    metric = fact["metric"].replace("_", " ").replace("eps", "EPS")
+    subject = f"{fact['company']} {fact['segment']} {metric}" if fact["segment"] else f"{fact['company']} {metric}"
+    line = f"- {subject}, {fact['quarter']} {fact['year']}: {format_value(fact)} [{fact['doc_id']}]"
+    if fact.get("other_values"):
+        line += " (also stated: " + ", ".join(format_value(dict(fact, value=v)) for v in fact["other_values"]) + ")"
+    return line
+
+
+def is_narrative_question(question: str) -> bool:
+    return bool(NARRATIVE_QUESTION.search(question))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract the financial facts table of an existing index (no re-embedding)")
+    parser.add_argument("index", help="FAISS index folder")
+    args = parser.parse_args()
+
+    for shard in route(args.index):
+        rows = build_financial_metrics(get_vector_db(shard))
+        save_financial_metrics(rows, shard)
+        print(f"📊 {len(rows)} facts extracted into {Path(shard) / FINANCIAL_METRICS_FILE}")
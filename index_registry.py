@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+from pathlib import Path
+
+# 🧠 Embedding model shared by every index built with embed_store.py
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+# ⏱️ How long (seconds) a fingerprint check is trusted before the files are stat'ed again
+FINGERPRINT_TTL = 2.0
+
+
+def index_fingerprint(index_path) -> tuple:
+    """Cheap fingerprint of an index folder: (name, mtime, size) of each file directly inside it."""
+    path = Path(index_path)
+    if not path.is_dir():
+        return ()
+    entries = []
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_file():
+                stat = entry.stat()
+                entries.append((entry.name, stat.st_mtime_ns, stat.st_size))
+    return tuple(sorted(entries))
+
+
+class IndexRegistry:
+    """Thread-safe, process-wide cache of loaded FAISS indexes and embedding models.
+
+    Resources are keyed by the resolved index path plus a resource name, so the vector
+    store and any side files (metadata index, etc.) of one folder are invalidated together
+    when the folder's fingerprint changes.
+    """
+
+    def __init__(self, fingerprint_ttl: float = FINGERPRINT_TTL):
+        self.fingerprint_ttl = fingerprint_ttl
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._entries = {}
+        self._models = {}
+
+    @staticmethod
+    def _key(index_path) -> str:
+        return str(Path(index_path).resolve())
+
+    def embedding_model(self, model_name: str = EMBEDDING_MODEL_NAME):
+        """Return the embedding model for `model_name`, loading it on first use."""
+        def load():
+            # Imported here: sentence-transformers pulls in torch, which takes seconds to import
+            from langchain_community.embeddings import HuggingFaceEmbeddings
+            return HuggingFaceEmbeddings(model_name=model_name)
+
+        return self.model(model_name, load)
+
+    def model(self, key, factory):
+        """Return the model cached under `key`, creating it with `factory()` on first use."""
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                lock = self._load_locks.setdefault(("model", key), threading.Lock())
+        if model is not None:
+            return model
+        with lock:
+            with self._lock:
+                model = self._models.get(key)
+            if model is None:
+                model = factory()
+                with self._lock:
+                    self._models[key] = model
+        return model
+
+    def get(self, index_path, name: str = "vector_db", loader=None):
+        """Return the cached resource `name` for `index_path`, (re)loading it when stale."""
+        loader = loader or self._load_vector_db
+        key = (self._key(index_path), name)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            lock = self._load_locks.setdefault(key, threading.Lock())
+        if entry is not None and now - entry["checked_at"] < self.fingerprint_ttl:
+            return entry["value"]
+
+        with lock:
+            fingerprint = index_fingerprint(index_path)
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry["fingerprint"] == fingerprint:
+                    entry["checked_at"] = time.monotonic()
+                    return entry["value"]
+                # Drop the stale copy before loading the new one so both never sit in memory together
+                self._entries.pop(key, None)
+
+            value = loader(index_path)
+            with self._lock:
+                self._entries[key] = {
+                    "value": value,
+                    "fingerprint": fingerprint,
+                    "checked_at": time.monotonic(),
+                }
+            return value
+
+    def invalidate(self, index_path=None):
+        """Forget cached resources for one index folder (and any shard folders inside it), or for every folder."""
+        with self._lock:
+            if index_path is None:
+                self._entries.clear()
+                return
+            path_key = self._key(index_path)
+            for key in [k for k in self._entries if k[0] == path_key or k[0].startswith(path_key + os.sep)]:
+                del self._entries[key]
+
+    def reload(self, index_path, name: str = "vector_db", loader=None):
+        """Explicitly drop and reload the resources for `index_path`."""
+        self.invalidate(index_path)
+        return self.get(index_path, name=name, loader=loader)
+
+    def _load_vector_db(self, index_path):
+        # faiss and LangChain are only imported once an index is actually needed
+        from ann_index import load_index_params, apply_index_defaults, DEFAULT_NPROBE, DEFAULT_EF_SEARCH
+        from chunk_store import load_vectorstore
+
+        # Memory-mapped index + SQLite chunk store: no unpickling, pages shared between processes
+        db = load_vectorstore(index_path, self.embedding_model())
+        # Query-time defaults (nprobe / efSearch) saved at build time
+        params = load_index_params(index_path)
+        apply_index_defaults(db.index, params.get("nprobe", DEFAULT_NPROBE), params.get("ef_search", DEFAULT_EF_SEARCH))
+        return db
+
+
+registry = IndexRegistry()
+
+
+def get_embedding_model(model_name: str = EMBEDDING_MODEL_NAME):
+    return registry.embedding_model(model_name)
+
+
+def get_vector_db(index_path):
+    return registry.get(index_path)
+
+
+def reload_index(index_path=None):
+    """Drop cached copies of an index (or all indexes) and load it again if a path is given.
+
+    Returns the reloaded vector stores: one per shard for sharded indexes.
+    """
+    if index_path is None:
+        registry.invalidate()
+        return None
+    # Imported here: shard_router builds on this module
+    from shard_router import route
+    registry.invalidate(index_path)
+    return [registry.get(shard) for shard in route(index_path)]
@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+import numpy as np
+
+# ⏱️ Latency histogram buckets (milliseconds) used for the Prometheus metrics
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+RECENT_TRACES = 200             # finished rag_query traces kept in memory for the dashboard
+RECENT_SAMPLES = 1000           # per-stage durations kept for percentiles
+
+# 🔌 Exporters switched on through the environment (or add_exporter in code)
+TRACE_LOG_ENV = "RAG_TRACE_LOG"           # path of a JSON lines trace log
+METRICS_FILE_ENV = "RAG_METRICS_FILE"     # path of a Prometheus textfile-collector file
+OTEL_ENV = "RAG_OTEL"                     # "1" to forward spans to OpenTelemetry
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed stage; spans opened inside it become its children."""
+
+    __slots__ = ("name", "attributes", "children", "started_at", "_start", "duration_ms")
+
+    def __init__(self, name: str, attributes: dict):
+        self.name = name
+        self.attributes = attributes
+        self.children = []
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.duration_ms = None
+
+    def set(self, **attributes):
+        self.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+    def finish(self):
+        self.duration_ms = (time.perf_counter() - self._start) * 1000
+
+    def walk(self, depth: int = 0):
+        """Yield (depth, span) for this span and all descendants, depth first."""
+        yield depth, self
+        for child in self.children:
+            yield from child.walk(depth + 1)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms or 0.0, 3),
+            "attributes": self.attributes,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+
+class Metrics:
+    """Process-wide counters and per-stage latency histograms."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.counters = {}
+        self._histograms = {}
+        self._samples = {}
+
+    def inc(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, stage: str, duration_ms: float):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+                self._samples[stage] = deque(maxlen=RECENT_SAMPLES)
+            for i, bound in enumerate(self.buckets):
+                if duration_ms <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += duration_ms
+            histogram["count"] += 1
+            self._samples[stage].append(duration_ms)
+
+    def summary(self) -> dict:
+        """{stage: count, mean, p50, p95} over the most recent samples of each stage."""
+        with self._lock:
+            samples = {stage: np.asarray(values) for stage, values in self._samples.items()}
+            counts = {stage: h["count"] for stage, h in self._histograms.items()}
+        return {
+            stage: {
+                "count": counts[stage],
+                "mean_ms": float(values.mean()),
+                "p50_ms": float(np.percentile(values, 50)),
+                "p95_ms": float(np.percentile(values, 95)),
+            }
+            for stage, values in samples.items() if len(values)
+        }
+
+    def prometheus_text(self) -> str:
+        """Metrics in the Prometheus text exposition format."""
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {stage: dict(h, buckets=list(h["buckets"])) for stage, h in self._histograms.items()}
+        lines = ["# TYPE rag_events_total counter"]
+        for name, value in sorted(counters.items()):
+            lines.append(f'rag_events_total{{event="{name}"}} {value:g}')
+        lines.append("# TYPE rag_stage_latency_seconds histogram")
+        for stage, h in sorted(histograms.items()):
+            for bound, count in zip(self.buckets, h["buckets"]):
+                lines.append(f'rag_stage_latency_seconds_bucket{{stage="{stage}",le="{bound / 1000:g}"}} {count}')
+            lines.append(f'rag_stage_latency_seconds_bucket{{stage="{stage}",le="+Inf"}} {h["count"]}')
+            lines.append(f'rag_stage_latency_seconds_sum{{stage="{stage}"}} {h["sum"] / 1000:.6f}')
+            lines.append(f'rag_stage_latency_seconds_count{{stage="{stage}"}} {h["count"]}')
+        return "\n".join(lines) + "\n"
+
+
+class Tracer:
+    """Collects nested timing spans per request and hands finished traces to exporters."""
+
+    def __init__(self, max_traces: int = RECENT_TRACES):
+        self.metrics = Metrics()
+        self.exporters = []
+        self.recent = deque(maxlen=max_traces)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        parent = _current_span.get()
+        span = Span(name, {k: v for k, v in attributes.items() if v is not None})
+        token = _current_span.set(span)
+        try:
+            yield span
+        except Exception as exc:
+            span.attributes["error"] = type(exc).__name__
+            raise
+        finally:
+            span.finish()
+            _current_span.reset(token)
+            self.metrics.observe(name, span.duration_ms)
+            if parent is not None:
+                parent.children.append(span)
+            else:
+                self._export(span)
+
+    def set(self, **attributes):
+        """Attach attributes to the innermost open span (no-op outside a span)."""
+        span = _current_span.get()
+        if span is not None:
+            span.set(**attributes)
+
+    def count(self, event: str, value: float = 1):
+        self.metrics.inc(event, value)
+
+    def add_exporter(self, exporter):
+        with self._lock:
+            self.exporters.append(exporter)
+        return exporter
+
+    def _export(self, trace: Span):
+        with self._lock:
+            self.recent.append(trace)
+            exporters = list(self.exporters)
+        for exporter in exporters:
+            try:
+                exporter.export(trace, self.metrics)
+            except Exception as exc:
+                # Telemetry must never break a query
+                print(f"⚠️ {type(exporter).__name__} failed: {exc}")
+
+    def recent_traces(self, n: int = 20) -> list:
+        with self._lock:
+            return list(self.recent)[-n:]
+
+
+class JsonlExporter:
+    """Appends every finished trace as one JSON line."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def export(self, trace: Span, metrics: Metrics):
+        line = json.dumps(trace.to_dict(), default=str)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+class PrometheusFileExporter:
+    """Rewrites a Prometheus textfile-collector file after every trace."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def export(self, trace: Span, metrics: Metrics):
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        tmp_path.write_text(metrics.prometheus_text(), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+
+
+class OpenTelemetryExporter:
+    """Replays finished traces as OpenTelemetry spans (needs `opentelemetry-api` and a configured SDK)."""
+
+    def __init__(self, service_name: str = "rag_mnc_insights"):
+        from opentelemetry import trace
+        self._trace = trace
+        self._tracer = trace.get_tracer(service_name)
+
+    def export(self, trace: Span, metrics: Metrics):
+        self._replay(trace, None)
+
+    def _replay(self, span: Span, parent):
+        context = self._trace.set_span_in_context(parent) if parent is not None else None
+        start_ns = int(span.started_at * 1e9)
+        otel_span = self._tracer.start_span(span.name, context=context, start_time=start_ns,
+                                            attributes={k: v for k, v in span.attributes.items()
+                                                        if isinstance(v, (str, bool, int, float))})
+        for child in span.children:
+            self._replay(child, otel_span)
+        otel_span.end(end_time=start_ns + int((span.duration_ms or 0.0) * 1e6))
+
+
+tracer = Tracer()
+span = tracer.span
+
+
+def configure_from_env(target: Tracer = tracer):
+    """Attach the exporters requested through RAG_TRACE_LOG / RAG_METRICS_FILE / RAG_OTEL."""
+    if os.environ.get(TRACE_LOG_ENV):
+        target.add_exporter(JsonlExporter(os.environ[TRACE_LOG_ENV]))
+    if os.environ.get(METRICS_FILE_ENV):
+        target.add_exporter(PrometheusFileExporter(os.environ[METRICS_FILE_ENV]))
+    if os.environ.get(OTEL_ENV) == "1":
+        try:
+            target.add_exporter(OpenTelemetryExporter())
+        except ImportError:
+            print("⚠️ RAG_OTEL is set but opentelemetry-api is not installed.")
+
+
+configure_from_env()
@@ -0,0 +1,155 @@
+import re
+import json
+import math
+from collections import Counter
+from pathlib import Path
+import numpy as np
+from index_registry import registry
+
+# 📁 Stored next to index.faiss inside the FAISS index folder
+LEXICAL_INDEX_FILE = "lexical_index.json"
+
+# ⚙️ BM25 and fusion defaults
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60                 # rank constant of reciprocal rank fusion
+HYBRID_CANDIDATES = 50     # results taken from each retriever before fusion
+
+# 🔀 "hybrid" fuses BM25 and vector results (exact tickers, segment names, figures); "vector" is FAISS only
+RETRIEVAL_MODES = ("hybrid", "vector")
+DEFAULT_RETRIEVAL_MODE = "hybrid"
+
+# Tickers, words and figures such as "$62.5", "12%" or "2,400" survive tokenization intact
+TOKEN_PATTERN = re.compile(r"\$?\d+(?:[.,]\d+)*%?|[a-z][a-z0-9&'-]*")
+STOPWORDS = frozenset(
+    "a an and are as at be by did do does for from had has have how in is it its of on or our "
+    "that the their this to was we were what when which who will with you your".split()
+)
+
+
+def tokenize(text: str) -> list:
+    """Lower-cased terms with stopwords and possessives ("Microsoft's" → "microsoft") removed."""
+    tokens = (re.sub(r"'s$", "", t).rstrip("'-") for t in TOKEN_PATTERN.findall(text.lower()))
+    return [t for t in tokens if t and t not in STOPWORDS]
+
+
+class BM25Index:
+    """In-memory BM25 inverted index over the chunks of a FAISS store, keyed by docstore id."""
+
+    def __init__(self, doc_ids, doc_lengths, postings, k1: float = BM25_K1, b: float = BM25_B):
+        self.doc_ids = list(doc_ids)
+        self.doc_lengths = np.asarray(doc_lengths, dtype="float32")
+        self.postings = postings
+        self.k1 = k1
+        self.b = b
+        self._positions = {doc_id: pos for pos, doc_id in enumerate(self.doc_ids)}
+        self._arrays = {}
+        avg_length = float(self.doc_lengths.mean()) if len(self.doc_ids) else 1.0
+        # Per-document length normalisation, computed once instead of on every query
+        self._norm = k1 * (1 - b + b * self.doc_lengths / max(avg_length, 1e-9))
+
+    @classmethod
+    def from_documents(cls, doc_ids, texts, **params):
+        postings, lengths = {}, []
+        for pos, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                entry = postings.setdefault(term, ([], []))
+                entry[0].append(pos)
+                entry[1].append(tf)
+        return cls(doc_ids, lengths, postings, **params)
+
+    def _posting(self, term):
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            positions, tfs = self.postings[term]
+            arrays = (np.asarray(positions, dtype="int64"), np.asarray(tfs, dtype="float32"))
+            self._arrays[term] = arrays
+        return arrays
+
+    def search(self, query: str, k: int = 10, docstore_ids=None) -> list:
+        """Top-k (docstore id, BM25 score) pairs; `docstore_ids` restricts the candidates."""
+        n_docs = len(self.doc_ids)
+        terms = [t for t in set(tokenize(query)) if t in self.postings]
+        if not terms or not n_docs:
+            return []
+
+        scores = np.zeros(n_docs, dtype="float32")
+        for term in terms:
+            positions, tfs = self._posting(term)
+            idf = math.log(1 + (n_docs - len(positions) + 0.5) / (len(positions) + 0.5))
+            scores[positions] += idf * tfs * (self.k1 + 1) / (tfs + self._norm[positions])
+
+        if docstore_ids is not None:
+            allowed = np.array([self._positions[i] for i in docstore_ids if i in self._positions], dtype="int64")
+            mask = np.zeros(n_docs, dtype=bool)
+            mask[allowed] = True
+            scores[~mask] = 0.0
+
+        k = min(k, int(np.count_nonzero(scores)))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.doc_ids[pos], float(scores[pos])) for pos in top]
+
+    def to_dict(self) -> dict:
+        return {
+            "k1": self.k1,
+            "b": self.b,
+            "doc_ids": self.doc_ids,
+            "doc_lengths": self.doc_lengths.astype(int).tolist(),
+            "postings": self.postings,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(data["doc_ids"], data["doc_lengths"], data["postings"], k1=data["k1"], b=data["b"])
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+
+def build_lexical_index(vectorstore) -> BM25Index:
+    """Index the same chunks the FAISS store holds, so both retrievers share docstore ids.
+
+    Chunks are tokenized as they are streamed from the docstore; only the postings are kept.
+    """
+    # faiss and LangChain are only imported once an index is actually built
+    from chunk_store import iter_documents
+
+    doc_ids = list(vectorstore.index_to_docstore_id.values())
+    texts = (doc.page_content for _, doc in iter_documents(vectorstore, doc_ids))
+    return BM25Index.from_documents(doc_ids, texts)
+
+
+def save_lexical_index(lexical_index: BM25Index, index_path):
+    path = Path(index_path) / LEXICAL_INDEX_FILE
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(lexical_index.to_dict(), f)
+    return path
+
+
+def load_lexical_index(index_path):
+    """Load the BM25 index saved next to a FAISS index, or None for indexes built without one."""
+    path = Path(index_path) / LEXICAL_INDEX_FILE
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return BM25Index.from_dict(json.load(f))
+
+
+def get_lexical_index(index_path):
+    """BM25Index of a shard (None without one); the JSON is parsed once and again only when the index folder changes."""
+    return registry.get(index_path, name="lexical_index", loader=load_lexical_index)
+
+
+def reciprocal_rank_fusion(rankings, k: int = RRF_K, weights=None) -> list:
+    """Merge ranked id lists: each id scores sum(weight / (k + rank)). Returns (id, score) pairs."""
+    weights = weights or [1.0] * len(rankings)
+    fused = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, doc_id in enumerate(ranking, 1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
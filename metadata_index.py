@@ -0,0 +1,81 @@
+import re
+import json
+from pathlib import Path
+from clean_chunk_data import extract_metadata, convert_date_to_quarter
+from index_registry import registry
+
+# 📁 Stored next to index.faiss / chunks.sqlite inside the FAISS index folder
+METADATA_INDEX_FILE = "metadata_index.json"
+
+# 🏢 Company names recognised in questions and transcripts, mapped to their tickers
+COMPANY_ALIASES = {
+    "microsoft": "MSFT", "apple": "AAPL", "amazon": "AMZN", "google": "GOOGL", "alphabet": "GOOGL",
+    "intel": "INTC", "amd": "AMD", "nvidia": "NVDA", "asml": "ASML", "micron": "MU", "cisco": "CSCO"
+}
+# Whole words only, so "artificial intelligence" is not Intel and "pineapple" is not Apple
+COMPANY_NAMES = re.compile(r"\b(" + "|".join(map(re.escape, COMPANY_ALIASES)) + r")\b", re.IGNORECASE)
+
+
+def metadata_keys(metadata: dict, fiscal: bool = True):
+    """Return the (company, year, quarter) keys a chunk is filed under.
+
+    Keys follow the same rules as `filter_documents`: ticker and year come from the
+    transcript filename, quarter is the (fiscal) quarter of the call month.
+    """
+    filename = metadata.get("filename", "")
+    parsed = extract_metadata(Path(filename))
+    company = str(parsed.get("company") or metadata.get("company") or "Unknown").upper()
+    year = str(parsed.get("year") or metadata.get("year") or "Unknown")
+    quarter = convert_date_to_quarter(filename, fiscal_year=fiscal) or "Unknown"
+    return company, year, quarter
+
+
+def build_metadata_index(vectorstore, fiscal: bool = True) -> dict:
+    """Build an inverted index company → year → quarter → [docstore ids] from a FAISS store."""
+    from chunk_store import iter_documents
+
+    companies = {}
+    for doc_id, doc in iter_documents(vectorstore):
+        metadata = getattr(doc, "metadata", None) or {}
+        company, year, quarter = metadata_keys(metadata, fiscal=fiscal)
+        companies.setdefault(company, {}).setdefault(year, {}).setdefault(quarter, []).append(doc_id)
+    return {"fiscal": fiscal, "companies": companies}
+
+
+def save_metadata_index(metadata_index: dict, index_path):
+    path = Path(index_path) / METADATA_INDEX_FILE
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(metadata_index, f)
+    return path
+
+
+def load_metadata_index(index_path):
+    """Load the metadata index saved next to a FAISS index, or None for indexes built without one."""
+    path = Path(index_path) / METADATA_INDEX_FILE
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def get_metadata_index(index_path):
+    """company → year → quarter → [docstore ids] map of a shard, kept in memory until its index folder changes."""
+    return registry.get(index_path, name="metadata_index", loader=load_metadata_index)
+
+
+def lookup_docstore_ids(metadata_index: dict, company=None, year=None, quarter=None) -> list:
+    """Return the docstore ids matching the given filters; unset filters match everything."""
+    if not metadata_index:
+        return []
+    ids = []
+    for c, years in metadata_index["companies"].items():
+        if company and c != str(company).upper():
+            continue
+        for y, quarters in years.items():
+            if year and y != str(year):
+                continue
+            for q, doc_ids in quarters.items():
+                if quarter and q != str(quarter).upper():
+                    continue
+                ids.extend(doc_ids)
+    return ids
@@ -1,48 +1,73 @@
-import os
 from pathlib import Path
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from google.generativeai import configure, GenerativeModel
 from dotenv import load_dotenv
 import re
+import time
+import threading
+from contextlib import nullcontext
 from langchain.memory import ConversationBufferMemory
+from langchain.schema import HumanMessage
+from index_registry import get_embedding_model, registry
+from embedding_pipeline import get_query_embedder
+from clean_chunk_data import convert_date_to_quarter
+from metadata_index import get_metadata_index, COMPANY_ALIASES, COMPANY_NAMES
+from financial_metrics import get_financial_metrics, metrics_in_question, select_facts, format_fact, is_narrative_question
+from financial_metrics import MAX_FACT_ROWS
+from lexical_index import get_lexical_index, RETRIEVAL_MODES, DEFAULT_RETRIEVAL_MODE
+from shard_router import route, load_shards, lookup_candidates, search_shards
+from rerank import rerank, get_reranker, RERANK_CANDIDATES
+from context_packer import pack_context, CONTEXT_TOKEN_BUDGET
+from ann_index import apply_index_defaults
+from answer_cache import AnswerCache, ANSWER_CACHE_PATH, doc_key
+from conversation_memory import TokenBudgetHistory, MAX_PERSISTED_MESSAGES, MEMORY_FILE
+from conversation_memory import read_memory_file, write_memory_file
+from instrumentation import tracer, span
 
 
 # Load environment variables (like GEMINI API key)
 load_dotenv()
-configure(api_key="Api key")
 
 # Constants
 INDEX_PATH = Path(r"C:Navigate Labs\rag_mnc_insights\data\outputs\mnc_faiss_index")
-embedding_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-model = GenerativeModel("models/gemini-2.0-flash")
+MODEL_NAME = "models/gemini-2.0-flash"
+MIN_PREFILTERED_HITS = 3     # a metadata-prefiltered search finding fewer chunks is re-run without the prefilter
+
+answer_cache = AnswerCache(ANSWER_CACHE_PATH, namespace=MODEL_NAME)
 
 chat_history = []
 memory = ConversationBufferMemory(return_messages=True)
 
-from pathlib import Path
-import json
-from langchain.memory import ConversationBufferMemory
-from langchain.schema import HumanMessage, AIMessage
-
-MEMORY_FILE = Path(r"C:Navigate Labs\rag_mnc_insights\data\outputs\chat_memory.json")
-
-def save_memory_to_file(memory, filepath=MEMORY_FILE):
-    data = [
-        {"type": msg.type, "content": msg.content}
-        for msg in memory.chat_memory.messages
-    ]
-    Path(filepath).parent.mkdir(parents=True, exist_ok=True)
-    with open(filepath, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+# 🧮 Keeps the history sent to Gemini within a token budget, however long the session gets
+# (older turns are embedded through the query embedder, which loads the model on first use)
+history_manager = TokenBudgetHistory(embedding_model=get_query_embedder())
+
+
+def get_llm(model_name: str = MODEL_NAME):
+    """Gemini client, configured and created on first use rather than at import."""
+    def load():
+        from google.generativeai import configure, GenerativeModel
+        configure(api_key="Api key")
+        return GenerativeModel(model_name)
+
+    return registry.model(("llm", model_name), load)
+
+
+def __getattr__(name):
+    # `embedding_model` and `model` used to be built at import; they are still reachable, lazily
+    if name == "embedding_model":
+        return get_embedding_model()
+    if name == "model":
+        return get_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def save_memory_to_file(memory, filepath=MEMORY_FILE, max_messages=MAX_PERSISTED_MESSAGES):
+    with span("save_memory"):
+        write_memory_file(memory.chat_memory.messages, filepath, max_messages)
     print("💾 Chat memory saved.")
 
 def load_memory_from_file(memory, filepath=MEMORY_FILE):
-    if not filepath.exists():
+    if not Path(filepath).exists():
         return
-    with open(filepath, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    for msg in data:
+    for msg in read_memory_file(filepath):
         if msg["type"] == "human":
             memory.chat_memory.add_user_message(msg["content"])
         elif msg["type"] == "ai":
@@ -53,52 +78,56 @@ def load_memory_from_file(memory, filepath=MEMORY_FILE):
 
 def extract_metadata_from_question(question: str):
     question = question.lower()
-    company_aliases = {
-        "microsoft": "MSFT", "apple": "AAPL", "amazon": "AMZN", "google": "GOOGL", "alphabet": "GOOGL",
-        "intel": "INTC", "amd": "AMD", "nvidia": "NVDA", "asml": "ASML", "micron": "MU", "cisco": "CSCO"
-    }
-    company = next((ticker for alias, ticker in company_aliases.items() if alias in question), None)
-    year_match = re.search(r"(20\d{2})", question)
+    companies = companies_in_question(question)
+    company = companies[0] if companies else None
+    year_match = re.search(r"(?<!\d)(20\d{2})(?!\d)", question)
     year = year_match.group(1) if year_match else None
-    quarter_match = re.search(r"(q[1-4])", question)
+    quarter_match = re.search(r"(?<![a-z])(q[1-4])(?!\d)", question)
     quarter = quarter_match.group(1).upper() if quarter_match else None
     return company, year, quarter
 
-def convert_date_to_quarter(filename, fiscal_year=True):
-    if fiscal_year:
-        months_to_quarters = {
-            "Jul": "Q1", "Aug": "Q1", "Sep": "Q1",
-            "Oct": "Q2", "Nov": "Q2", "Dec": "Q2",
-            "Jan": "Q3", "Feb": "Q3", "Mar": "Q3",
-            "Apr": "Q4", "May": "Q4", "Jun": "Q4",
-        }
-    else:
-        months_to_quarters = {
-            "Jan": "Q1", "Feb": "Q1", "Mar": "Q1",
-            "Apr": "Q2", "May": "Q2", "Jun": "Q2",
-            "Jul": "Q3", "Aug": "Q3", "Sep": "Q3",
-            "Oct": "Q4", "Nov": "Q4", "Dec": "Q4",
-        }
-    return next((q for mon, q in months_to_quarters.items() if mon in filename), "")
-
-def load_vector_db(index_path):
-    return FAISS.load_local(
-        str(index_path),
-        embeddings=embedding_model,
-        allow_dangerous_deserialization=True
-    )
-
-def ask_gemini(context: str, user_question: str) -> str:
-    # Add latest user message to memory
-    memory.chat_memory.add_user_message(user_question)
-
-    # Include memory history
-    history = "\n".join([
-        f"User: {msg.content}" if msg.type == "human" else f"Assistant: {msg.content}"
-        for msg in memory.chat_memory.messages
-    ])
-
-    prompt = f"""
+def companies_in_question(question: str) -> list:
+    """Every ticker named in the question (as a whole word), in order of first mention."""
+    return list(dict.fromkeys(COMPANY_ALIASES[match.group(1).lower()] for match in COMPANY_NAMES.finditer(question)))
+
+def resolve_filters(question: str, company=None, year=None, quarter=None):
+    """Filters for a question plus the companies whose shards it should search.
+
+    Filters the caller set (e.g. the Streamlit selectboxes) win; the rest are detected from
+    the question. A caller-supplied company always picks its shard. Otherwise a question
+    naming several companies searches each of their shards and drops the single-company filter.
+    """
+    detected_company, detected_year, detected_quarter = extract_metadata_from_question(question)
+    year, quarter = year or detected_year, quarter or detected_quarter
+    if company:
+        return (company, year, quarter), [company]
+    companies = companies_in_question(question)
+    if len(companies) > 1:
+        return (None, year, quarter), companies
+    return (detected_company, year, quarter), companies
+
+def load_vector_db(index_path, nprobe=None, ef_search=None, companies=None):
+    """Vector store of an index, or a list with one store per shard `companies` routes to when it is sharded."""
+    # Served from the process-wide registry; only re-read from disk when the index files change
+    shards = route(index_path, companies)
+    dbs = load_shards(shards)
+    if nprobe or ef_search:
+        # Changes the process-wide defaults (until the index is reloaded); pass them to rag_query to tune a single query
+        for db in dbs:
+            apply_index_defaults(db.index, nprobe, ef_search)
+    return dbs[0] if shards == [Path(index_path)] else dbs
+
+def build_prompt(context: str, conversation=None, user_question: str = None) -> str:
+    conversation = conversation if conversation is not None else memory
+
+    # Include memory history plus the question being asked, trimmed to the history token budget
+    messages = list(conversation.chat_memory.messages)
+    if user_question is not None:
+        messages.append(HumanMessage(content=user_question))
+    with span("build_prompt"):
+        history = history_manager.render(messages)
+
+    return f"""
 You are a financial analyst assistant. Use the following MNC earnings transcript snippets to answer the user's question precisely.
 
 Chat History:
@@ -109,13 +138,59 @@ Transcript Context:
 
 Answer:"""
 
-    response = model.generate_content(prompt)
-    answer = response.text.strip()
+def ask_gemini(context: str, user_question: str, conversation=None, usage=None, limiter=None) -> str:
+    conversation = conversation if conversation is not None else memory
 
-    # Add response to memory
-    memory.chat_memory.add_ai_message(answer)
+    prompt = build_prompt(context, conversation, user_question)
+    with limiter or nullcontext():
+        with span("gemini", model=MODEL_NAME) as llm_span:
+            response = get_llm().generate_content(prompt)
+            answer = response.text.strip()
+
+    # Token counts reported by Gemini, for callers that track prompt size
+    usage = usage if usage is not None else {}
+    record_usage(response, usage)
+    llm_span.set(**usage)
+
+    # The turn only enters memory once it has an answer
+    conversation.chat_memory.add_user_message(user_question)
+    conversation.chat_memory.add_ai_message(answer)
     return answer
 
+def ask_gemini_stream(context: str, user_question: str, conversation=None):
+    """Like ask_gemini, but yields answer fragments as Gemini produces them."""
+    conversation = conversation if conversation is not None else memory
+
+    prompt = build_prompt(context, conversation, user_question)
+    parts = []
+    # Opened lazily, so a stream consumed after rag_query returns is traced on its own
+    with span("gemini_stream", model=MODEL_NAME) as llm_span:
+        started = time.perf_counter()
+        usage = {}
+        for chunk in get_llm().generate_content(prompt, stream=True):
+            record_usage(chunk, usage)
+            if not chunk.parts:
+                continue
+            if not parts:
+                llm_span.set(first_token_ms=round((time.perf_counter() - started) * 1000, 1))
+            parts.append(chunk.text)
+            yield chunk.text
+        llm_span.set(**usage)
+
+    # The full answer is only known once the stream is exhausted; an abandoned stream leaves memory untouched
+    conversation.chat_memory.add_user_message(user_question)
+    conversation.chat_memory.add_ai_message("".join(parts).strip())
+
+def record_usage(response, usage: dict):
+    """Copy Gemini's token counts into `usage` and the process-wide token counters."""
+    metadata = getattr(response, "usage_metadata", None)
+    if not metadata or not getattr(metadata, "prompt_token_count", None):
+        return
+    usage["prompt_tokens"] = metadata.prompt_token_count
+    usage["response_tokens"] = metadata.candidates_token_count
+    tracer.count("gemini_prompt_tokens", metadata.prompt_token_count or 0)
+    tracer.count("gemini_response_tokens", metadata.candidates_token_count or 0)
+
 
 
 def format_metadata(metadata):
@@ -139,40 +214,380 @@ def filter_documents(docs, company, year, quarter, fiscal=True):
             filtered.append(doc)
     return filtered
 
-def rag_query(index_path, user_question, streamlit_mode=False, company=None, year=None, quarter=None):
-    db = load_vector_db(index_path)
-
-    if not all([company, year, quarter]):
-        company, year, quarter = extract_metadata_from_question(user_question)
-
-    if not streamlit_mode:
-        print(f"\n🔍 Detected Metadata — Company: {company}, Year: {year}, Quarter: {quarter}")
-
-    retriever = db.as_retriever(search_kwargs={"k": 10})
-    docs = retriever.get_relevant_documents(user_question)
-    filtered_docs = filter_documents(docs, company, year, quarter)
+def retrieve_documents(index_path, user_question, company=None, year=None, quarter=None, verbose=True,
+                       k=RERANK_CANDIDATES, nprobe=None, ef_search=None, retrieval_mode=DEFAULT_RETRIEVAL_MODE,
+                       use_reranker=True, context_token_budget=CONTEXT_TOKEN_BUDGET):
+    """Find the transcript chunks for a question.
+
+    The `k` first-stage candidates are reranked with the cross-encoder and packed into a
+    deduplicated context of at most `context_token_budget` tokens. Returns the docs in that
+    context, the context itself and the detected filters.
+    """
+    if retrieval_mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode: {retrieval_mode} (expected one of {', '.join(RETRIEVAL_MODES)})")
+    with span("retrieve", mode=retrieval_mode):
+        return _retrieve_documents(index_path, user_question, company, year, quarter, verbose, k, nprobe, ef_search,
+                                   retrieval_mode, use_reranker, context_token_budget)
+
+def _retrieve_documents(index_path, user_question, company, year, quarter, verbose, k, nprobe, ef_search,
+                        retrieval_mode, use_reranker, context_token_budget):
+    (company, year, quarter), companies = resolve_filters(user_question, company, year, quarter)
+
+    if verbose:
+        print(f"\n🔍 Detected Metadata — Company: {company or ', '.join(companies) or None}, Year: {year}, Quarter: {quarter}")
+
+    # Only the shards of the companies asked about are searched; every shard when none is named
+    with span("index_load") as load_span:
+        shards = route(index_path, companies)
+        load_shards(shards)
+        load_span.set(shards=len(shards))
+
+    # Restrict the FAISS search to the chunks of the requested call(s) when the shards have a metadata index
+    with span("metadata_lookup", company=company, year=year, quarter=quarter) as lookup_span:
+        candidates = lookup_candidates(shards, company, year, quarter)
+        candidate_ids = [doc_id for ids in candidates.values() for doc_id in ids]
+        lookup_span.set(candidates=len(candidate_ids))
+
+    # Embedded once (and cached across calls): used for the search and for paraphrase lookups in the answer cache
+    with span("embed_query"):
+        query_vector = get_query_embedder().embed_query(user_question)
+
+    with span("search", k=k, prefiltered=bool(candidate_ids), shards=len(shards)) as search_span:
+        hits, prefiltered = _search_with_fallback(shards, [user_question], [query_vector], k, candidates,
+                                                  retrieval_mode == "hybrid", nprobe, ef_search)
+        docs = [doc for doc, _ in hits[0]]
+        candidate_ids = candidate_ids if prefiltered[0] else []
+        search_span.set(docs=len(docs), fallback=bool(candidates) and not prefiltered[0])
+    return _select_context(user_question, docs, candidate_ids, (company, year, quarter), query_vector, verbose,
+                           use_reranker, context_token_budget)
+
+def retrieve_documents_batch(index_path, questions, filters=None, k=RERANK_CANDIDATES,
+                             retrieval_mode=DEFAULT_RETRIEVAL_MODE, use_reranker=True,
+                             context_token_budget=CONTEXT_TOKEN_BUDGET, verbose=False) -> list:
+    """retrieve_documents for many questions at once; returns one result dict per question.
+
+    All questions are embedded in one batch and those sharing a company/year/quarter go
+    through each of their shards as one matrix search; reranking and packing then run per question.
+    `filters` holds one (company, year, quarter) tuple per question, or None to detect it.
+    """
+    if retrieval_mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode: {retrieval_mode} (expected one of {', '.join(RETRIEVAL_MODES)})")
+    questions = list(questions)
+    filters = filters if filters is not None else [None] * len(questions)
+
+    with span("retrieve_batch", mode=retrieval_mode, questions=len(questions)):
+        resolved = [resolve_filters(q, *(f or (None, None, None))) for q, f in zip(questions, filters)]
+        groups = {}
+        for i, (query_filter, companies) in enumerate(resolved):
+            groups.setdefault((query_filter, tuple(companies)), []).append(i)
+
+        with span("index_load"):
+            shards = {key: route(index_path, key[1]) for key in groups}
+            load_shards({shard for routed in shards.values() for shard in routed})
+
+        with span("metadata_lookup"):
+            candidates = {key: lookup_candidates(shards[key], *key[0]) for key in groups}
+
+        with span("embed_query", questions=len(questions)):
+            query_vectors = get_query_embedder().embed_queries(questions)
+
+        docs = [None] * len(questions)
+        prefiltered = [False] * len(questions)
+        with span("search", k=k, groups=len(groups)):
+            for key, members in groups.items():
+                hits, group_prefiltered = _search_with_fallback(shards[key], [questions[i] for i in members],
+                                                                query_vectors[members], k, candidates[key],
+                                                                retrieval_mode == "hybrid")
+                for i, query_hits, is_prefiltered in zip(members, hits, group_prefiltered):
+                    docs[i] = [doc for doc, _ in query_hits]
+                    prefiltered[i] = is_prefiltered
+
+        results = []
+        for i, (query_filter, companies) in enumerate(resolved):
+            key = (query_filter, tuple(companies))
+            candidate_ids = [doc_id for ids in candidates[key].values() for doc_id in ids] if prefiltered[i] else []
+            results.append(_select_context(questions[i], docs[i], candidate_ids, query_filter, query_vectors[i],
+                                           verbose, use_reranker, context_token_budget))
+        return results
+
+def _search_with_fallback(shards, questions, query_vectors, k, candidates, hybrid, nprobe=None, ef_search=None):
+    """search_shards restricted to `candidates`; questions finding too little there are topped up unfiltered.
+
+    Returns the hits per question and whether each one's hits are still prefiltered; the
+    others go through post-filtering (and broader context) in _select_context.
+    """
+    hits = search_shards(shards, questions, query_vectors, k, candidates, hybrid=hybrid, nprobe=nprobe,
+                         ef_search=ef_search)
+    if not candidates:
+        return hits, [False] * len(questions)
+    prefiltered = [len(query_hits) >= min(k, MIN_PREFILTERED_HITS) for query_hits in hits]
+    weak = [i for i, ok in enumerate(prefiltered) if not ok]
+    if weak:
+        tracer.count("prefilter_fallback", len(weak))
+        retried = search_shards(shards, [questions[i] for i in weak], [query_vectors[i] for i in weak], k,
+                                hybrid=hybrid, nprobe=nprobe, ef_search=ef_search)
+        for i, query_hits in zip(weak, retried):
+            # The few prefiltered hits stay first; post-filtering keeps them if they match
+            seen = {doc_key(doc) for doc, _ in hits[i]}
+            hits[i] = hits[i] + [(doc, score) for doc, score in query_hits if doc_key(doc) not in seen][:k - len(hits[i])]
+    return hits, prefiltered
+
+def _select_context(user_question, docs, candidate_ids, filters, query_vector, verbose, use_reranker,
+                    context_token_budget):
+    """Post-filter, rerank and pack first-stage results into the retrieve_documents result."""
+    company, year, quarter = filters
+    if candidate_ids:
+        filtered_docs = docs
+    else:
+        with span("filter_documents"):
+            filtered_docs = filter_documents(docs, company, year, quarter)
 
     if filtered_docs:
-        if not streamlit_mode:
+        if verbose:
+            if candidate_ids:
+                print(f"✅ Searched {len(candidate_ids)} indexed chunks for {company}, {year}, {quarter}")
             print(f"✅ Filtered {len(filtered_docs)} documents for {company}, {year}, {quarter}")
     else:
-        if not streamlit_mode:
+        if verbose:
             print("⚠️ No exact match found with metadata. Using broader context.")
         filtered_docs = docs
 
-    context = "\n\n".join(doc.page_content for doc in filtered_docs[:5])
-    answer = ask_gemini(context, user_question)
+    if use_reranker:
+        with span("rerank", candidates=len(filtered_docs)):
+            filtered_docs = [doc for doc, _ in rerank(user_question, filtered_docs)]
+    with span("pack_context") as pack_span:
+        packed = pack_context(filtered_docs, token_budget=context_token_budget)
+        pack_span.set(docs=len(packed["docs"]), context_tokens=packed["tokens"])
+    if verbose:
+        print(f"📦 Packed {len(packed['docs'])} of {len(filtered_docs)} chunks into ~{packed['tokens']} context tokens")
+
+    return {
+        "docs": packed["docs"],
+        "context": packed["context"],
+        "filters": (company, year, quarter),
+        "query_vector": query_vector,
+    }
 
-    if streamlit_mode:
-        return {
-            "answer": answer,
-            "sources": [doc.metadata.get("filename", "Unknown") for doc in filtered_docs[:5]]
-        }
+def lookup_financial_facts(index_path, user_question, company=None, year=None, quarter=None):
+    """Reported figures for a metrics question, read from the facts tables of its shards.
+
+    Returns the selected facts and whether they could answer the question on their own:
+    every company asked about has every metric asked for, the transcripts agree on every
+    value, and the question is not asking why or for commentary. prepare_answer still
+    checks them against the retrieved text first.
+    """
+    metrics = metrics_in_question(user_question)
+    (company, year, quarter), companies = resolve_filters(user_question, company, year, quarter)
+    companies = [company] if company else companies
+    if not metrics or not companies:
+        return [], False
+
+    mentions = []
+    for shard in route(index_path, companies):
+        store = get_financial_metrics(shard)
+        if store is None:
+            continue
+        for ticker in companies:
+            mentions.extend(store.facts(ticker, metrics, year, quarter))
+    facts = select_facts(mentions, user_question)
+    if len(facts) > MAX_FACT_ROWS:
+        # Cross-quarter questions list the most recent periods
+        facts = sorted(facts, key=lambda f: (f["year"], f["quarter"]), reverse=True)[:MAX_FACT_ROWS]
+        facts.sort(key=lambda f: (f["company"], f["metric"], f["segment"], f["year"], f["quarter"]))
+
+    covered = {(f["company"], f["metric"]) for f in facts}
+    complete = all((str(c).upper(), m) in covered for c in companies for m in metrics)
+    # Conflicting values for one period go to Gemini, which sees them in context
+    consistent = not any(fact["other_values"] for fact in facts)
+    return facts, bool(facts) and complete and consistent and not is_narrative_question(user_question)
+
+def facts_context(facts) -> str:
+    lines = "\n".join(format_fact(fact) for fact in facts)
+    return f"[Reported figures extracted from the transcripts]\n{lines}"
+
+def facts_confirmed(facts, docs) -> bool:
+    """True when the sentence every fact was read from is part of the retrieved transcript text."""
+    texts = [doc.page_content for doc in docs]
+    return bool(facts) and all(any(fact["sentence"] in text for text in texts) for fact in facts)
+
+def fact_key(fact) -> str:
+    """Answer cache key part of a fact: its chunk and the value read from it."""
+    return f"{fact['doc_id']}={fact['metric']}:{fact['segment']}:{fact['value']:g}"
+
+def prewarm(index_path=INDEX_PATH, background: bool = False, verbose: bool = True):
+    """Load the index, its side files, the embedding model, reranker and Gemini client ahead of use.
+
+    With `background=True` this runs on a daemon thread, which is returned; otherwise
+    returns {step: seconds}.
+    """
+    if background:
+        thread = threading.Thread(target=prewarm, args=(index_path, False, verbose), name="prewarm", daemon=True)
+        thread.start()
+        return thread
+
+    shards = route(index_path)
+    steps = {
+        "index": lambda: load_shards(shards),
+        "metadata_index": lambda: [get_metadata_index(shard) for shard in shards],
+        "lexical_index": lambda: [get_lexical_index(shard) for shard in shards],
+        "financial_metrics": lambda: [get_financial_metrics(shard) for shard in shards],
+        "embedding_model": lambda: get_query_embedder().embed_query("warm up"),
+        "reranker": get_reranker,
+        "llm": get_llm,
+    }
+    timings = {}
+    for step, load in steps.items():
+        started = time.perf_counter()
+        try:
+            load()
+        except Exception as e:
+            print(f"⚠️ Prewarm step '{step}' failed: {e}")
+            continue
+        timings[step] = time.perf_counter() - started
+        if verbose:
+            print(f"🔥 {step} ready in {timings[step]:.2f}s")
+    return timings
+
+def _cache_stream(fragments, user_question, filters, chunk_ids, query_vector):
+    """Pass fragments through and store the complete answer once the stream finishes."""
+    parts = []
+    for fragment in fragments:
+        parts.append(fragment)
+        yield fragment
+    answer_cache.put(user_question, filters, chunk_ids, "".join(parts).strip(), query_vector)
+
+def prepare_answer(index_path, user_question, company=None, year=None, quarter=None, use_cache=True, use_metrics=True,
+                   metrics_answers=True, retrieved=None, verbose=False, **retrieval_options) -> dict:
+    """Everything before the Gemini call, shared by rag_query, the async server and batch mode.
+
+    Looks up the reported figures, retrieves the transcript chunks (unless `retrieved` is
+    given) and checks the answer cache. `answer` is set when the figures, confirmed by the
+    retrieved text, or the cache already answer the question; otherwise `context` is the
+    prompt context, grounded with the figures.
+    """
+    started = time.perf_counter()
+    # Figures such as revenue, EPS or margins, looked up in the facts table extracted at build time
+    facts, answerable = [], False
+    if use_metrics:
+        with span("metrics_lookup") as metrics_span:
+            facts, answerable = lookup_financial_facts(index_path, user_question, company, year, quarter)
+            metrics_span.set(facts=len(facts), answerable=answerable)
+
+    if retrieved is None:
+        retrieved = retrieve_documents(index_path, user_question, company, year, quarter, verbose=verbose,
+                                       **retrieval_options)
+    top_docs = retrieved["docs"]
+    prepared = {
+        "answer": None,
+        "cached": False,
+        "numeric": False,
+        "context": retrieved["context"],
+        "facts": facts,
+        "docs": top_docs,
+        # Merged neighbouring chunks share a transcript, so each source is listed once
+        "sources": list(dict.fromkeys(doc.metadata.get("filename", "Unknown") for doc in top_docs)),
+        "filters": retrieved["filters"],
+        "query_vector": retrieved["query_vector"],
+        "chunk_ids": [doc_key(doc) for doc in top_docs] + [fact_key(fact) for fact in facts],
+        "use_cache": use_cache,
+        "retrieval_ms": (time.perf_counter() - started) * 1000,
+    }
+
+    # Figures are only stated without Gemini when the retrieved transcript text says the same
+    if metrics_answers and answerable and facts_confirmed(facts, top_docs):
+        tracer.count("metrics_answer")
+        if verbose:
+            print("📊 Answered from the reported figures.")
+        prepared["numeric"] = True
+        prepared["answer"] = "From the reported figures in the earnings call transcripts:\n" + "\n".join(
+            format_fact(fact) for fact in facts
+        )
+        return prepared
+
+    if use_cache:
+        with span("answer_cache_lookup"):
+            prepared["answer"] = answer_cache.get(user_question, prepared["filters"], prepared["chunk_ids"],
+                                                  prepared["query_vector"])
+        tracer.count("answer_cache_hit" if prepared["answer"] is not None else "answer_cache_miss")
+        prepared["cached"] = prepared["answer"] is not None
+        if prepared["cached"] and verbose:
+            print("⚡ Answer served from cache.")
+    if facts:
+        # Figures from other quarters than the top chunks, for comparisons Gemini could not see otherwise
+        prepared["context"] = f"{facts_context(facts)}\n\n{retrieved['context']}"
+    return prepared
+
+def store_answer(user_question, prepared, answer):
+    """Add a generated answer to the answer cache, under the chunks and figures it was grounded on."""
+    if prepared["use_cache"]:
+        with span("answer_cache_store"):
+            answer_cache.put(user_question, prepared["filters"], prepared["chunk_ids"], answer, prepared["query_vector"])
+
+def generate_answer(user_question, prepared, conversation=None, usage=None, limiter=None) -> str:
+    """Answer a prepared question: from the figures or the cache when prepare_answer found one, else with Gemini."""
+    conversation = conversation if conversation is not None else memory
+    if prepared["answer"] is not None:
+        conversation.chat_memory.add_user_message(user_question)
+        conversation.chat_memory.add_ai_message(prepared["answer"])
+        return prepared["answer"]
+    answer = ask_gemini(prepared["context"], user_question, conversation, usage=usage, limiter=limiter)
+    store_answer(user_question, prepared, answer)
+    return answer
 
-    print("\n📌 Answer:\n", answer)
-    print("\n📄 Sources:")
-    for doc in filtered_docs[:5]:
-        print("→", doc.metadata.get("filename", "Unknown"))
+def rag_query(index_path, user_question, streamlit_mode=False, company=None, year=None, quarter=None, use_cache=True,
+              stream=False, conversation=None, llm_limiter=None, nprobe=None, ef_search=None,
+              retrieval_mode=DEFAULT_RETRIEVAL_MODE, use_reranker=True, context_token_budget=CONTEXT_TOKEN_BUDGET,
+              use_metrics=True, metrics_answers=True):
+    with span("rag_query", streamlit=streamlit_mode, stream=stream) as trace:
+        conversation = conversation if conversation is not None else memory
+        prepared = prepare_answer(index_path, user_question, company, year, quarter, use_cache=use_cache,
+                                  use_metrics=use_metrics, metrics_answers=metrics_answers,
+                                  verbose=not streamlit_mode, nprobe=nprobe, ef_search=ef_search,
+                                  retrieval_mode=retrieval_mode, use_reranker=use_reranker,
+                                  context_token_budget=context_token_budget)
+        retrieval_ms = prepared["retrieval_ms"]
+        sources = prepared["sources"]
+        cached, numeric = prepared["cached"], prepared["numeric"]
+        trace.set(cached=cached, numeric=numeric, docs=len(prepared["docs"]), sources=len(sources),
+                  facts=len(prepared["facts"]))
+        usage = {}
+        started = time.perf_counter()
+
+        if stream and prepared["answer"] is None:
+            answer = None
+            answer_stream = ask_gemini_stream(prepared["context"], user_question, conversation)
+            if use_cache:
+                answer_stream = _cache_stream(answer_stream, user_question, prepared["filters"],
+                                              prepared["chunk_ids"], prepared["query_vector"])
+        else:
+            answer = generate_answer(user_question, prepared, conversation, usage=usage, limiter=llm_limiter)
+            answer_stream = iter([answer])
+        generation_ms = (time.perf_counter() - started) * 1000
+
+        if streamlit_mode:
+            if stream:
+                # Memory and the answer cache are updated once the caller has consumed the stream
+                return {"answer_stream": answer_stream, "sources": sources, "cached": cached, "numeric": numeric}
+            return {
+                "answer": answer,
+                "sources": sources,
+                "cached": cached,
+                "numeric": numeric,
+                "retrieval_ms": retrieval_ms,
+                "generation_ms": generation_ms,
+                "prompt_tokens": usage.get("prompt_tokens")
+            }
+
+        print("\n📌 Answer:")
+        if stream:
+            for fragment in answer_stream:
+                print(fragment, end="", flush=True)
+            print()
+        else:
+            print(answer)
+        print("\n📄 Sources:")
+        for src in sources:
+            print("→", src)
 
 
 if __name__ == "__main__":
@@ -199,7 +614,7 @@ if __name__ == "__main__":
                 print(f"{prefix}: {msg.content}\n")
             continue
 
-        rag_query(INDEX_PATH, question)
+        rag_query(INDEX_PATH, question, stream=True)
 
 
 
@@ -0,0 +1,60 @@
+import time
+import asyncio
+import threading
+
+
+class RateLimiter:
+    """Thread-safe token bucket: at most `rate` calls per second, with bursts up to `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Take a token; returns how long the caller must wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        delay = self._reserve()
+        if delay:
+            time.sleep(delay)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class AsyncRateLimiter(RateLimiter):
+    """asyncio flavour of RateLimiter that also caps the number of calls in flight."""
+
+    def __init__(self, rate: float, burst: int = 1, concurrency: int = 4):
+        super().__init__(rate, burst)
+        self.concurrency = concurrency
+        self._semaphore = None
+
+    async def __aenter__(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        await self._semaphore.acquire()
+        if self.rate > 0:
+            delay = self._reserve()
+            if delay:
+                await asyncio.sleep(delay)
+        return self
+
+    async def __aexit__(self, *exc):
+        self._semaphore.release()
+        return False
@@ -0,0 +1,36 @@
+from index_registry import registry
+
+# 🎯 Local CPU cross-encoder that scores (question, chunk) pairs jointly
+RERANKER_MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_BATCH_SIZE = 32
+RERANK_CANDIDATES = 20     # first-stage results handed to the reranker
+
+
+def get_reranker(model_name: str = RERANKER_MODEL_NAME):
+    """Process-wide cross-encoder, loaded on first use; None if sentence-transformers is unavailable."""
+    def load():
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError:
+            print("⚠️ sentence-transformers is not installed, keeping first-stage ranking.")
+            return False
+        return CrossEncoder(model_name, device="cpu")
+
+    # False (not None) marks a failed load, so the import is not retried on every query
+    return registry.model(("reranker", model_name), load) or None
+
+
+def rerank(question: str, docs, top_n: int = None, model=None, batch_size: int = RERANK_BATCH_SIZE) -> list:
+    """Re-order `docs` by cross-encoder relevance to `question`; returns (Document, score) pairs.
+
+    Without a reranker the first-stage order is kept and scores are None.
+    """
+    docs = list(docs)
+    model = model or get_reranker()
+    if model is None or len(docs) < 2:
+        return [(doc, None) for doc in docs[:top_n]]
+
+    scores = model.predict([(question, doc.page_content) for doc in docs], batch_size=batch_size,
+                           show_progress_bar=False)
+    ranked = sorted(zip(docs, (float(s) for s in scores)), key=lambda pair: pair[1], reverse=True)
+    return ranked[:top_n]
@@ -1,23 +1,47 @@
-import os
-from langchain.vectorstores import FAISS
-from langchain.embeddings import HuggingFaceEmbeddings
+from embedding_pipeline import get_query_embedder
+from shard_router import route, lookup_candidates, search_shards, search
 
 # Config paths
 INDEX_PATH = r"C:Navigate Labs\rag_mnc_insights\data\Transcripts\outputs\mnc_faiss_index"
 
-# Load embedding model
-embedding_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
 
-# Load FAISS index
-vectorstore = FAISS.load_local(
-    folder_path=INDEX_PATH,
-    embeddings=embedding_model,
-    allow_dangerous_deserialization=True
-)
+def search_query(query: str, k: int = 3, index_path=INDEX_PATH, company=None, year=None, quarter=None,
+                 hybrid=False):
+    """Perform semantic search on the FAISS index, optionally restricted to a company/year/quarter.
 
-def search_query(query: str, k: int = 3):
-    """Perform semantic search on the FAISS index."""
-    results = vectorstore.similarity_search(query, k=k)
+    Sharded indexes only search the company's shard (all shards without a company).
+    With `hybrid=True`, BM25 results are fused in so exact terms and figures are not missed.
+    """
+    query_vector = get_query_embedder().embed_query(query)
+    # Vectors are searched directly rather than via similarity_search, so quantized indexes are re-scored exactly
+    return [doc for doc, _ in search(index_path, query, query_vector, k=k, company=company, year=year,
+                                     quarter=quarter, hybrid=hybrid)]
+
+
+def search_batch(queries, k: int = 3, index_path=INDEX_PATH, filters=None, hybrid=False) -> list:
+    """Search many queries at once; returns one list of documents per query.
+
+    All questions are encoded in one batch (cached ones are skipped) and queries sharing the
+    same `(company, year, quarter)` filter go through each shard as one matrix search. `filters`
+    is either one tuple applied to every query or a list with one tuple (or None) per query.
+    """
+    queries = list(queries)
+    if filters is None or isinstance(filters, tuple):
+        filters = [filters] * len(queries)
+    query_vectors = get_query_embedder().embed_queries(queries)
+
+    groups = {}
+    for i, query_filter in enumerate(filters):
+        groups.setdefault(tuple(query_filter) if query_filter and any(query_filter) else (None, None, None), []).append(i)
+
+    results = [None] * len(queries)
+    for query_filter, members in groups.items():
+        shards = route(index_path, query_filter[0])
+        candidates = lookup_candidates(shards, *query_filter)
+        hits = search_shards(shards, [queries[i] for i in members], query_vectors[members], k, candidates,
+                             hybrid=hybrid)
+        for i, query_hits in zip(members, hits):
+            results[i] = [doc for doc, _ in query_hits]
     return results
 
 if __name__ == "__main__":
@@ -0,0 +1,154 @@
+import os
+import time
+import threading
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from embedding_pipeline import embed_texts, EmbeddingCache
+
+# 📁 Evaluation history: one Parquet file per run, so recording a run never rewrites the older ones
+EVAL_HISTORY_DIR = Path(r"C:Navigate Labs\rag_mnc_insights\data\outputs\evaluation_history")
+
+# 🧠 Embeddings of scored texts; expected answers (and cached RAG answers) repeat in every run
+SCORING_CACHE_DIR = Path(r"C:Navigate Labs\rag_mnc_insights\data\outputs\scoring_embedding_cache")
+
+# 📊 Columns a run summary needs; only these are read from each history file
+SUMMARY_COLUMNS = ["run_id", "run_at", "keywords_matched", "text_similarity", "cached", "retrieval_ms", "generation_ms"]
+
+
+def keyword_coverage(answers, keyword_lists) -> np.ndarray:
+    """Share of each answer's expected keywords found in it (case-insensitive), for all answers at once.
+
+    Every answer and keyword is lower-cased once; the per-answer counts are summed with NumPy.
+    """
+    answers = [str(answer).lower() for answer in answers]
+    rows, terms = [], []
+    for i, keywords in enumerate(keyword_lists):
+        for keyword in keywords or []:
+            rows.append(i)
+            terms.append(str(keyword).lower())
+    rows = np.asarray(rows, dtype="int64")
+    found = np.fromiter((term in answers[i] for i, term in zip(rows, terms)), dtype=bool, count=len(terms))
+
+    totals = np.bincount(rows, minlength=len(answers))
+    matched = np.bincount(rows, weights=found, minlength=len(answers))
+    return np.divide(matched, totals, out=np.zeros(len(answers)), where=totals > 0)
+
+
+def cosine_similarity(answers, references, cache=None) -> np.ndarray:
+    """Embedding cosine similarity of each answer to its reference, clipped to [0, 1].
+
+    All texts are embedded in batches with the pipeline's embedding model (repeated texts
+    once, previously seen ones from `cache`); empty answers or references score 0.
+    """
+    answers, references = [str(a) for a in answers], [str(r) for r in references]
+    n = len(answers)
+    if n == 0:
+        return np.zeros(0)
+    if cache is None:
+        cache = EmbeddingCache(SCORING_CACHE_DIR)
+
+    vectors = embed_texts(answers + references, workers=1, cache=cache, verbose=False)
+    a, b = vectors[:n], vectors[n:]
+    norms = np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)
+    present = np.array([bool(x.strip() and y.strip()) for x, y in zip(answers, references)])
+    similarity = np.divide(np.einsum("ij,ij->i", a, b), norms, out=np.zeros(n), where=(norms > 0) & present)
+    return np.clip(similarity, 0.0, 1.0)
+
+
+def score_answers(answers, references, keyword_lists, cache=None) -> dict:
+    """{"keywords_matched": ..., "text_similarity": ...} arrays for a batch of answers."""
+    return {
+        "keywords_matched": keyword_coverage(answers, keyword_lists),
+        "text_similarity": cosine_similarity(answers, references, cache),
+    }
+
+
+def record_run(results: pd.DataFrame, history_dir=EVAL_HISTORY_DIR, run_id: str = None) -> Path:
+    """Add one evaluation run to the history as its own Parquet file (written atomically)."""
+    history_dir = Path(history_dir)
+    history_dir.mkdir(parents=True, exist_ok=True)
+    run_at = time.time()
+    run_id = run_id or time.strftime("%Y%m%d-%H%M%S", time.localtime(run_at))
+    frame = results.assign(run_id=run_id, run_at=pd.Timestamp(run_at, unit="s"))
+
+    path = history_dir / f"run-{run_id}.parquet"
+    tmp_path = path.with_name(path.name + ".tmp")
+    frame.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def summarize_run(path) -> dict:
+    """Aggregate scores and latencies of one history file."""
+    frame = pd.read_parquet(path, columns=SUMMARY_COLUMNS)
+    return {
+        "run_id": frame["run_id"].iloc[0] if len(frame) else Path(path).stem,
+        "run_at": frame["run_at"].iloc[0] if len(frame) else pd.NaT,
+        "samples": len(frame),
+        "keywords_matched": frame["keywords_matched"].mean(),
+        "text_similarity": frame["text_similarity"].mean(),
+        "cached_share": frame["cached"].astype(bool).mean(),
+        "retrieval_p50_ms": frame["retrieval_ms"].median(),
+        "retrieval_p95_ms": frame["retrieval_ms"].quantile(0.95),
+        "generation_p50_ms": frame["generation_ms"].median(),
+    }
+
+
+class EvaluationHistory:
+    """Per-run summaries of the evaluation history, updated incrementally.
+
+    `refresh()` only stats the history folder; runs are read (summary columns only) when
+    their file is new or changed, so dashboards can call it on every rerun. One run's full
+    results are kept for the run last asked for.
+    """
+
+    def __init__(self, history_dir=EVAL_HISTORY_DIR):
+        self.history_dir = Path(history_dir)
+        self._lock = threading.Lock()
+        self._summaries = {}        # file name → (mtime_ns, summary)
+        self._run = None            # (file name, mtime_ns, frame)
+
+    def _files(self) -> dict:
+        if not self.history_dir.is_dir():
+            return {}
+        with os.scandir(self.history_dir) as it:
+            return {e.name: e.stat().st_mtime_ns for e in it if e.is_file() and e.name.endswith(".parquet")}
+
+    def refresh(self) -> "EvaluationHistory":
+        files = self._files()
+        with self._lock:
+            for name in set(self._summaries) - set(files):
+                del self._summaries[name]
+            for name, mtime_ns in files.items():
+                cached = self._summaries.get(name)
+                if cached is None or cached[0] != mtime_ns:
+                    self._summaries[name] = (mtime_ns, summarize_run(self.history_dir / name))
+        return self
+
+    def summaries(self) -> pd.DataFrame:
+        """One row per run, oldest first."""
+        with self._lock:
+            rows = [summary for _, summary in self._summaries.values()]
+        if not rows:
+            return pd.DataFrame(columns=["run_id", "run_at", "samples", "keywords_matched", "text_similarity"])
+        return pd.DataFrame(rows).sort_values("run_at").reset_index(drop=True)
+
+    def run(self, run_id: str = None) -> pd.DataFrame:
+        """Full results of `run_id` (the latest run by default); empty when there is no run yet."""
+        runs = self.summaries()
+        if runs.empty:
+            return pd.DataFrame()
+        run_id = run_id or runs["run_id"].iloc[-1]
+        name = f"run-{run_id}.parquet"
+        with self._lock:
+            mtime_ns = self._summaries.get(name, (None,))[0]
+            if self._run is not None and self._run[:2] == (name, mtime_ns):
+                return self._run[2]
+        frame = pd.read_parquet(self.history_dir / name)
+        with self._lock:
+            self._run = (name, mtime_ns, frame)
+        return frame
+
+    def __len__(self):
+        return len(self._summaries)
@@ -0,0 +1,227 @@
+import os
+import json
+import signal
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+from rag_pipeline_gemini import rag_query, answer_cache, prewarm, INDEX_PATH, RETRIEVAL_MODES, DEFAULT_RETRIEVAL_MODE
+from retriever import search_query
+from shard_router import route, load_shards
+from embedding_pipeline import get_query_embedder
+from async_pipeline import SessionStore
+from rate_limit import RateLimiter
+from instrumentation import tracer
+
+# ⚙️ Server defaults
+HOST = "127.0.0.1"
+PORT = 8000
+SERVER_WORKERS = 1                 # processes; each serves requests on its own threads
+GEMINI_REQUESTS_PER_MINUTE = 120   # per worker process
+GEMINI_BURST = 8
+MAX_BODY_BYTES = 1 << 20
+MAX_SEARCH_K = 50
+
+
+class RequestError(Exception):
+    """A client error, answered with `status` and the message."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class RAGService:
+    """Everything a worker process keeps warm between requests: index, models, sessions, Gemini limiter."""
+
+    def __init__(self, index_path, requests_per_minute: int = GEMINI_REQUESTS_PER_MINUTE, burst: int = GEMINI_BURST):
+        self.index_path = index_path
+        self.sessions = SessionStore(lock_factory=threading.Lock)
+        # One limiter for all request threads; the Gemini client itself is module-level and shared
+        self.llm_limiter = RateLimiter(requests_per_minute / 60, burst=burst)
+        self.ready = False
+
+    def warm_up(self):
+        """Load the index, its side files, the models and the Gemini client before the first request arrives."""
+        timings = prewarm(self.index_path, verbose=False)
+        self.ready = True
+        return timings
+
+    def query(self, body: dict) -> dict:
+        question = _required(body, "question")
+        session_id = str(body.get("session_id") or "default")
+        retrieval_mode = body.get("retrieval_mode", DEFAULT_RETRIEVAL_MODE)
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise RequestError(f"retrieval_mode must be one of {', '.join(RETRIEVAL_MODES)}")
+
+        # Turns of one session run one at a time; different sessions run in parallel
+        with self.sessions.lock(session_id):
+            result = rag_query(
+                self.index_path, question, streamlit_mode=True,
+                company=body.get("company"), year=_optional_str(body.get("year")), quarter=body.get("quarter"),
+                use_cache=bool(body.get("use_cache", True)), conversation=self.sessions.get(session_id),
+                llm_limiter=self.llm_limiter, retrieval_mode=retrieval_mode,
+            )
+        return dict(result, session_id=session_id)
+
+    def search(self, body: dict) -> dict:
+        query = _required(body, "query")
+        k = body.get("k", 5)
+        if not isinstance(k, int) or not 1 <= k <= MAX_SEARCH_K:
+            raise RequestError(f"k must be an integer between 1 and {MAX_SEARCH_K}")
+        docs = search_query(query, k=k, index_path=self.index_path, company=body.get("company"),
+                            year=_optional_str(body.get("year")), quarter=body.get("quarter"),
+                            hybrid=bool(body.get("hybrid", False)))
+        return {"results": [{"content": doc.page_content, "metadata": doc.metadata} for doc in docs]}
+
+    def reset_session(self, session_id: str) -> dict:
+        self.sessions.reset(session_id)
+        return {"session_id": session_id, "reset": True}
+
+    def health(self) -> dict:
+        return {
+            "status": "ok" if self.ready else "starting",
+            "pid": os.getpid(),
+            "shards": len(route(self.index_path)),
+            "chunks": sum(len(db.index_to_docstore_id) for db in load_shards(route(self.index_path)))
+                      if self.ready else None,
+            "sessions": len(self.sessions),
+            "answer_cache": answer_cache.stats(),
+            "query_embeddings": get_query_embedder().stats(),
+        }
+
+
+def _required(body: dict, field: str) -> str:
+    value = body.get(field)
+    if not isinstance(value, str) or not value.strip():
+        raise RequestError(f"'{field}' is required")
+    return value.strip()
+
+
+def _optional_str(value):
+    return str(value) if value not in (None, "") else None
+
+
+class RAGRequestHandler(BaseHTTPRequestHandler):
+    """JSON API over a RAGService; HTTP/1.1 so clients can keep connections open between requests."""
+
+    protocol_version = "HTTP/1.1"
+    service = None
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/health":
+            self._respond(lambda: self.service.health())
+        elif path == "/metrics":
+            self._send(200, tracer.metrics.prometheus_text().encode("utf-8"), "text/plain; version=0.0.4")
+        else:
+            self._send_json(404, {"error": f"Unknown path: {path}"})
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        if path == "/query":
+            self._respond(lambda: self.service.query(self._read_json()))
+        elif path == "/search":
+            self._respond(lambda: self.service.search(self._read_json()))
+        else:
+            self._send_json(404, {"error": f"Unknown path: {path}"})
+
+    def do_DELETE(self):
+        path = urlparse(self.path).path
+        if path.startswith("/sessions/") and len(path) > len("/sessions/"):
+            self._respond(lambda: self.service.reset_session(path[len("/sessions/"):]))
+        else:
+            self._send_json(404, {"error": f"Unknown path: {path}"})
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            raise RequestError("Request body too large", status=413)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            raise RequestError("Request body must be JSON")
+        if not isinstance(body, dict):
+            raise RequestError("Request body must be a JSON object")
+        return body
+
+    def _respond(self, handler):
+        try:
+            self._send_json(200, handler())
+        except RequestError as e:
+            # The unread body would otherwise be parsed as the next request on this connection
+            self.close_connection = True
+            self._send_json(e.status, {"error": str(e)})
+        except Exception as e:
+            print(f"❌ {self.command} {self.path} failed: {e}")
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def _send_json(self, status: int, payload: dict):
+        self._send(status, json.dumps(payload, default=str).encode("utf-8"), "application/json")
+
+    def _send(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def make_server(service: RAGService, host: str = HOST, port: int = PORT) -> ThreadingHTTPServer:
+    handler = type("Handler", (RAGRequestHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(index_path=INDEX_PATH, host: str = HOST, port: int = PORT, workers: int = SERVER_WORKERS,
+          requests_per_minute: int = GEMINI_REQUESTS_PER_MINUTE):
+    """Serve the API; with `workers` > 1 the listening socket is shared by forked worker processes.
+
+    Each worker loads the index after forking. The FAISS index is memory-mapped and the chunks
+    stay in SQLite, so the workers share those pages through the OS page cache instead of
+    holding one copy each. Metrics and chat sessions are per worker; pin a client to one
+    session per connection if it relies on chat history.
+    """
+    if workers > 1 and not hasattr(os, "fork"):
+        print("⚠️ Multiple workers need os.fork (not available on this platform), serving with one process.")
+        workers = 1
+
+    server = make_server(RAGService(index_path, requests_per_minute), host, port)
+    print(f"🌐 Listening on http://{host}:{port} with {workers} worker(s)")
+    children = []
+    for _ in range(workers - 1):
+        pid = os.fork()
+        if pid == 0:
+            children = None
+            break
+        children.append(pid)
+
+    print(f"📦 Worker {os.getpid()} loading index from {index_path}")
+    server.RequestHandlerClass.service.warm_up()
+    print(f"✅ Worker {os.getpid()} ready")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for pid in children or []:
+            try:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP API for the RAG pipeline")
+    parser.add_argument("--index", default=str(INDEX_PATH), help="FAISS index folder")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="Worker processes sharing the socket")
+    parser.add_argument("--rpm", type=int, default=GEMINI_REQUESTS_PER_MINUTE,
+                        help="Max Gemini requests per minute, per worker")
+    args = parser.parse_args()
+
+    serve(args.index, args.host, args.port, args.workers, args.rpm)
@@ -0,0 +1,157 @@
+import os
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from index_registry import get_vector_db
+from metadata_index import get_metadata_index, lookup_docstore_ids, metadata_keys
+from lexical_index import get_lexical_index, reciprocal_rank_fusion, HYBRID_CANDIDATES
+from vector_search import search_ids_batch
+from instrumentation import span
+
+# 📁 Per-company shards live in <index folder>/shards/<COMPANY>/, each a complete index folder
+SHARDS_DIR = "shards"
+
+# 🧵 Shards searched in parallel for cross-company questions
+SHARD_WORKERS = 8
+
+shard_pool = ThreadPoolExecutor(max_workers=SHARD_WORKERS, thread_name_prefix="shard")
+
+
+def shard_key(file_path: Path) -> str:
+    """Shard a transcript belongs to: its company, keyed like the metadata index (ticker, upper case)."""
+    file_path = Path(file_path)
+    return metadata_keys({"filename": file_path.name, "company": file_path.parent.name})[0]
+
+
+def shard_path(index_path, company: str) -> Path:
+    return Path(index_path) / SHARDS_DIR / str(company).upper()
+
+
+def list_shards(index_path) -> dict:
+    """{company: shard folder} for every built shard; empty for a single, unsharded index."""
+    root = Path(index_path) / SHARDS_DIR
+    if not root.is_dir():
+        return {}
+    with os.scandir(root) as it:
+        return {
+            entry.name: Path(entry.path) for entry in sorted(it, key=lambda e: e.name)
+            if entry.is_dir() and os.path.exists(os.path.join(entry.path, "index.faiss"))
+        }
+
+
+def route(index_path, companies=None) -> list:
+    """Index folders to search: the shards of `companies`, or every shard when none is known.
+
+    Companies without a shard are ignored (falling back to every shard if none is left), and
+    an unsharded index folder is returned as is.
+    """
+    shards = list_shards(index_path)
+    if not shards:
+        return [Path(index_path)]
+    if isinstance(companies, str):
+        companies = [companies]
+    wanted = [shards[c] for c in dict.fromkeys(str(c).upper() for c in companies or []) if c in shards]
+    return wanted or list(shards.values())
+
+
+def fan_out(func, shards) -> list:
+    """`func(shard)` for every shard on the shard pool (inline for one shard), results in shard order."""
+    shards = list(shards)
+    if len(shards) == 1:
+        return [func(shards[0])]
+    # Each task runs in a copy of the caller's context, so its spans nest under the current trace
+    futures = [shard_pool.submit(contextvars.copy_context().run, func, shard) for shard in shards]
+    return [future.result() for future in futures]
+
+
+def load_shards(shards) -> list:
+    """Load (or fetch from the registry) the vector store of every shard, in parallel."""
+    return fan_out(get_vector_db, shards)
+
+
+def lookup_candidates(shards, company=None, year=None, quarter=None) -> dict:
+    """{shard: docstore ids} matching the filters, for the shards that hold any; empty without filters."""
+    if not any([company, year, quarter]):
+        return {}
+    candidates = {}
+    for shard in shards:
+        ids = lookup_docstore_ids(get_metadata_index(shard), company, year, quarter)
+        if ids:
+            candidates[shard] = ids
+    return candidates
+
+
+def _search_shard(shard, queries, query_vectors, fetch_k, docstore_ids, hybrid, nprobe, ef_search):
+    with span("shard_search", shard=Path(shard).name, prefiltered=docstore_ids is not None):
+        db = get_vector_db(shard)
+        vector_hits = search_ids_batch(db, query_vectors, fetch_k, docstore_ids=docstore_ids, nprobe=nprobe,
+                                       ef_search=ef_search)
+        lexical_index = get_lexical_index(shard) if hybrid else None
+        lexical_hits = [
+            lexical_index.search(query, k=fetch_k, docstore_ids=docstore_ids) if lexical_index is not None else []
+            for query in queries
+        ]
+        return db, vector_hits, lexical_hits
+
+
+def search_shards(shards, queries, query_vectors, k: int = 10, candidates=None, hybrid: bool = False,
+                  hybrid_candidates: int = HYBRID_CANDIDATES, nprobe: int = None, ef_search: int = None) -> list:
+    """Search several shards for several queries; returns one [(Document, score)] list per query.
+
+    With `candidates` ({shard: docstore ids}) only those shards are searched, each restricted to
+    its ids. Vector hits of all shards are merged by distance (every shard uses the same
+    embedding model and metric); with `hybrid`, BM25 hits are merged by score and fused with
+    them by reciprocal rank fusion, exactly as a single-index hybrid search would.
+    """
+    queries = list(queries)
+    if candidates:
+        shards = [shard for shard in shards if shard in candidates]
+    fetch_k = max(k, hybrid_candidates) if hybrid else k
+    results = fan_out(
+        lambda shard: _search_shard(shard, queries, query_vectors, fetch_k,
+                                    (candidates or {}).get(shard), hybrid, nprobe, ef_search),
+        shards,
+    )
+
+    merged = []
+    for q in range(len(queries)):
+        owners, vector_hits, lexical_hits = {}, [], []
+        for db, shard_vector_hits, shard_lexical_hits in results:
+            for doc_id, score in shard_vector_hits[q]:
+                owners[doc_id] = db
+                vector_hits.append((doc_id, score))
+            for doc_id, score in shard_lexical_hits[q]:
+                owners[doc_id] = db
+                lexical_hits.append((doc_id, score))
+        vector_hits.sort(key=lambda hit: hit[1])
+
+        if hybrid and lexical_hits:
+            # BM25 scores use each shard's own term statistics; close enough to order the fused list
+            lexical_hits.sort(key=lambda hit: hit[1], reverse=True)
+            ranked = reciprocal_rank_fusion([[doc_id for doc_id, _ in vector_hits[:fetch_k]],
+                                             [doc_id for doc_id, _ in lexical_hits[:fetch_k]]])[:k]
+        else:
+            ranked = vector_hits[:k]
+
+        hits = []
+        for doc_id, score in ranked:
+            doc = owners[doc_id].docstore.search(doc_id)
+            # The lexical index may briefly lag a reloaded shard; skip ids its store no longer holds
+            if hasattr(doc, "page_content"):
+                hits.append((doc, score))
+        merged.append(hits)
+    return merged
+
+
+def search(index_path, query: str, query_vector, k: int = 10, company=None, year=None, quarter=None,
+           companies=None, hybrid: bool = False, nprobe: int = None, ef_search: int = None) -> list:
+    """Route one query to its shard(s) and return the merged top-k (Document, score) pairs.
+
+    `companies` overrides the shards searched (e.g. several tickers named in one question);
+    otherwise `company` picks the shard. Filters are pushed into FAISS where the metadata
+    index has matches and ignored otherwise.
+    """
+    shards = route(index_path, companies or company)
+    candidates = lookup_candidates(shards, company, year, quarter)
+    return search_shards(shards, [query], [query_vector], k, candidates, hybrid, nprobe=nprobe,
+                         ef_search=ef_search)[0]
@@ -0,0 +1,55 @@
+from langchain.schema import Document
+import answer_cache
+from answer_cache import AnswerCache, doc_key, normalize_question
+
+FILTERS = ("MSFT", "2020", "Q3")
+CHUNKS = ["MSFT/2020-Jan-29-MSFT.txt#0@abc"]
+
+
+def make_cache(tmp_path, **options):
+    return AnswerCache(tmp_path / "answers.sqlite", **options)
+
+
+def test_exact_hit_ignores_case_spacing_and_punctuation(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put("What was Azure growth?", FILTERS, CHUNKS, "47%")
+    assert cache.get("  what was   azure growth ", FILTERS, CHUNKS) == "47%"
+    assert normalize_question("What was Azure growth?!") == "what was azure growth"
+
+
+def test_paraphrase_hit_needs_a_close_vector_and_the_same_chunks(tmp_path):
+    cache = make_cache(tmp_path, similarity_threshold=0.95)
+    cache.put("What was Azure growth?", FILTERS, CHUNKS, "47%", question_vector=[1.0, 0.0, 0.0])
+
+    assert cache.get("How fast did Azure grow?", FILTERS, CHUNKS, question_vector=[0.99, 0.05, 0.0]) == "47%"
+    assert cache.get("How fast did Azure grow?", FILTERS, CHUNKS, question_vector=[0.0, 1.0, 0.0]) is None
+    assert cache.get("How fast did Azure grow?", FILTERS, ["other@def"], question_vector=[0.99, 0.05, 0.0]) is None
+    assert cache.get("How fast did Azure grow?", ("AAPL", "2020", "Q3"), CHUNKS,
+                     question_vector=[0.99, 0.05, 0.0]) is None
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_expired_answers_are_not_served(tmp_path):
+    cache = make_cache(tmp_path, ttl=-1)
+    cache.put("What was Azure growth?", FILTERS, CHUNKS, "47%")
+    assert cache.get("What was Azure growth?", FILTERS, CHUNKS) is None
+
+
+def test_least_recently_used_answers_are_evicted(tmp_path, monkeypatch):
+    clock = iter(range(1_000_000, 2_000_000))
+    monkeypatch.setattr(answer_cache.time, "time", lambda: next(clock))
+    cache = make_cache(tmp_path, max_entries=2)
+    cache.put("q1", FILTERS, CHUNKS, "Q1")
+    cache.put("q2", FILTERS, CHUNKS, "Q2")
+    assert cache.get("q1", FILTERS, CHUNKS) == "Q1"
+    cache.put("q3", FILTERS, CHUNKS, "Q3")
+    assert cache.get("q2", FILTERS, CHUNKS) is None
+    assert cache.get("q1", FILTERS, CHUNKS) == "Q1"
+    assert cache.stats()["entries"] == 2
+
+
+def test_doc_key_changes_with_the_chunk_text():
+    old = Document(page_content="Azure grew 47%.", metadata={"chunk_id": "MSFT/a.txt#0"})
+    new = Document(page_content="Azure grew 48%.", metadata={"chunk_id": "MSFT/a.txt#0"})
+    assert doc_key(old).startswith("MSFT/a.txt#0@")
+    assert doc_key(old) != doc_key(new)
@@ -0,0 +1,40 @@
+from langchain.schema import HumanMessage, AIMessage
+import conversation_memory
+from conversation_memory import TokenBudgetHistory, group_turns
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        return [float(len(text)), 1.0]
+
+
+def test_group_turns_pairs_questions_with_answers():
+    messages = [HumanMessage(content="q1"), AIMessage(content="a1"), HumanMessage(content="q2")]
+    assert [[m.content for m in turn] for turn in group_turns(messages)] == [["q1", "a1"], ["q2"]]
+
+
+def test_render_keeps_recent_turns_and_summarises_older_ones():
+    messages = []
+    for i in range(6):
+        messages += [HumanMessage(content=f"question {i}"), AIMessage(content=f"answer {i}")]
+    history = TokenBudgetHistory(keep_last_turns=2).render(messages)
+    assert history.splitlines() == [
+        "Earlier in this conversation the user asked about: question 0; question 1; question 2; question 3",
+        "User: question 4", "Assistant: answer 4", "User: question 5", "Assistant: answer 5",
+    ]
+
+
+def test_turn_vectors_are_bounded(monkeypatch):
+    monkeypatch.setattr(conversation_memory, "MAX_CACHED_TURN_VECTORS", 3)
+    embeddings = CountingEmbeddings()
+    history = TokenBudgetHistory(embedding_model=embeddings)
+    for text in ["a", "b", "c", "a", "d"]:
+        history._embed(text)
+    assert len(history._vectors) == 3
+    assert embeddings.calls == 4
+    history._embed("b")
+    assert embeddings.calls == 5
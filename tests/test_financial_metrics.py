@@ -0,0 +1,65 @@
+import pytest
+from financial_metrics import extract_facts, select_facts, metrics_in_question, format_fact
+
+
+def facts_of(text):
+    return [(f["metric"], f["segment"], f["value"]) for f in extract_facts(text)]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Revenue was $36.9 billion.", [("revenue", "", 36.9e9)]),
+    ("Revenue was $36.9 billion, up 14%.", [("revenue_growth", "", 14.0), ("revenue", "", 36.9e9)]),
+    ("Diluted earnings per share was $1.51.", [("eps", "", 1.51)]),
+    ("Gross margin increased 2 points to 67.8%.", [("gross_margin", "", 67.8)]),
+    ("Commercial cloud revenue was $13.3 billion.", [("revenue", "commercial cloud", 13.3e9)]),
+    ("Revenue from Azure grew 59%.", [("revenue_growth", "azure", 59.0)]),
+    ("iPhone revenue was $26.4 billion.", [("revenue", "iphone", 26.4e9)]),
+])
+def test_extracts_reported_figures(text, expected):
+    assert facts_of(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "Cost of revenue was $12.3 billion.",
+    "Unearned revenue was $30 billion.",
+    "Sales and marketing expenses were $4.5 billion.",
+    "We expect revenue of $37 billion to $38 billion next quarter.",
+    "Revenue increased $2.5 billion or 7% driven by Azure.",
+    "Total revenue grew by $3 billion year over year.",
+    "Net income was down $1.2 billion.",
+])
+def test_skips_figures_that_are_not_reported_levels(text):
+    assert [f for f in facts_of(text) if not f[0].endswith("_growth")] == []
+
+
+def test_dollar_change_is_skipped_for_the_level_after_it():
+    assert facts_of("Revenue increased $2.5 billion to $36.9 billion.") == [("revenue", "", 36.9e9)]
+
+
+def mention(value, chunk_index, segment=""):
+    return {"company": "MSFT", "year": "2020", "quarter": "Q3", "metric": "revenue", "segment": segment,
+            "value": value, "unit": "USD", "filename": "2020-Apr-29-MSFT.txt", "chunk_index": chunk_index,
+            "doc_id": f"MSFT/2020-Apr-29-MSFT.txt#{chunk_index}"}
+
+
+def test_select_facts_flags_conflicting_values():
+    facts = select_facts([mention(35e9, 0), mention(3e9, 1), mention(35e9, 2)], "What was Microsoft revenue?")
+    assert [(f["value"], f["mentions"], f["other_values"]) for f in facts] == [(35e9, 2, [3e9])]
+    assert "also stated: $3 billion" in format_fact(facts[0])
+
+
+def test_select_facts_uses_segments_only_when_asked():
+    mentions = [mention(35e9, 0), mention(12e9, 1, segment="azure")]
+    assert [f["segment"] for f in select_facts(mentions, "What was Microsoft revenue?")] == [""]
+    assert [f["segment"] for f in select_facts(mentions, "What was Azure revenue?")] == ["azure"]
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("What was Microsoft's revenue in Q3 2020?", ["revenue"]),
+    ("How much did revenue grow?", ["revenue_growth"]),
+    ("Compare operating margin and gross margin", ["operating_margin", "gross_margin"]),
+    ("What was the cost of revenue?", []),
+    ("How big is the sales force?", []),
+])
+def test_metrics_in_question(question, expected):
+    assert metrics_in_question(question) == expected
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain.schema import Document
+from benchmark_retrieval import HashingEmbeddings
+from chunk_store import CompactDocstore, save_vectorstore, load_vectorstore
+from vector_search import search_ids_by_vector
+
+DIM = 8
+
+
+def make_docs(filename, n, start=0):
+    return {
+        f"MSFT/{filename}#{i}": Document(
+            page_content=f"chunk {i} of {filename}",
+            metadata={"filename": filename, "company": "MSFT", "chunk_index": i, "chunk_id": f"MSFT/{filename}#{i}"},
+        )
+        for i in range(start, start + n)
+    }
+
+
+def test_compact_docstore_delete_and_compact_keep_live_chunks():
+    store = CompactDocstore(make_docs("2020-Jan-29-MSFT.txt", 6))
+    before = store.search("MSFT/2020-Jan-29-MSFT.txt#5")
+
+    store.delete([f"MSFT/2020-Jan-29-MSFT.txt#{i}" for i in range(4)])
+    assert len(store) == 2
+    assert store.search("MSFT/2020-Jan-29-MSFT.txt#0") == "ID MSFT/2020-Jan-29-MSFT.txt#0 not found."
+    # More than half of the buffer was garbage, so the delete compacted it
+    assert len(store._text) == sum(len(d.page_content) for d in (store.search(i) for i in store._rows))
+    after = store.search("MSFT/2020-Jan-29-MSFT.txt#5")
+    assert (after.page_content, after.metadata) == (before.page_content, before.metadata)
+
+    with pytest.raises(ValueError):
+        store.add(make_docs("2020-Jan-29-MSFT.txt", 1, start=4) | make_docs("2020-Jan-29-MSFT.txt", 1, start=5))
+    with pytest.raises(ValueError):
+        store.delete(["MSFT/2020-Jan-29-MSFT.txt#0"])
+
+
+def test_compact_docstore_stores_shared_metadata_once():
+    store = CompactDocstore({**make_docs("2020-Jan-29-MSFT.txt", 5), **make_docs("2020-Apr-29-MSFT.txt", 5)})
+    assert len(store._metas) == 2
+    assert store.search("MSFT/2020-Apr-29-MSFT.txt#3").metadata["chunk_index"] == 3
+
+
+@pytest.mark.parametrize("writable", [False, True])
+def test_deleted_and_added_chunks_survive_save_and_load(tmp_path, writable):
+    rng = np.random.default_rng(1)
+    old, new = make_docs("2020-Jan-29-MSFT.txt", 10), make_docs("2020-Apr-29-MSFT.txt", 4)
+    vectors = {doc_id: rng.random(DIM).tolist() for doc_id in {**old, **new}}
+
+    def embeddings(docs):
+        return [(doc.page_content, vectors[doc_id]) for doc_id, doc in docs.items()]
+
+    db = FAISS.from_embeddings(embeddings(old), HashingEmbeddings(DIM), metadatas=[d.metadata for d in old.values()],
+                               ids=list(old))
+    db.docstore = CompactDocstore(old)
+    stale = list(old)[2:5]
+    db.delete(stale)
+    db.add_embeddings(embeddings(new), metadatas=[d.metadata for d in new.values()], ids=list(new))
+    db.exact_index = None
+    save_vectorstore(db, tmp_path)
+
+    loaded = load_vectorstore(tmp_path, HashingEmbeddings(DIM), writable=writable)
+    assert loaded.index.ntotal == 11
+    assert set(loaded.index_to_docstore_id.values()) == (set(old) - set(stale)) | set(new)
+    for doc_id in list(new) + list(old)[:2] + list(old)[5:]:
+        assert search_ids_by_vector(loaded, np.asarray(vectors[doc_id], dtype="float32"), k=1)[0][0] == doc_id
+        assert loaded.docstore.search(doc_id).page_content == (new | old)[doc_id].page_content
+    for doc_id in stale:
+        hits = search_ids_by_vector(loaded, np.asarray(vectors[doc_id], dtype="float32"), k=11)
+        assert doc_id not in {hit_id for hit_id, _ in hits}
+
+
+def test_build_incremental_adds_changed_and_drops_removed_transcripts(tmp_path, monkeypatch):
+    pytest.importorskip("scripts.clean_chunk_data")
+    import embedding_pipeline
+    import embed_store
+    monkeypatch.setattr(embedding_pipeline, "get_embedding_model", lambda model_name: HashingEmbeddings())
+    base_dir, index_path = tmp_path / "transcripts", tmp_path / "index"
+    (base_dir / "MSFT").mkdir(parents=True)
+    first, second = base_dir / "MSFT" / "2020-Jan-29-MSFT.txt", base_dir / "MSFT" / "2020-Apr-29-MSFT.txt"
+    first.write_text("Revenue was $36.9 billion, up 14%.\n\nCloud revenue grew 39%.", encoding="utf-8")
+    options = {"workers": 1, "verbose": False}
+
+    embed_store.build_incremental(base_dir, index_path, HashingEmbeddings(), options, ingest_workers=1)
+    first_ids = embed_store.load_manifest(index_path)["MSFT/2020-Jan-29-MSFT.txt"]["chunk_ids"]
+
+    second.write_text("Revenue was $35.0 billion, up 15%.", encoding="utf-8")
+    db = embed_store.build_incremental(base_dir, index_path, HashingEmbeddings(), options, ingest_workers=1)
+    manifest = embed_store.load_manifest(index_path)
+    assert set(manifest) == {"MSFT/2020-Jan-29-MSFT.txt", "MSFT/2020-Apr-29-MSFT.txt"}
+    assert db.index.ntotal == len(db.index_to_docstore_id) == sum(len(f["chunk_ids"]) for f in manifest.values())
+
+    first.unlink()
+    db = embed_store.build_incremental(base_dir, index_path, HashingEmbeddings(), options, ingest_workers=1)
+    assert set(embed_store.load_manifest(index_path)) == {"MSFT/2020-Apr-29-MSFT.txt"}
+    assert not set(first_ids) & set(db.index_to_docstore_id.values())
+    assert db.index.ntotal == len(embed_store.load_manifest(index_path)["MSFT/2020-Apr-29-MSFT.txt"]["chunk_ids"])
+    assert embed_store.build_incremental(base_dir, index_path, HashingEmbeddings(), options, ingest_workers=1) is None
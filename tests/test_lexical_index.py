@@ -0,0 +1,44 @@
+import pytest
+from lexical_index import BM25Index, reciprocal_rank_fusion, tokenize, RRF_K
+
+DOC_IDS = ["msft-azure", "msft-office", "aapl-iphone"]
+TEXTS = [
+    "Azure and other cloud services revenue grew 47%.",
+    "Office 365 commercial revenue grew 15% and Microsoft's Dynamics grew 12%.",
+    "iPhone revenue was $26.4 billion in the June quarter.",
+]
+
+
+def test_tokenize_keeps_figures_and_drops_stopwords_and_possessives():
+    assert tokenize("What was Microsoft's revenue of $26.4 and 47%?") == ["microsoft", "revenue", "$26.4", "47%"]
+
+
+def test_bm25_ranks_exact_terms_first():
+    index = BM25Index.from_documents(DOC_IDS, TEXTS)
+    assert [doc_id for doc_id, _ in index.search("azure cloud", k=3)] == ["msft-azure"]
+    assert index.search("iphone", k=3)[0][0] == "aapl-iphone"
+    assert index.search("unrelated words") == []
+
+
+def test_bm25_search_is_restricted_to_docstore_ids():
+    index = BM25Index.from_documents(DOC_IDS, TEXTS)
+    hits = index.search("revenue grew", k=3, docstore_ids=["msft-office", "aapl-iphone"])
+    assert [doc_id for doc_id, _ in hits][0] == "msft-office"
+    assert "msft-azure" not in {doc_id for doc_id, _ in hits}
+
+
+def test_bm25_round_trips_through_its_dict_form():
+    index = BM25Index.from_documents(DOC_IDS, TEXTS)
+    restored = BM25Index.from_dict(index.to_dict())
+    assert restored.search("revenue", k=3) == index.search("revenue", k=3)
+
+
+def test_rrf_rewards_ids_ranked_well_by_both_lists():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "d"]])
+    assert [doc_id for doc_id, _ in fused] == ["b", "c", "a", "d"]
+    assert fused[0][1] == pytest.approx(1 / (RRF_K + 2) + 1 / (RRF_K + 1))
+
+
+def test_rrf_weights_scale_each_ranking():
+    fused = reciprocal_rank_fusion([["a"], ["b"]], weights=[1.0, 2.0])
+    assert [doc_id for doc_id, _ in fused] == ["b", "a"]
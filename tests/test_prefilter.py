@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain.schema import Document
+from ann_index import build_index
+from chunk_store import save_vectorstore, load_vectorstore
+from metadata_index import build_metadata_index, lookup_docstore_ids
+from vector_search import search_ids_batch, search_ids_by_vector
+
+FILENAMES = ["2020-Jan-29-MSFT.txt", "2020-Apr-29-MSFT.txt", "2020-Jul-30-AAPL.txt"]
+DIM = 16
+
+
+class NoEmbeddings:
+    def embed_query(self, text):
+        raise AssertionError("tests search by vector only")
+
+    def embed_documents(self, texts):
+        raise AssertionError("tests search by vector only")
+
+
+@pytest.fixture
+def store():
+    rng = np.random.default_rng(0)
+    vectors = rng.random((30, DIM), dtype="float32")
+    docs = {}
+    for i in range(len(vectors)):
+        filename = FILENAMES[i % len(FILENAMES)]
+        doc_id = f"{filename.split('-')[-1][:-4]}/{filename}#{i}"
+        docs[doc_id] = Document(page_content=f"chunk {i}", metadata={"filename": filename, "chunk_id": doc_id})
+    db = FAISS(embedding_function=NoEmbeddings(), index=build_index("flat", vectors),
+               docstore=InMemoryDocstore(docs), index_to_docstore_id=dict(enumerate(docs)))
+    db.exact_index = None
+    return db, vectors
+
+
+def test_metadata_index_finds_the_chunks_of_one_call(store):
+    db, _ = store
+    index = build_metadata_index(db)
+    ids = lookup_docstore_ids(index, "MSFT", "2020", "Q3")
+    assert ids and all("2020-Jan-29-MSFT.txt" in doc_id for doc_id in ids)
+    assert len(lookup_docstore_ids(index, "MSFT")) == 20
+    assert lookup_docstore_ids(index, "INTC") == []
+
+
+def test_prefiltered_search_only_returns_allowed_ids(store):
+    db, vectors = store
+    allowed = lookup_docstore_ids(build_metadata_index(db), "AAPL")
+    outside = next(pos for pos, doc_id in db.index_to_docstore_id.items() if doc_id not in allowed)
+    hits = search_ids_by_vector(db, vectors[outside], k=5, docstore_ids=allowed)
+    assert len(hits) == 5
+    assert {doc_id for doc_id, _ in hits} <= set(allowed)
+
+
+def test_prefiltered_search_finds_the_exact_match_and_caps_k(store):
+    db, vectors = store
+    allowed = [db.index_to_docstore_id[3], db.index_to_docstore_id[7]]
+    hits = search_ids_batch(db, vectors[[3, 7]], k=10, docstore_ids=allowed)
+    assert [query_hits[0][0] for query_hits in hits] == allowed
+    assert all(len(query_hits) == 2 for query_hits in hits)
+    assert search_ids_batch(db, vectors[[3]], k=5, docstore_ids=["unknown"]) == [[]]
+
+
+@pytest.mark.parametrize("index_type", ["flat", "sq8"])
+def test_prefilter_works_on_a_saved_memory_mapped_index(store, tmp_path, index_type):
+    db, vectors = store
+    db.index = build_index(index_type, vectors)
+    db.exact_index = build_index("flat", vectors) if index_type == "sq8" else None
+    save_vectorstore(db, tmp_path)
+    loaded = load_vectorstore(tmp_path, NoEmbeddings())
+
+    allowed = lookup_docstore_ids(build_metadata_index(db), "MSFT", "2020", "Q4")
+    target = allowed[-1]
+    position = next(pos for pos, doc_id in db.index_to_docstore_id.items() if doc_id == target)
+    hits = search_ids_by_vector(loaded, vectors[position], k=3, docstore_ids=allowed)
+    assert hits[0][0] == target
+    assert {doc_id for doc_id, _ in hits} <= set(allowed)
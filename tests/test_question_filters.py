@@ -0,0 +1,21 @@
+import pytest
+from rag_pipeline_gemini import resolve_filters, companies_in_question
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("What did management say about artificial intelligence demand in 2020?", ((None, "2020", None), [])),
+    ("How did Microsoft describe artificial intelligence in Q1 2020?", (("MSFT", "2020", "Q1"), ["MSFT"])),
+    ("Which companies sell pineapple products?", ((None, None, None), [])),
+    ("What was Microsoft's FY2020 Q3 revenue?", (("MSFT", "2020", "Q3"), ["MSFT"])),
+    ("Compare Apple's and Intel's gross margin in 2021", ((None, "2021", None), ["AAPL", "INTC"])),
+])
+def test_resolve_filters_detects_whole_company_names(question, expected):
+    assert resolve_filters(question) == expected
+
+
+def test_caller_company_wins_over_the_question():
+    assert resolve_filters("How did Apple do in Q2?", company="MSFT") == (("MSFT", None, "Q2"), ["MSFT"])
+
+
+def test_companies_are_listed_in_order_of_mention():
+    assert companies_in_question("Google versus Alphabet versus Nvidia and Amazon") == ["GOOGL", "NVDA", "AMZN"]
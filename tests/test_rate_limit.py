@@ -0,0 +1,65 @@
+import asyncio
+import rate_limit
+from rate_limit import RateLimiter, AsyncRateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(round(seconds, 6))
+        self.now += seconds
+
+
+def test_burst_passes_then_calls_are_spaced_by_the_rate(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(rate_limit.time, "sleep", clock.sleep)
+    limiter = RateLimiter(rate=2, burst=3)
+    for _ in range(5):
+        with limiter:
+            pass
+    assert clock.slept == [0.5, 0.5]
+
+
+def test_tokens_refill_while_idle(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(rate_limit.time, "sleep", clock.sleep)
+    limiter = RateLimiter(rate=1, burst=2)
+    limiter.acquire()
+    limiter.acquire()
+    clock.now += 10
+    limiter.acquire()
+    limiter.acquire()
+    assert clock.slept == []
+
+
+def test_zero_rate_never_waits():
+    limiter = RateLimiter(rate=0)
+    for _ in range(3):
+        limiter.acquire()
+
+
+def test_async_limiter_caps_calls_in_flight():
+    limiter = AsyncRateLimiter(rate=0, concurrency=2)
+    in_flight, peak = 0, 0
+
+    async def call():
+        nonlocal in_flight, peak
+        async with limiter:
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+
+    async def main():
+        await asyncio.gather(*(call() for _ in range(6)))
+
+    asyncio.run(main())
+    assert peak == 2
@@ -0,0 +1,119 @@
+import weakref
+import faiss
+import numpy as np
+from ann_index import search_parameters, RESCORE_FACTOR
+from lexical_index import HYBRID_CANDIDATES, reciprocal_rank_fusion
+
+# 🔁 docstore id → FAISS position maps, one per loaded vector store
+_position_maps = weakref.WeakKeyDictionary()
+
+
+def docstore_positions(vectorstore, docstore_ids) -> np.ndarray:
+    """Translate docstore ids into FAISS row positions (ids missing from the index are skipped)."""
+    id_map = vectorstore.index_to_docstore_id
+    if hasattr(id_map, "positions"):
+        # SQLite-backed map: look the ids up instead of materialising the whole reverse map
+        return np.array(id_map.positions(docstore_ids), dtype="int64")
+    positions = _position_maps.get(vectorstore)
+    if positions is None or len(positions) != len(vectorstore.index_to_docstore_id):
+        positions = {doc_id: pos for pos, doc_id in vectorstore.index_to_docstore_id.items()}
+        _position_maps[vectorstore] = positions
+    return np.array([positions[i] for i in docstore_ids if i in positions], dtype="int64")
+
+
+def rescore(exact_index, vector: np.ndarray, positions: np.ndarray, k: int):
+    """Exact L2 distances for candidate positions, best `k` first, from the full-precision vectors."""
+    exact = exact_index.reconstruct_batch(positions)
+    distances = ((exact - vector) ** 2).sum(axis=1)
+    order = np.argsort(distances)[:k]
+    return distances[order], positions[order]
+
+
+def search_ids_batch(vectorstore, query_vectors, k: int = 10, docstore_ids=None, nprobe: int = None,
+                     ef_search: int = None, rescore_factor: int = RESCORE_FACTOR) -> list:
+    """Search many query vectors in one FAISS call; returns one [(docstore id, score)] list per query.
+
+    `docstore_ids` restricts every query to the same subset. Quantized indexes are searched for
+    `k * rescore_factor` candidates, which are then re-ranked by exact distance
+    (`rescore_factor=1` skips re-scoring).
+    """
+    vectors = np.ascontiguousarray(np.asarray(query_vectors, dtype="float32").reshape(len(query_vectors), -1))
+    if len(vectors) == 0:
+        return []
+    if getattr(vectorstore, "_normalize_L2", False):
+        faiss.normalize_L2(vectors)
+
+    selector = None
+    if docstore_ids is not None:
+        positions = docstore_positions(vectorstore, docstore_ids)
+        if positions.size == 0:
+            return [[] for _ in range(len(vectors))]
+        k = min(k, positions.size)
+        selector = faiss.IDSelectorBatch(positions.size, faiss.swig_ptr(positions))
+    params = search_parameters(vectorstore.index, nprobe=nprobe, ef_search=ef_search, selector=selector)
+
+    exact_index = getattr(vectorstore, "exact_index", None)
+    rescoring = exact_index is not None and rescore_factor > 1
+    fetch_k = k * rescore_factor if rescoring else k
+    if selector is not None:
+        fetch_k = min(fetch_k, positions.size)
+    all_scores, all_indices = vectorstore.index.search(vectors, fetch_k, params=params)
+
+    results = []
+    for vector, scores, indices in zip(vectors, all_scores, all_indices):
+        if rescoring:
+            found = indices != -1
+            scores, indices = rescore(exact_index, vector, indices[found], k)
+        results.append([
+            (vectorstore.index_to_docstore_id[int(pos)], float(score))
+            for score, pos in zip(scores, indices) if pos != -1
+        ])
+    return results
+
+
+def search_ids_by_vector(vectorstore, query_vector, k: int = 10, docstore_ids=None, nprobe: int = None,
+                         ef_search: int = None, rescore_factor: int = RESCORE_FACTOR):
+    """Like `search_by_vector`, but returns (docstore id, score) pairs without loading the documents."""
+    return search_ids_batch(vectorstore, [query_vector], k, docstore_ids, nprobe, ef_search, rescore_factor)[0]
+
+
+def search_by_vector(vectorstore, query_vector, k: int = 10, docstore_ids=None, nprobe: int = None,
+                     ef_search: int = None):
+    """Search a LangChain FAISS store directly, optionally restricted to a subset of documents.
+
+    When `docstore_ids` is given the restriction is pushed into FAISS with an ID selector, so
+    only those vectors are scored instead of the whole corpus. `nprobe` (IVF) and `ef_search`
+    (HNSW) override the index defaults for this query only. Returns (Document, score) pairs.
+    """
+    hits = search_ids_by_vector(vectorstore, query_vector, k, docstore_ids, nprobe, ef_search)
+    return [(vectorstore.docstore.search(doc_id), score) for doc_id, score in hits]
+
+
+def hybrid_search(vectorstore, lexical_index, query: str, query_vector, k: int = 10, docstore_ids=None,
+                  candidates: int = HYBRID_CANDIDATES, nprobe: int = None, ef_search: int = None):
+    """Fuse FAISS and BM25 results with reciprocal rank fusion; returns (Document, fused score) pairs.
+
+    Falls back to plain vector search when the index was built without a lexical index.
+    """
+    if lexical_index is None:
+        return search_by_vector(vectorstore, query_vector, k=k, docstore_ids=docstore_ids, nprobe=nprobe,
+                                ef_search=ef_search)
+
+    candidates = max(k, candidates)
+    vector_hits = search_ids_by_vector(vectorstore, query_vector, candidates, docstore_ids, nprobe, ef_search)
+    return fuse_results(vectorstore, lexical_index, query, vector_hits, k, docstore_ids, candidates)
+
+
+def fuse_results(vectorstore, lexical_index, query: str, vector_hits, k: int, docstore_ids=None,
+                 candidates: int = HYBRID_CANDIDATES) -> list:
+    """RRF-merge vector hits with BM25 hits for `query`; returns (Document, fused score) pairs."""
+    vector_ranking = [doc_id for doc_id, _ in vector_hits]
+    lexical_ranking = [doc_id for doc_id, _ in lexical_index.search(query, k=candidates, docstore_ids=docstore_ids)]
+
+    results = []
+    for doc_id, score in reciprocal_rank_fusion([vector_ranking, lexical_ranking])[:k]:
+        doc = vectorstore.docstore.search(doc_id)
+        # The lexical index may briefly lag a reloaded FAISS store; skip ids it no longer holds
+        if hasattr(doc, "page_content"):
+            results.append((doc, score))
+    return results